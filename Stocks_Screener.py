@@ -1,15 +1,23 @@
 import streamlit as st
-from data_loader import load_stocks_and_scores_data
-from scoring_functions import load_scores
-from matplotlib.colors import LinearSegmentedColormap
+from data_loader import load_stocks_and_scores_data, order_score_columns
+from scoring_functions import load_scores, split_scores, scored_metrics
+from incremental_scoring import build_score_state, update_score_state
+from quote_refresh import refresh_quotes, QUOTE_COLUMNS
+from derived_metrics import load_derived_metrics, derived_metrics_config, add_derived_metrics
+from snapshot import dataset_version, build_snapshot, save_snapshot, load_snapshot
+from table_views import new_table_cache, paginated_table, score_styles, get_cached
+from filter_engine import compile_filter, evaluate_filter, text_columns
+from result_cache import cached_result, put_result, cache_stats, metrics_hash
+from snapshot_diff import diff_snapshots, load_alert_rules, append_change_log, CHANGE_LOG_FILE, ALERT_RULES_FILE
 import pandas as pd 
+from search_index import search
 import copy 
 import json 
+import os
 
 # To do: 
 
 # -> Get date of stocks file, and print it as " Last updated:"
-# -> Search stock in datasets: either by name, or by Ticker
 # -> Add ranking column to better understand when filtering x
 # -> print progress when update data
 # -> other pages 
@@ -18,7 +26,12 @@ import json
 
 stocks_file_name = "./data/stocks_universe.csv"
 scores_file_name = "./data/stocks_scores.csv"
+snapshot_file_name = "./data/snapshot.pkl"
+checkpoint_dir = "./data/crawl"
+price_store_dir = "./data/prices"
 metrics_config_file_name = "./metrics_config/default_metrics.json"
+derived_metrics_file_name = "./metrics_config/derived_metrics.json"
+result_cache_dir = "./data/score_cache"
 
 st.set_page_config(
     page_title="Customizable Stock Screener",
@@ -34,6 +47,7 @@ with st.sidebar:
         st.page_link("pages/2_Best_Stocks_Sector.py", label="Best Stocks By Sector")
         st.page_link("pages/3_Stock_Details.py", label="Stock Details")
         st.page_link("pages/4_Comparison.py", label="Stocks Comparison")
+        st.page_link("pages/5_Changes.py", label="Changes & Alerts")
 
 st.title("Stocks Screener")
 
@@ -49,6 +63,19 @@ except Exception as e:
     tickers = ['AAPL', 'GOOGL', 'BRK.B', 'NVDA', 'NFLX', 'V', 'AMZN']
     
 ### LOAD METRICS
+# Metrics computed from other columns (see derived_metrics.py): scored like the crawled ones
+derived_metrics = load_derived_metrics(derived_metrics_file_name)
+
+def add_derived_metrics_config(metrics):
+    for metric, config in derived_metrics_config(derived_metrics).items():
+        metrics.setdefault(metric, config)
+    return metrics
+
+def default_metrics():
+    # The configuration of the shared scores (scores file and snapshot), whatever the session uses
+    with open(metrics_config_file_name, "r") as f: 
+        return add_derived_metrics_config(json.load(f))
+
 def reset_configuration():
     # Reset metrics to their default values
     st.session_state.metrics = copy.deepcopy(st.session_state.metrics_default)
@@ -58,13 +85,8 @@ def reset_configuration():
         st.session_state[f"{metric}_penalize_negative"] = "True" if config["penalize_negative"] else "False"
         st.session_state[f"{metric}_weight"] = config["weight"]
         
-with open(metrics_config_file_name, "r") as f: 
-    metrics = json.load(f)
-
 if "metrics" not in st.session_state:
-    with open(metrics_config_file_name, "r") as f: 
-        metrics = json.load(f)
-    st.session_state.metrics = metrics 
+    st.session_state.metrics = default_metrics()
     st.session_state.metrics_default = copy.deepcopy(st.session_state.metrics)
 else:
     # If the metrics are already loaded and session_state.reset_metrics is False, do not reset
@@ -73,46 +95,172 @@ else:
 st.session_state.reset_metrics = False  
     
 ### LOAD DATASETS 
+def current_version():
+    # The derived metrics definitions are part of the dataset: changing them invalidates the snapshot
+    return dataset_version(*[f for f in [stocks_file_name, scores_file_name, derived_metrics_file_name] if os.path.exists(f)])
+
+def update_snapshot(stocks_df, global_scores_df, sector_scores_df, metrics):
+    # metrics: the configuration the scores were computed with. Also runs inside load_all_data (cached
+    # for all the sessions): it must not depend on the session state
+    global_scores_df, sector_scores_df = order_score_columns(global_scores_df, sector_scores_df)
+    snapshot = build_snapshot(
+        current_version(), stocks_df, global_scores_df, sector_scores_df, metrics
+    )
+    # Log what changed since the previous dataset version: the saved one, shared by all the sessions
+    previous = load_snapshot(snapshot_file_name)
+    if previous is not None and previous['version'] != snapshot['version']:
+        try:
+            # Scored with another configuration: rescore the previous stocks, so that only the changes of the data are logged
+            if previous.get('metrics_hash') != snapshot['metrics_hash']:
+                previous_scores = load_scores(previous['stocks_df'], metrics, return_merged=False)
+                previous = {**previous, 'global_scores_df': previous_scores[0], 'sector_scores_df': previous_scores[1]}
+            append_change_log(diff_snapshots(previous, snapshot, load_alert_rules(ALERT_RULES_FILE)), CHANGE_LOG_FILE)
+        except Exception as e:
+            print(f"Could not log the changes: {e}")
+    save_snapshot(snapshot, snapshot_file_name)
+    return snapshot
+
 @st.cache_data 
 def load_all_data():
+    # The shared snapshot, scored with the default configuration: the sessions with their own
+    # configuration get their scores from the result cache (see reload_scores)
+    metrics = default_metrics()
+    # Fast path: the snapshot already holds the parsed frames and the precomputed views
+    try:
+        snapshot = load_snapshot(snapshot_file_name, current_version())
+        if snapshot is not None:
+            return snapshot
+    except Exception as e:
+        print(f"Snapshot not available: {e}")
+    
     try: 
         stocks_df,global_scores_df,sector_scores_df = load_stocks_and_scores_data(
-            metrics=st.session_state.metrics,
+            metrics=metrics,
             tickers=tickers,
             stocks_from_file=stocks_file_name,  
             scores_from_file=scores_file_name,
             stocks_to_file=None,
             scores_to_file=None,
-            merge_scores=False
+            merge_scores=False,
+            derived_metrics=derived_metrics
         )
+        # Scores saved with other scored metrics (e.g. before a derived metric was added or its weight
+        # changed to or from 0): score them again
+        scored = {f"{m}_Score" for m, _ in scored_metrics(stocks_df, metrics)}
+        if scored != {c for c in global_scores_df.columns if c.endswith('_Score') and c != 'Overall_Score'}:
+            global_scores_df,sector_scores_df = load_scores(
+                stocks_df, metrics, from_file=None, to_file=scores_file_name, return_merged=False
+            )
     except Exception as e: 
         stocks_df,global_scores_df,sector_scores_df = load_stocks_and_scores_data(
-            metrics=st.session_state.metrics,
+            metrics=metrics,
             tickers=tickers,
             stocks_from_file=None,  
             scores_from_file=None,
             stocks_to_file=stocks_file_name,
             scores_to_file=scores_file_name,
-            merge_scores=False
+            merge_scores=False,
+            checkpoint_dir=checkpoint_dir,
+            derived_metrics=derived_metrics,
+            price_store_dir=price_store_dir
         )   
     
-    global_scores_df = global_scores_df.loc[:,['Sector','Overall_Score'] + list(global_scores_df.columns[:-2])]
-    sector_scores_df = sector_scores_df.loc[:,['Sector','Sector_Score'] + list(sector_scores_df.columns[:-2])]
+    return update_snapshot(stocks_df, global_scores_df, sector_scores_df, metrics)
 
-    return stocks_df, global_scores_df, sector_scores_df
-
-with st.spinner("Loading data...Please wait."):
-    datasets = load_all_data()
+if "snapshot" not in st.session_state:
+    with st.spinner("Loading data...Please wait."):
+        st.session_state.snapshot = load_all_data()
+    # The saved scores are shared with the sessions recalculating them with the default configuration
+    if st.session_state.snapshot.get('metrics_hash') == metrics_hash(default_metrics()):
+        put_result(
+            st.session_state.snapshot['version'], default_metrics(),
+            (st.session_state.snapshot['global_scores_df'], st.session_state.snapshot['sector_scores_df'])
+        )
+    # Set once per snapshot: after a recalculation of the scores the Comparison and Stock Details
+    # pages rebuild them
+    st.session_state.row_store = st.session_state.snapshot['row_store']
+    st.session_state.attribution = st.session_state.snapshot['attribution']
     
-for i, key in enumerate(['stocks_df', 'global_scores_df', 'sector_scores_df']):
+for key in ['stocks_df', 'global_scores_df', 'sector_scores_df']:
     if key not in st.session_state:
-        st.session_state[key] = datasets[i]
+        st.session_state[key] = st.session_state.snapshot[key]
+
+# Sorted indexes and rendered pages of the tables; reset whenever the frames change
+if "table_cache" not in st.session_state:
+    st.session_state.table_cache = new_table_cache(st.session_state.snapshot['indexes'])
                 
 ### VISUALIZE STOCKS 
 
-red_to_green = LinearSegmentedColormap.from_list('redgreen', ['red', 'green'])
 st.subheader("Stocks Data")
-st.dataframe(st.session_state.stocks_df.style.format({col: "{:,.2f}" for col in st.session_state.stocks_df.select_dtypes(include='number').columns}))
+search_query = st.text_input("Search stock by ticker, company, industry or sector", key="search_query")
+if search_query:
+    matches = search(st.session_state.snapshot['search_index'], search_query, limit=10)
+    if matches:
+        st.dataframe(st.session_state.stocks_df.loc[matches, ['Company', 'Sector', 'Industry', 'Price', 'Market Cap']])
+        col_1d, col_2d, _ = st.columns((3, 2, 7))
+        with col_1d:
+            details_ticker = st.selectbox("Stock", matches, label_visibility="collapsed", key="search_ticker")
+        with col_2d:
+            if st.button("Show details"):
+                st.session_state.details_ticker = details_ticker
+                st.switch_page("pages/3_Stock_Details.py")
+    else:
+        st.write("No stocks found.")
+
+col_1s,col_2s,col_3s,col_4s = st.columns(4)
+with col_1s:
+    n_stocks = st.number_input("Visualize n stocks", 1, len(st.session_state.stocks_df), 15, key="n_stocks")
+with col_2s:
+    sectors_to_view_0 = st.multiselect("Sectors_A", st.session_state.stocks_df['Sector'].dropna().unique().tolist() + ['All'], default='All')
+with col_3s:
+    stocks_sort_column = st.selectbox("Sort by", ['-'] + list(st.session_state.stocks_df.columns), key="stocks_sort_column")
+with col_4s:
+    stocks_sort_order = st.selectbox("Order", ("Descending", "Ascending"), key="stocks_sort_order")
+
+if len(sectors_to_view_0) == 0 or 'All' in sectors_to_view_0:
+    sectors_to_view_0 = ['All']
+
+### FILTER STOCKS
+stocks_filter = st.text_input(
+    "Filter (applies to all tables)", 
+    key="stocks_filter",
+    placeholder="e.g. P/E < 15 AND ROE > 0.15 AND Sector in {Technology, Healthcare}",
+    help="Compare columns with <, <=, >, >=, =, != or IN {...}, combine conditions with AND, OR, NOT and parentheses. "
+         "Numbers accept the suffixes %, K, M, B. Column names can be quoted with backticks."
+)
+compiled_filter = None
+if stocks_filter.strip():
+    try:
+        compiled_filter = compile_filter(
+            stocks_filter, st.session_state.stocks_df.columns, text_columns(st.session_state.stocks_df)
+        )
+        # Evaluated here, so that an error shows up once instead of breaking the tables (the mask is
+        # cached in the filter index for them)
+        evaluate_filter(compiled_filter, st.session_state.stocks_df, st.session_state.snapshot['filter_index'])
+    except ValueError as e:
+        compiled_filter = None
+        st.error(f"Invalid filter: {e}")
+
+def get_filter_mask(table, df):
+    # Rows of df matching the filter; the score tables are aligned to the stocks through the Ticker index
+    if compiled_filter is None:
+        return None
+    def compute_mask():
+        mask = evaluate_filter(compiled_filter, st.session_state.stocks_df, st.session_state.snapshot['filter_index'])
+        if df.index.equals(st.session_state.stocks_df.index):
+            return mask
+        return pd.Series(mask, index=st.session_state.stocks_df.index).reindex(df.index, fill_value=False).to_numpy()
+    return get_cached(st.session_state.table_cache, (table, 'filter', compiled_filter), compute_mask)
+
+paginated_table(
+    st.session_state.stocks_df, 'stocks', st.session_state.table_cache,
+    sort_column=None if stocks_sort_column == '-' else stocks_sort_column,
+    ascending=stocks_sort_order == "Ascending",
+    selection=sectors_to_view_0,
+    page_size=n_stocks,
+    row_mask=get_filter_mask('stocks', st.session_state.stocks_df),
+    mask_key=compiled_filter
+)
 
 ### VISUALIZE SCORES OPTIONS
 # Render the scoring configuration
@@ -170,21 +318,15 @@ with col_1:
 with col_2:
     sectors_to_view = st.multiselect("Sectors", st.session_state.global_scores_df['Sector'].unique().tolist() + ['All'], default='All')
     
-if len(sectors_to_view) == 0:
-    sectors_to_view = ['All']
-    
-if 'All' in sectors_to_view:
+if len(sectors_to_view) == 0 or 'All' in sectors_to_view:
     sectors_to_view = ['All']
-    df_to_view = st.session_state.global_scores_df
-    df_to_view = df_to_view.dropna(axis=1,how='all')
-else: 
-    df_to_view = st.session_state.global_scores_df.loc[st.session_state.global_scores_df['Sector'].isin(sectors_to_view)]
-    df_to_view = df_to_view.dropna(axis=1,how='all')
 
-st.dataframe(df_to_view.sort_values('Overall_Score', ascending=False).iloc[:n_scores].\
-    style.background_gradient(cmap=red_to_green, axis=0, vmin=0, vmax=100).format(
-    {col: "{:,.2f}" for col in st.session_state.global_scores_df.select_dtypes(include='number').columns}
-))
+paginated_table(
+    st.session_state.global_scores_df, 'global_scores', st.session_state.table_cache,
+    sort_column='Overall_Score', selection=sectors_to_view, page_size=n_scores, styles=score_styles,
+    row_mask=get_filter_mask('global_scores', st.session_state.global_scores_df),
+    mask_key=compiled_filter
+)
 
 st.subheader("Scores Data By Sector")
 
@@ -194,34 +336,50 @@ with col_1a:
 with col_2b:
     sectors_to_view_2 = st.multiselect("Sectors_B", st.session_state.sector_scores_df['Sector'].unique().tolist() + ['All'], default='All')
 
-if len(sectors_to_view_2) == 0:
+if len(sectors_to_view_2) == 0 or 'All' in sectors_to_view_2:
     sectors_to_view_2 = ['All']
 
-if 'All' in sectors_to_view_2:
-    sectors_to_view_2 = ['All']
-    df_2_to_view = st.session_state.sector_scores_df
-    df_2_to_view = df_2_to_view.dropna(axis=1,how='all')
-else:    
-    df_2_to_view = st.session_state.sector_scores_df.loc[st.session_state.sector_scores_df['Sector'].isin(sectors_to_view_2)]
-    df_2_to_view = df_2_to_view.dropna(axis=1,how='all')
-
-st.dataframe(df_2_to_view.sort_values('Sector_Score', ascending=False).iloc[:n_sector_scores].\
-    style.background_gradient(cmap=red_to_green, axis=0, vmin=0, vmax=100).format(
-    {col: "{:,.2f}" for col in st.session_state.sector_scores_df.select_dtypes(include='number').columns}
-))
+paginated_table(
+    st.session_state.sector_scores_df, 'sector_scores', st.session_state.table_cache,
+    sort_column='Sector_Score', selection=sectors_to_view_2, page_size=n_sector_scores, styles=score_styles,
+    row_mask=get_filter_mask('sector_scores', st.session_state.sector_scores_df),
+    mask_key=compiled_filter
+)
 
 ### SIDEBAR
+def use_snapshot(snapshot):
+    st.session_state.snapshot = snapshot
+    st.session_state.table_cache = new_table_cache(snapshot['indexes'])
+    st.session_state.stocks_df = snapshot['stocks_df']
+    st.session_state.global_scores_df = snapshot['global_scores_df']
+    st.session_state.sector_scores_df = snapshot['sector_scores_df']
+    st.session_state.row_store = snapshot['row_store']
+    st.session_state.attribution = snapshot['attribution']
+
+def use_session_scores():
+    # The shared snapshot is scored with the default configuration: a session with its own scores it again
+    if metrics_hash(st.session_state.metrics) != st.session_state.snapshot.get('metrics_hash'):
+        st.session_state.global_scores_df, st.session_state.sector_scores_df = reload_scores()
+        st.session_state.table_cache = new_table_cache({'stocks': st.session_state.snapshot['indexes']['stocks']})
+        st.session_state.pop('row_store', None)
+        st.session_state.pop('attribution', None)
+
 def reload_scores(): 
-    global_scores_df,sector_scores_df = load_scores(
-        df = st.session_state.stocks_df, 
-        metrics = st.session_state.metrics, 
-        from_file=None, 
-        to_file= scores_file_name,
-        return_merged=False
+    # Scores of the current dataset version with this configuration, computed once per process (and
+    # kept on disk): the shared scores file is not rewritten by the sessions recalculating their scores
+    metrics = copy.deepcopy(st.session_state.metrics)
+    global_scores_df,sector_scores_df = cached_result(
+        st.session_state.snapshot['version'], metrics,
+        lambda: order_score_columns(*load_scores(
+            df = st.session_state.stocks_df, 
+            metrics = metrics, 
+            from_file=None, 
+            to_file=None,
+            return_merged=False
+        )),
+        cache_dir=result_cache_dir
     )
-    global_scores_df = global_scores_df.loc[:,['Sector','Overall_Score'] + list(global_scores_df.columns[:-2])]
-    sector_scores_df = sector_scores_df.loc[:,['Sector','Sector_Score'] + list(sector_scores_df.columns[:-2])]
-    return global_scores_df,sector_scores_df
+    return global_scores_df, sector_scores_df
     
 
 with st.sidebar:    
@@ -231,6 +389,15 @@ with st.sidebar:
             
         for i, key in enumerate(['global_scores_df', 'sector_scores_df']):
             st.session_state[key] = datasets[i]
+        # The stocks did not change, so their index is still valid
+        st.session_state.table_cache = new_table_cache({'stocks': st.session_state.snapshot['indexes']['stocks']})
+        # The comparison store and the attribution hold the old percentiles: their pages rebuild them
+        st.session_state.pop('row_store', None)
+        st.session_state.pop('attribution', None)
+        st.session_state.pop('score_state', None)
+        st.rerun()
+    stats = cache_stats()
+    st.caption(f"Scores cache: {stats['size']} configurations, {stats['hit_rate']:.0%} hit rate")
     
     config_file_name = st.text_input("Configuration File Name", "my_configuration")
     if st.button("Save configuration"):
@@ -241,7 +408,7 @@ with st.sidebar:
     config_raw = st.file_uploader("Choose a configuration file", type="json")
     if st.button("Load configuration"):
         if config_raw is not None:
-            new_metrics = json.load(config_raw)
+            new_metrics = add_derived_metrics_config(json.load(config_raw))
             st.session_state.metrics_default = copy.deepcopy(new_metrics)
             st.session_state.reset_metrics = True 
             st.rerun()
@@ -250,20 +417,45 @@ with st.sidebar:
         else: 
             st.error("Please upload a configuration file.")
             
+    if st.button("Refresh quotes", help="Refreshes the prices and the price-dependent metrics only"):
+        with st.spinner("Refreshing quotes...Please wait."):
+            stocks_df = add_derived_metrics(refresh_quotes(st.session_state.stocks_df, store_dir=price_store_dir), derived_metrics)
+            # The shared files are scored with the default configuration, not with this session's
+            metrics = default_metrics()
+            # Sorted values of the current scores, kept between refreshes: only the metrics that changed are re-ranked
+            if "score_state" not in st.session_state or \
+                    st.session_state.score_state['metrics'] != scored_metrics(st.session_state.stocks_df, metrics):
+                st.session_state.score_state = build_score_state(st.session_state.stocks_df, metrics)
+            changed_columns = [c for c in QUOTE_COLUMNS + list(derived_metrics) if c in stocks_df.columns]
+            update_score_state(st.session_state.score_state, stocks_df.loc[:, changed_columns])
+            
+            stocks_df.reset_index().to_csv(stocks_file_name, index=False)
+            st.session_state.score_state['scores'].to_csv(scores_file_name)
+            global_scores_df, sector_scores_df = split_scores(st.session_state.score_state['scores'])
+            snapshot = update_snapshot(stocks_df, global_scores_df, sector_scores_df, metrics)
+            load_all_data.clear()
+            use_snapshot(snapshot)
+            use_session_scores()
+        st.rerun()
+            
     if st.button("Update data"): 
+        metrics = default_metrics()
         stocks_df,global_scores_df,sector_scores_df = load_stocks_and_scores_data(
-            metrics=st.session_state.metrics,
+            metrics=metrics,
             tickers=tickers,
             stocks_from_file=None,  
             scores_from_file=None,
             stocks_to_file=stocks_file_name,
             scores_to_file=scores_file_name,
-            merge_scores=False
+            merge_scores=False,
+            checkpoint_dir=checkpoint_dir,
+            derived_metrics=derived_metrics,
+            price_store_dir=price_store_dir
         )   
         
-        global_scores_df = global_scores_df.loc[:,['Sector','Overall_Score'] + list(global_scores_df.columns[:-2])]
-        sector_scores_df = sector_scores_df.loc[:,['Sector','Sector_Score'] + list(sector_scores_df.columns[:-2])]
-        
-        st.session_state.stocks_df = stocks_df
-        st.session_state.global_scores_df = global_scores_df
-        st.session_state.sector_scores_df = sector_scores_df
\ No newline at end of file
+        snapshot = update_snapshot(stocks_df, global_scores_df, sector_scores_df, metrics)
+        load_all_data.clear()
+        st.session_state.pop('score_state', None)
+        use_snapshot(snapshot)
+        use_session_scores()
+        st.rerun()
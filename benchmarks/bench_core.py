@@ -0,0 +1,102 @@
+"""
+Benchmarks the data pipeline on synthetic universes of several sizes: ingestion (load_data against
+recorded yfinance responses), scoring (calculate_scores, calculate_sector_scores), the scores CSV
+I/O of load_scores and the rendering of a table page. Time and peak memory are recorded per commit
+in benchmarks/results/core.jsonl (compare commits with benchmarks/compare.py).
+
+Usage: python benchmarks/bench_core.py [--stocks 500 2000 10000] [--crawl 50 200] [--repeat 5]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.harness import measure
+from benchmarks.results import record_results
+from benchmarks.synthetic import make_universe
+
+METRICS_CONFIG_FILE = os.path.join(ROOT, 'metrics_config', 'default_metrics.json')
+
+
+def bench_ingestion(n_stocks, repeat):
+    import data_functions
+    from benchmarks.fake_yfinance import synthetic_responses, fake_yfinance
+
+    universe = make_universe(n_stocks, seed=1)
+    tickers = universe['Ticker'].tolist()
+    responses = synthetic_responses(universe, seed=1)
+    sleep, data_functions.TIME_SLEEP = data_functions.TIME_SLEEP, 0
+    results = {}
+    try:
+        # get_stock_data prints its progress and the missing data warnings
+        with fake_yfinance(responses), contextlib.redirect_stdout(io.StringIO()):
+            results['load_data'] = measure(lambda: data_functions.load_data(tickers, to_file=None), repeat)
+            with tempfile.TemporaryDirectory() as directory:
+                checkpoint_dir = os.path.join(directory, 'crawl')
+                results['load_data_checkpointed'] = measure(
+                    lambda: data_functions.load_data(tickers, to_file=None, checkpoint_dir=checkpoint_dir), repeat
+                )
+    finally:
+        data_functions.TIME_SLEEP = sleep
+    return results
+
+
+def bench_scoring(df, metrics, repeat):
+    from scoring_functions import calculate_scores, calculate_sector_scores, load_scores
+
+    results = {
+        'calculate_scores': measure(lambda: calculate_scores(df, metrics), repeat),
+        'calculate_sector_scores': measure(lambda: calculate_sector_scores(df, metrics), repeat),
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        scores_file = os.path.join(directory, 'scores.csv')
+        results['load_scores_write_csv'] = measure(lambda: load_scores(df, metrics, to_file=scores_file), repeat)
+        results['load_scores_read_csv'] = measure(lambda: load_scores(df, metrics, from_file=scores_file, return_merged=False), repeat)
+    return results
+
+
+def bench_rendering(df, metrics, repeat, page_size=15):
+    from data_loader import order_score_columns
+    from scoring_functions import load_scores
+    from table_views import build_sorted_index, select_rows, style_table, score_styles
+
+    global_scores_df, sector_scores_df = order_score_columns(*load_scores(df, metrics, return_merged=False))
+    index = build_sorted_index(global_scores_df, 'Overall_Score')
+
+    def render_page():
+        positions, columns = select_rows(index, ['Technology', 'Healthcare'])
+        page_df = global_scores_df.iloc[positions[:page_size]].loc[:, columns]
+        return style_table(page_df, score_styles(page_df)).to_html()
+
+    return {
+        'build_sorted_index': measure(lambda: build_sorted_index(global_scores_df, 'Overall_Score'), repeat),
+        'render_page': measure(render_page, repeat),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stocks', type=int, nargs='+', default=[500, 2000, 10000])
+    parser.add_argument('--crawl', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with open(METRICS_CONFIG_FILE) as f:
+        metrics = json.load(f)
+
+    results = {}
+    for n_stocks in args.crawl:
+        results[f'ingestion_{n_stocks}'] = bench_ingestion(n_stocks, args.repeat)
+    for n_stocks in args.stocks:
+        df = make_universe(n_stocks, seed=0).set_index('Ticker')
+        results[f'scoring_{n_stocks}'] = bench_scoring(df, metrics, args.repeat)
+        results[f'rendering_{n_stocks}'] = bench_rendering(df, metrics, args.repeat)
+
+    entry = record_results('core', results)
+    print(json.dumps(entry, indent=2))
@@ -0,0 +1,88 @@
+"""
+Measures the cold start of Stocks_Screener.py: import time of the modules loaded before the first
+render, and time to first paint with and without a snapshot.
+
+Usage: python benchmarks/bench_startup.py [--stocks 500 2000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.results import record_results
+
+APP_MODULES = ['data_loader', 'scoring_functions', 'snapshot', 'table_views']
+HEAVY_MODULES = ['yfinance', 'scipy', 'matplotlib', 'data_functions']
+
+IMPORT_CODE = f"""
+import json, sys, time
+import streamlit
+t = time.perf_counter()
+for module in {APP_MODULES!r}:
+    __import__(module)
+elapsed = time.perf_counter() - t
+print(json.dumps({{'seconds': elapsed, 'heavy_loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+PAINT_CODE = """
+import json, os, sys, time
+from streamlit.testing.v1 import AppTest
+os.chdir(sys.argv[1])
+t = time.perf_counter()
+at = AppTest.from_file(sys.argv[2], default_timeout=600).run()
+elapsed = time.perf_counter() - t
+assert not at.exception, at.exception
+print(json.dumps({'seconds': elapsed}))
+"""
+
+
+def _run_child(code, *args):
+    out = subprocess.run([sys.executable, '-c', code, *args], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def bench_imports(repeat):
+    runs = [_run_child(IMPORT_CODE) for _ in range(repeat)]
+    return {
+        'import_seconds_median': statistics.median(r['seconds'] for r in runs),
+        'heavy_modules_loaded': runs[0]['heavy_loaded'],
+    }
+
+
+def bench_first_paint(n_stocks, repeat):
+    from benchmarks.synthetic import write_dataset
+
+    app_file = os.path.join(ROOT, 'Stocks_Screener.py')
+    with tempfile.TemporaryDirectory() as directory:
+        write_dataset(directory, n_stocks)
+        snapshot_file = os.path.join(directory, 'data', 'snapshot.pkl')
+        cold, warm = [], []
+        for _ in range(repeat):
+            if os.path.exists(snapshot_file):
+                os.remove(snapshot_file)
+            cold.append(_run_child(PAINT_CODE, directory, app_file)['seconds'])
+            warm.append(_run_child(PAINT_CODE, directory, app_file)['seconds'])
+    return {
+        'first_paint_no_snapshot_seconds_median': statistics.median(cold),
+        'first_paint_snapshot_seconds_median': statistics.median(warm),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stocks', type=int, nargs='+', default=[500, 2000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = bench_imports(args.repeat)
+    for n_stocks in args.stocks:
+        results[str(n_stocks)] = bench_first_paint(n_stocks, args.repeat)
+
+    entry = record_results('startup', results)
+    print(json.dumps(entry, indent=2))
@@ -0,0 +1,78 @@
+"""
+Compares the recorded results of a benchmark between two commits and flags the regressions.
+
+Usage: python benchmarks/compare.py core [--base abc1234] [--head def5678] [--threshold 1.2]
+
+By default the last run is compared with the last run of another commit. Exits with status 1
+if a time or memory measure regressed by more than the threshold ratio.
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.results import load_results
+
+COMPARED_MEASURES = ('seconds_median', 'peak_memory_mb')
+
+
+def flatten(results, prefix=''):
+    values = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}/"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[prefix + key] = value
+    return values
+
+
+def find_run(entries, commit=None, exclude=None):
+    for entry in reversed(entries):
+        if commit is not None and not entry['commit'].startswith(commit):
+            continue
+        if exclude is not None and entry['commit'] == exclude:
+            continue
+        return entry
+    return None
+
+
+def compare(base, head, threshold):
+    """
+    Returns the rows (measure, base value, head value, ratio, regressed) of the measures present in both runs.
+    """
+    base_values, head_values = flatten(base['results']), flatten(head['results'])
+    rows = []
+    for key in sorted(set(base_values) & set(head_values)):
+        if not key.endswith(COMPARED_MEASURES):
+            continue
+        ratio = head_values[key] / base_values[key] if base_values[key] else float('inf')
+        rows.append((key, base_values[key], head_values[key], ratio, ratio > threshold))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmark', help="Name of the results file, e.g. 'core' or 'startup'")
+    parser.add_argument('--base', help="Commit of the reference run (default: the last run of another commit)")
+    parser.add_argument('--head', help="Commit of the compared run (default: the last run)")
+    parser.add_argument('--threshold', type=float, default=1.2, help="Ratio above which a measure is a regression")
+    args = parser.parse_args()
+
+    entries = load_results(args.benchmark)
+    head = find_run(entries, args.head)
+    base = find_run(entries, args.base, exclude=None if args.base else head and head['commit'])
+    if head is None or base is None:
+        sys.exit(f"Not enough recorded runs of '{args.benchmark}' to compare.")
+
+    rows = compare(base, head, args.threshold)
+    width = max(len(row[0]) for row in rows) if rows else 10
+    print(f"{'measure':<{width}}  {base['commit']:>14}  {head['commit']:>14}  ratio")
+    for key, base_value, head_value, ratio, regressed in rows:
+        print(f"{key:<{width}}  {base_value:>14.4f}  {head_value:>14.4f}  {ratio:5.2f}{'  REGRESSION' if regressed else ''}")
+
+    regressions = [row for row in rows if row[4]]
+    if regressions:
+        print(f"{len(regressions)} regression(s) above x{args.threshold}")
+        sys.exit(1)
@@ -0,0 +1,179 @@
+"""
+Recorded yfinance responses, replayed in place of the network so that the ingestion code
+(data_functions.load_data, quote_refresh) can be benchmarked reproducibly.
+
+Responses are dictionaries holding, for every ticker, what get_stock_data reads from yfinance:
+info, statements, daily bars. They are either recorded from yfinance (record_responses) or
+generated from a synthetic universe (synthetic_responses).
+"""
+import os
+import sys
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import make_price_history, make_statements
+
+MARKET_TICKERS = ['^TNX', '^GSPC']
+STATEMENTS = ['financials', 'quarterly_financials', 'balance_sheet', 'cashflow']
+
+# yfinance info keys and the universe columns they produce in get_stock_data
+INFO_COLUMNS = {
+    'longName': 'Company', 'exchange': 'Exchange', 'sector': 'Sector', 'industry': 'Industry', 'country': 'Country',
+    'marketCap': 'Market Cap', 'trailingPE': 'P/E', 'forwardPE': 'Forward P/E', 'trailingPegRatio': 'PEG',
+    'priceToSalesTrailing12Months': 'P/S', 'priceToBook': 'P/B', 'enterpriseToEbitda': 'EV/EBITDA',
+    'earningsGrowth': 'EPS growth', 'earningsQuarterlyGrowth': 'EPS growth quarter', 'revenueGrowth': 'Revenue growth',
+    'dividendYield': 'Dividend Yield', 'returnOnAssets': 'ROA', 'returnOnEquity': 'ROE', 'currentRatio': 'Current Ratio',
+    'quickRatio': 'Quick Ratio', 'debtToEquity': 'Debt/Equity', 'grossMargins': 'Gross Margin',
+    'operatingMargins': 'Operating Margin', 'profitMargins': 'Profit Margin', 'payoutRatio': 'Payout Ratio',
+    'heldPercentInsiders': 'Insider Ownership', 'heldPercentInstitutions': 'Institutional Ownership',
+    'shortPercentOfFloat': 'Float Short', 'recommendationMean': 'Analyst Recom.', 'earningsTimestamp': 'Earnings Date',
+    'beta': 'Beta', 'averageVolume': 'Average Volume', 'volume': 'Current Volume', 'currentPrice': 'Price',
+    'targetMeanPrice': 'Target Price', 'firstTradeDateEpochUtc': 'IPO Date', 'sharesOutstanding': 'Shares Outstanding',
+    'floatShares': 'Float',
+}
+
+
+def _present(value):
+    return not (isinstance(value, float) and np.isnan(value))
+
+
+def synthetic_responses(universe_df, seed=0, n_days=1260):
+    """
+    Generates the responses of every ticker of a synthetic universe (see synthetic.make_universe):
+    info values taken from the universe row, annual and quarterly statement histories, and daily bars.
+    Missing values of the universe are missing keys of info, as with yfinance.
+    """
+    rng = np.random.default_rng(seed)
+    responses = {}
+    for row in universe_df.to_dict('records'):
+        info = {key: row[column] for key, column in INFO_COLUMNS.items() if column in row and _present(row[column])}
+        market_cap = info.get('marketCap', np.exp(rng.normal(21.0, 2.0)))
+        if _present(row.get('Price/Free Cash Flow', np.nan)) and row['Price/Free Cash Flow'] != 0:
+            info['freeCashflow'] = market_cap / row['Price/Free Cash Flow']
+        info['totalDebt'] = market_cap * rng.uniform(0.0, 0.8)
+        revenue = market_cap / row['P/S'] if _present(row.get('P/S', np.nan)) and row['P/S'] > 0 else market_cap / 3
+
+        responses[row['Ticker']] = {
+            'info': info,
+            'financials': make_statements(rng, revenue),
+            'quarterly_financials': make_statements(rng, revenue / 4, n_periods=5, quarterly=True),
+            'balance_sheet': pd.DataFrame({'Total Debt': [info['totalDebt']]}).T,
+            'cashflow': pd.DataFrame({'Free Cash Flow': [info.get('freeCashflow', np.nan)]}).T,
+            'history': make_price_history(rng, row['Price'] if _present(row['Price']) else 50.0, n_days),
+        }
+    responses['^TNX'] = {'info': {}, 'history': make_price_history(rng, 4.2, 30)}
+    responses['^GSPC'] = {'info': {}, 'history': make_price_history(rng, 5000.0, 30)}
+    return responses
+
+
+def record_responses(tickers, file_name):
+    """
+    Records the yfinance responses of the tickers (and of the market tickers used by load_data) to file_name,
+    to be replayed later with load_responses and fake_yfinance.
+    """
+    import yfinance as yf
+
+    responses = {}
+    for ticker in list(tickers) + MARKET_TICKERS:
+        stock = yf.Ticker(ticker)
+        response = {'info': stock.info, 'history': stock.history(period="5y")}
+        for statement in STATEMENTS:
+            try:
+                response[statement] = getattr(stock, statement)
+            except Exception as e:
+                print(f"Could not record {statement} of {ticker}: {e}")
+        responses[ticker] = response
+    pd.to_pickle(responses, file_name)
+    return responses
+
+
+def load_responses(file_name):
+    return pd.read_pickle(file_name)
+
+
+def _period_rows(period):
+    if period == 'max':
+        return None
+    if period.endswith('d'):
+        return int(period[:-1])
+    if period.endswith('mo'):
+        return int(period[:-2]) * 21
+    if period.endswith('y'):
+        return int(period[:-1]) * 252
+    raise ValueError(f"Unsupported period {period}")
+
+
+def _history(bars, period='1mo', interval='1d', start=None, end=None, **kwargs):
+    if start is not None or end is not None:
+        dates = bars.index.tz_localize(None) if bars.index.tz is not None else bars.index
+        keep = np.ones(len(bars), dtype=bool)
+        if start is not None:
+            keep &= dates >= pd.Timestamp(start)
+        if end is not None:
+            keep &= dates < pd.Timestamp(end)
+        bars = bars.loc[keep]
+    else:
+        n_rows = _period_rows(period)
+        bars = bars if n_rows is None else bars.iloc[-n_rows:]
+    if interval == '1mo':
+        monthly = bars.resample('MS')
+        bars = pd.DataFrame({
+            'Open': monthly['Open'].first(), 'High': monthly['High'].max(), 'Low': monthly['Low'].min(),
+            'Close': monthly['Close'].last(), 'Volume': monthly['Volume'].sum(),
+        })
+    elif interval != '1d':
+        raise ValueError(f"Unsupported interval {interval}")
+    return bars.copy()
+
+
+class RecordedTicker:
+    """
+    Stands in for yfinance.Ticker, answering from the recorded responses.
+    """
+    def __init__(self, ticker, responses):
+        if ticker not in responses:
+            raise KeyError(f"No recorded response for {ticker}")
+        self.ticker = ticker
+        self._response = responses[ticker]
+
+    @property
+    def info(self):
+        return self._response['info']
+
+    def history(self, period='1mo', interval='1d', start=None, end=None, **kwargs):
+        return _history(self._response['history'], period, interval, start, end)
+
+    def __getattr__(self, name):
+        if name in STATEMENTS:
+            return self._response.get(name, pd.DataFrame())
+        if name == 'earnings_history':
+            return pd.DataFrame({'epsActual': self._response['financials'].loc['Basic EPS'].iloc[::-1].to_numpy()})
+        raise AttributeError(name)
+
+
+def _download(responses, tickers, period='1mo', interval='1d', start=None, end=None, **kwargs):
+    tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+    bars = {t: _history(responses[t]['history'], period, interval, start, end) for t in tickers if t in responses}
+    fields = ['Open', 'High', 'Low', 'Close', 'Volume']
+    return pd.concat({field: pd.DataFrame({t: b[field] for t, b in bars.items()}) for field in fields}, axis=1)
+
+
+@contextmanager
+def fake_yfinance(responses):
+    """
+    Replaces yfinance.Ticker and yfinance.download with the recorded responses while the context is active.
+    """
+    import yfinance as yf
+
+    original_ticker, original_download = yf.Ticker, yf.download
+    yf.Ticker = lambda ticker, *args, **kwargs: RecordedTicker(ticker, responses)
+    yf.download = lambda tickers, *args, **kwargs: _download(responses, tickers, *args, **kwargs)
+    try:
+        yield responses
+    finally:
+        yf.Ticker, yf.download = original_ticker, original_download
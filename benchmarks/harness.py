@@ -0,0 +1,42 @@
+import gc
+import statistics
+import time
+import tracemalloc
+
+
+def measure(func, repeat=5, setup=None):
+    """
+    Times func over `repeat` runs, then runs it once more under tracemalloc for its peak memory
+    (traced separately, since tracing slows the allocations down).
+
+    Parameters:
+    - func: The function to measure. It receives the value returned by setup, if any.
+    - repeat: The number of timed runs.
+    - setup: A function called before every run, outside of the measurement.
+
+    Returns:
+    - A dictionary with the median and min time in seconds and the peak traced memory in MB.
+    """
+    def run():
+        args = (setup(),) if setup is not None else ()
+        gc.collect()
+        start = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - start
+
+    times = [run() for _ in range(repeat)]
+
+    args = (setup(),) if setup is not None else ()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'seconds_median': statistics.median(times),
+        'seconds_min': min(times),
+        'peak_memory_mb': peak / 2 ** 20,
+    }
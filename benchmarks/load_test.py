@@ -0,0 +1,200 @@
+"""
+Load test of Stocks_Screener.py: N simulated sessions, built on Streamlit's AppTest, run scripted
+interactions (sector filters, number of rows, weight changes, Recalculate scores, paging, sorting)
+in one process, like one server process serving N analysts. Every step of every session is a rerun;
+the sessions take turns so that their state accumulates as on a real server.
+
+Reports the rerun latency percentiles (overall and per interaction) and the process RSS, for every
+number of sessions, and fails (exit status 1) when the latency grows with the number of sessions
+or the memory per session goes above the limits.
+
+Usage: python benchmarks/load_test.py [--sessions 1 5 10] [--stocks 2000] [--steps 12]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.results import record_results
+from benchmarks.synthetic import write_dataset, SECTORS
+
+APP_FILE = os.path.join(ROOT, 'Stocks_Screener.py')
+PERCENTILES = [50, 90, 99]
+
+
+def rss_mb():
+    """
+    Resident memory of the process in MB, from /proc when available (current value), else the peak from resource.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def _widget(elements, label):
+    return next(e for e in elements if e.label == label)
+
+
+# Scripted interactions: each one changes widgets of a session and reruns it
+def select_sector(at, rng):
+    _widget(at.multiselect, 'Sectors').set_value([rng.choice(list(SECTORS))]).run()
+
+
+def all_sectors(at, rng):
+    _widget(at.multiselect, 'Sectors').set_value(['All']).run()
+
+
+def change_n_scores(at, rng):
+    at.number_input(key='n_scores').set_value(rng.choice([10, 15, 25, 50])).run()
+
+
+def next_page(at, rng):
+    # The page number has no maximum: the table view clamps it to the last page
+    at.number_input(key='global_scores_page').increment().run()
+
+
+def sort_stocks(at, rng):
+    at.selectbox(key='stocks_sort_column').set_value(rng.choice(['Market Cap', 'P/E', 'ROE', 'Price'])).run()
+
+
+def change_weight(at, rng):
+    metric = rng.choice(['P/E', 'ROE', 'Revenue growth', 'Debt/Equity'])
+    at.slider(key=f'{metric}_weight').set_value(rng.randint(0, 100)).run()
+    _widget(at.button, 'Update').click().run()
+
+
+def recalculate(at, rng):
+    _widget(at.sidebar.button, 'Recalculate scores').click().run()
+
+
+INTERACTIONS = {
+    'select_sector': (select_sector, 3),
+    'all_sectors': (all_sectors, 1),
+    'change_n_scores': (change_n_scores, 2),
+    'next_page': (next_page, 2),
+    'sort_stocks': (sort_stocks, 2),
+    'change_weight': (change_weight, 1),
+    'recalculate': (recalculate, 1),
+}
+
+
+def _percentiles(latencies):
+    if not latencies:
+        return {}
+    return {f'p{p}_seconds': float(np.percentile(latencies, p)) for p in PERCENTILES}
+
+
+def run_sessions(n_sessions, n_steps, seed=0):
+    """
+    Runs n_sessions sessions of n_steps interactions each, the sessions taking turns.
+
+    Returns:
+    - The latency percentiles, overall and per interaction, and the RSS before and after.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    names = list(INTERACTIONS)
+    weights = [INTERACTIONS[name][1] for name in names]
+    latencies = {name: [] for name in ['first_run'] + names}
+    rss_before = rss_mb()
+
+    sessions = []
+    for _ in range(n_sessions):
+        start = time.perf_counter()
+        at = AppTest.from_file(APP_FILE, default_timeout=600).run()
+        latencies['first_run'].append(time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(f"The app failed on the first run: {at.exception}")
+        sessions.append(at)
+
+    for _ in range(n_steps):
+        for at in sessions:
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            INTERACTIONS[name][0](at, rng)
+            latencies[name].append(time.perf_counter() - start)
+            if at.exception:
+                raise RuntimeError(f"The app failed on '{name}': {at.exception}")
+
+    reruns = [t for name in names for t in latencies[name]]
+    rss_after = rss_mb()
+    return {
+        'sessions': n_sessions,
+        'reruns': len(reruns),
+        'latency': _percentiles(reruns),
+        'latency_by_interaction': {name: _percentiles(values) for name, values in latencies.items() if values},
+        'rss_before_mb': rss_before,
+        'rss_after_mb': rss_after,
+        'rss_per_session_mb': (rss_after - rss_before) / n_sessions,
+    }
+
+
+def check_scaling(runs, max_latency_ratio, max_rss_per_session_mb):
+    """
+    Returns the list of failed checks: p90 latency of the largest run over the smallest one, and memory per session.
+    """
+    failures = []
+    smallest, largest = runs[0], runs[-1]
+    ratio = largest['latency']['p90_seconds'] / smallest['latency']['p90_seconds']
+    if len(runs) > 1 and ratio > max_latency_ratio:
+        failures.append(
+            f"p90 latency x{ratio:.2f} from {smallest['sessions']} to {largest['sessions']} sessions (limit x{max_latency_ratio})"
+        )
+    for run in runs:
+        if run['rss_per_session_mb'] > max_rss_per_session_mb:
+            failures.append(
+                f"{run['rss_per_session_mb']:.1f} MB per session with {run['sessions']} sessions (limit {max_rss_per_session_mb} MB)"
+            )
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 5, 10])
+    parser.add_argument('--stocks', type=int, default=2000)
+    parser.add_argument('--steps', type=int, default=12, help="Interactions per session")
+    parser.add_argument('--max-latency-ratio', type=float, default=1.5)
+    parser.add_argument('--max-rss-per-session-mb', type=float, default=50.0)
+    args = parser.parse_args()
+
+    runs = []
+    with tempfile.TemporaryDirectory() as directory:
+        write_dataset(directory, args.stocks)
+        os.chdir(directory)
+        # Warm-up run, so that the imports and the cached data are not counted as memory of the first sessions
+        run_sessions(1, 1)
+        for n_sessions in sorted(args.sessions):
+            run = run_sessions(n_sessions, args.steps)
+            runs.append(run)
+            latency = run['latency']
+            print(f"{n_sessions:>3} sessions: {run['reruns']} reruns, p50 {latency['p50_seconds'] * 1000:.0f} ms, "
+                  f"p90 {latency['p90_seconds'] * 1000:.0f} ms, p99 {latency['p99_seconds'] * 1000:.0f} ms, "
+                  f"RSS {run['rss_after_mb']:.0f} MB ({run['rss_per_session_mb']:.1f} MB per session)")
+
+    failures = check_scaling(runs, args.max_latency_ratio, args.max_rss_per_session_mb)
+    entry = record_results('load', {
+        'stocks': args.stocks,
+        'steps': args.steps,
+        'runs': {str(run['sessions']): run for run in runs},
+        'failures': failures,
+    })
+    print(json.dumps(entry['results']['runs'], indent=2))
+    for failure in failures:
+        print(f"Scaling regression: {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,42 @@
+import json
+import os
+import platform
+import subprocess
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def current_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+
+def record_results(benchmark, results):
+    """
+    Appends the results of a benchmark run to benchmarks/results/<benchmark>.jsonl, tagged with the commit.
+    """
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    entry = {
+        'commit': current_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    with open(os.path.join(RESULTS_DIR, benchmark + '.jsonl'), 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+    return entry
+
+
+def load_results(benchmark):
+    file_name = os.path.join(RESULTS_DIR, benchmark + '.jsonl')
+    if not os.path.exists(file_name):
+        return []
+    with open(file_name) as f:
+        return [json.loads(l) for l in f if l.strip()]
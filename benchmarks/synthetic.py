@@ -0,0 +1,154 @@
+import os
+import sys
+import shutil
+import zlib
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from data_functions import column_order
+
+# Approximate sector mix of a broad equity universe
+SECTORS = {
+    'Technology': 0.20,
+    'Financial Services': 0.14,
+    'Healthcare': 0.12,
+    'Industrials': 0.12,
+    'Consumer Cyclical': 0.10,
+    'Consumer Defensive': 0.06,
+    'Energy': 0.05,
+    'Communication Services': 0.05,
+    'Real Estate': 0.06,
+    'Utilities': 0.05,
+    'Basic Materials': 0.05,
+}
+EXCHANGES = ['NMS', 'NYQ', 'NGM', 'ASE']
+COUNTRIES = ['United States', 'United States', 'United States', 'Canada', 'United Kingdom', 'Ireland', 'Netherlands']
+TEXT_COLUMNS = ['Ticker', 'Company', 'Exchange', 'Sector', 'Industry', 'Country', '20-Day High/Low', '50-Day High/Low', '52-Week High/Low']
+ALWAYS_EMPTY = ['Institutional Transactions']
+
+
+def _ticker(i):
+    letters = ''
+    i += 26
+    while i > 0:
+        i, r = divmod(i, 26)
+        letters = chr(65 + r) + letters
+    return letters
+
+
+def make_universe(n_stocks, seed=0, nan_rate=0.08):
+    """
+    Generates a synthetic stocks universe with the columns produced by data_functions.load_data:
+    a realistic sector mix, heavy tailed ratios, negative values and missing data.
+    """
+    rng = np.random.default_rng(seed)
+    sectors = rng.choice(list(SECTORS), size=n_stocks, p=np.array(list(SECTORS.values())) / sum(SECTORS.values()))
+    data = {
+        'Ticker': [_ticker(i) for i in range(n_stocks)],
+        'Company': [f"Company {_ticker(i).title()} Inc." for i in range(n_stocks)],
+        'Exchange': rng.choice(EXCHANGES, size=n_stocks),
+        'Sector': sectors,
+        'Industry': [f"{s} - Industry {k}" for s, k in zip(sectors, rng.integers(0, 6, size=n_stocks))],
+        'Country': rng.choice(COUNTRIES, size=n_stocks),
+    }
+    price = np.exp(rng.normal(4.0, 1.0, size=n_stocks))
+    for column in column_order:
+        if column in data:
+            continue
+        if column.endswith('High/Low'):
+            data[column] = [f"{p * 1.1:.2f}/{p * 0.9:.2f}" for p in price]
+        elif column in ALWAYS_EMPTY:
+            data[column] = np.full(n_stocks, np.nan)
+        elif column in ['Price', 'Target Price', 'Daily Last Close'] or 'Moving Average' in column:
+            data[column] = price * np.exp(rng.normal(0.0, 0.1, size=n_stocks))
+        elif column in ['Market Cap', 'Shares Outstanding', 'Float', 'Average Volume', 'Current Volume', 'Discounted Cash Flow']:
+            data[column] = np.exp(rng.normal(21.0, 2.0, size=n_stocks))
+        elif 'RSI' in column:
+            data[column] = rng.uniform(10, 90, size=n_stocks)
+        else:
+            # Heavy tailed values with a share of negatives, like most ratios and growth rates
+            data[column] = rng.standard_t(2.5, size=n_stocks) + rng.lognormal(0.0, 1.0, size=n_stocks)
+        if column not in ALWAYS_EMPTY and column not in TEXT_COLUMNS and column != 'Price':
+            data[column] = np.where(rng.random(n_stocks) < nan_rate, np.nan, data[column])
+    return pd.DataFrame(data).loc[:, column_order].round(2)
+
+
+def synthetic_stock_data(ticker, risk_free_rate=None, market_return=None):
+    """
+    Stands in for data_functions.get_stock_data (same signature) without the network: a synthetic row,
+    always the same for the same ticker.
+    """
+    row = make_universe(1, seed=zlib.crc32(ticker.encode())).iloc[0].to_dict()
+    row['Ticker'] = ticker
+    return row
+
+
+def make_price_history(rng, start_price, n_days=1260, end='2026-10-16'):
+    """
+    Generates daily OHLCV bars ending on `end`, as returned by yfinance Ticker.history: a random walk
+    with fat tailed returns and a volatility drawn per stock.
+    """
+    dates = pd.bdate_range(end=end, periods=n_days)
+    volatility = rng.uniform(0.01, 0.04)
+    returns = volatility * rng.standard_t(4, size=n_days) / np.sqrt(2)
+    close = start_price * np.exp(np.cumsum(returns) - returns.sum())
+    open_ = close * np.exp(rng.normal(0.0, volatility / 2, size=n_days))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0.0, volatility / 2, size=n_days)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0.0, volatility / 2, size=n_days)))
+    volume = np.exp(rng.normal(14.0, 1.0)) * np.exp(rng.normal(0.0, 0.3, size=n_days))
+    return pd.DataFrame(
+        {'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume.round(), 'Dividends': 0.0, 'Stock Splits': 0.0},
+        index=dates.tz_localize('America/New_York').rename('Date')
+    )
+
+
+def make_statements(rng, revenue, n_periods=4, quarterly=False, end='2026-06-30'):
+    """
+    Generates an income statement history laid out like yfinance Ticker.financials (one row per item,
+    one column per period, most recent first), with growing or shrinking revenue, a noisy margin
+    and occasionally missing periods.
+    """
+    dates = pd.date_range(end=end, periods=n_periods, freq='QE' if quarterly else 'YE')[::-1]
+    growth = rng.normal(0.06, 0.15) / (4 if quarterly else 1)
+    revenues = revenue * np.exp(-growth * np.arange(n_periods) + rng.normal(0.0, 0.05, size=n_periods))
+    margin = rng.normal(0.1, 0.12) + rng.normal(0.0, 0.03, size=n_periods)
+    net_income = revenues * margin
+    pretax_income = net_income / 0.79
+    statements = pd.DataFrame({
+        'Total Revenue': revenues,
+        'Net Income': net_income,
+        'Pretax Income': pretax_income,
+        'Tax Provision': pretax_income - net_income,
+        'Tax Rate For Calcs': np.full(n_periods, 0.21),
+        'Interest Expense': revenues * rng.uniform(0.0, 0.05),
+        'Basic EPS': net_income / (revenue / rng.uniform(5, 500)),
+    }, index=dates).T
+    if rng.random() < 0.1:
+        statements.iloc[:, -1] = np.nan
+    return statements
+
+
+def write_dataset(directory, n_stocks, seed=0):
+    """
+    Writes a synthetic dataset laid out like the app expects (./data and ./metrics_config inside directory).
+    """
+    import json
+    from scoring_functions import load_scores
+
+    os.makedirs(os.path.join(directory, 'data'), exist_ok=True)
+    shutil.copytree(os.path.join(ROOT, 'metrics_config'), os.path.join(directory, 'metrics_config'), dirs_exist_ok=True)
+    with open(os.path.join(directory, 'metrics_config', 'default_metrics.json')) as f:
+        metrics = json.load(f)
+
+    df = make_universe(n_stocks, seed)
+    df.to_csv(os.path.join(directory, 'data', 'stocks_universe.csv'), index=False)
+    load_scores(df.set_index('Ticker'), metrics, to_file=os.path.join(directory, 'data', 'stocks_scores.csv'))
+    with open(os.path.join(directory, 'data', 'sp500_tickers.txt'), 'w') as f:
+        f.write('\n'.join(df['Ticker']))
+    with open(os.path.join(directory, 'data', 'other_tickers.txt'), 'w') as f:
+        f.write('')
+    return df
@@ -56,3 +56,18 @@ ta_amounts = [
     'Daily 6m Price Change', 'Daily 12m Price Change', 'Performance Y',
     'Performance 6M', 'Volatility', 'Daily RSI (14)', 'Monthly RSI (14)'
 ]
+
+
+# Groups in display order, with their titles
+column_groups = [
+    ('General Information', general_info),
+    ('Valuation Ratios', stock_valuation_ratios),
+    ('DCF Valuation', dcf_valuation),
+    ('Growth', growth_quantities),
+    ('Returns', returns_quantities),
+    ('Other Ratios', other_ratios),
+    ('Margins', margin_amounts),
+    ('Ownership', ownership_columns),
+    ('Shares', shares_information),
+    ('Technical Analysis', ta_amounts),
+]
@@ -0,0 +1,128 @@
+import glob
+import hashlib
+import json
+import os
+import pandas as pd
+
+MANIFEST_FILE_NAME = "manifest.json"
+PART_PATTERN = "part-{:05d}.parquet"
+
+
+def tickers_hash(tickers):
+    return hashlib.sha1("\n".join(tickers).encode()).hexdigest()[:16]
+
+
+def _write_json(file_name, content):
+    tmp_file_name = file_name + ".tmp"
+    with open(tmp_file_name, "w") as f:
+        json.dump(content, f, indent=1)
+    os.replace(tmp_file_name, file_name)
+
+
+def load_manifest(checkpoint_dir, tickers):
+    """
+    Returns the manifest of an interrupted crawl of the same tickers, or None if there is nothing to resume.
+    """
+    file_name = os.path.join(checkpoint_dir, MANIFEST_FILE_NAME)
+    if not os.path.exists(file_name):
+        return None
+    with open(file_name, "r") as f:
+        manifest = json.load(f)
+    if manifest.get("tickers_hash") != tickers_hash(tickers) or manifest.get("completed"):
+        return None
+    return manifest
+
+
+def new_manifest(checkpoint_dir, tickers, **parameters):
+    """
+    Starts a new crawl in checkpoint_dir, removing the parts of any previous crawl.
+
+    Parameters:
+    - checkpoint_dir: The directory holding the manifest and the parts.
+    - tickers: The tickers to crawl, in order.
+    - parameters: Values that must stay the same when resuming (e.g. risk_free_rate, market_return).
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    for part in glob.glob(os.path.join(checkpoint_dir, "part-*.parquet")):
+        os.remove(part)
+    manifest = {
+        "tickers_hash": tickers_hash(tickers),
+        "n_tickers": len(tickers),
+        "next_index": 0,
+        "parts": [],
+        "failed": [],
+        "completed": False,
+        "parameters": parameters,
+    }
+    _write_json(os.path.join(checkpoint_dir, MANIFEST_FILE_NAME), manifest)
+    return manifest
+
+
+def rows_to_frame(rows, columns, text_columns):
+    """
+    Builds a frame with a fixed schema from the crawled rows: text columns as strings, everything else as floats
+    rounded to 2 decimals, so that all the parts share the same schema.
+    """
+    df = pd.DataFrame(rows).reindex(columns=columns)
+    for column in columns:
+        if column in text_columns:
+            df[column] = df[column].astype(object).where(df[column].notna(), None)
+        else:
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype(float).round(2)
+    return df
+
+
+def write_part(file_name, rows, columns, text_columns):
+    """
+    Writes crawled rows to a parquet part with the fixed schema of rows_to_frame. The part is written
+    to a temporary file first, so that a part file is always complete.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(c, pa.string() if c in text_columns else pa.float64()) for c in columns])
+    table = pa.Table.from_pandas(rows_to_frame(rows, columns, text_columns), schema=schema, preserve_index=False)
+    tmp_file_name = file_name + ".tmp"
+    pq.write_table(table, tmp_file_name)
+    os.replace(tmp_file_name, file_name)
+
+
+def commit_chunk(checkpoint_dir, manifest, rows, failed, next_index, columns, text_columns):
+    """
+    Commits a chunk of the crawl: the rows are written to a new parquet part first, then the manifest
+    records the part and the position of the next ticker. A crash at any point leaves a consistent
+    checkpoint: at worst the last chunk is crawled again.
+    """
+    if rows:
+        part = PART_PATTERN.format(len(manifest["parts"]))
+        write_part(os.path.join(checkpoint_dir, part), rows, columns, text_columns)
+        manifest["parts"].append(part)
+    manifest["failed"].extend(failed)
+    manifest["next_index"] = next_index
+    _write_json(os.path.join(checkpoint_dir, MANIFEST_FILE_NAME), manifest)
+
+
+def read_parts(checkpoint_dir, manifest, columns):
+    """
+    Puts the committed parts together into one DataFrame with the given columns, in that order. The arrow
+    buffers are released while they are converted, so the universe is never held twice in memory.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if not manifest["parts"]:
+        return pd.DataFrame(columns=columns)
+    table = pa.concat_tables([pq.read_table(os.path.join(checkpoint_dir, part), columns=columns) for part in manifest["parts"]])
+    return table.to_pandas(self_destruct=True, split_blocks=True)
+
+
+def complete(checkpoint_dir, manifest, remove_parts=True):
+    """
+    Marks the crawl as completed, so that the next crawl starts from scratch, and removes its parts.
+    """
+    manifest["completed"] = True
+    if remove_parts:
+        for part in manifest["parts"]:
+            os.remove(os.path.join(checkpoint_dir, part))
+        manifest["parts"] = []
+    _write_json(os.path.join(checkpoint_dir, MANIFEST_FILE_NAME), manifest)
@@ -0,0 +1,459 @@
+"""
+Sharded crawl with a coordinator and worker processes, on one or several hosts.
+
+The tickers are split into shards kept in a SQLite job store in the run directory. Workers claim a
+shard with a lease, crawl it (get_stock_data), renew the lease while they work and write the rows
+to a parquet part. A shard whose lease expired (dead or stuck worker) is given to another worker,
+at most MAX_ATTEMPTS times. The coordinator waits for all the shards, merges the parts into the
+stocks universe and scores it.
+
+Workers on other hosts only need the run directory on a shared filesystem with working file locks
+and clocks in sync (the leases are wall clock times).
+
+Usage:
+    python crawl_coordinator.py run [--workers 4] [--shard-size 50] [--lease 300] [--run-dir ./data/crawl_jobs]
+    python crawl_coordinator.py worker [--run-dir ./data/crawl_jobs]
+    python crawl_coordinator.py status [--run-dir ./data/crawl_jobs]
+    python crawl_coordinator.py self-check
+"""
+import argparse
+import glob
+import importlib
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+from contextlib import closing
+from functools import partial
+
+import data_functions
+from crawl_checkpoint import tickers_hash, write_part, read_parts
+from data_functions import column_order, text_columns
+
+RUN_DIR = "./data/crawl_jobs"
+JOBS_FILE_NAME = "jobs.sqlite"
+PART_PATTERN = "shard-{:05d}-{}.parquet"
+SHARD_SIZE = 50
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 1.0
+
+
+def connect(run_dir):
+    """
+    Opens the job store of a run. Transactions are explicit (BEGIN IMMEDIATE), so that claiming a
+    shard is atomic between processes.
+    """
+    return sqlite3.connect(os.path.join(run_dir, JOBS_FILE_NAME), timeout=60, isolation_level=None)
+
+
+def load_run(run_dir, tickers):
+    """
+    Returns the parameters of an unfinished run of the same tickers, or None if there is nothing to resume.
+    """
+    if not os.path.exists(os.path.join(run_dir, JOBS_FILE_NAME)):
+        return None
+    with closing(connect(run_dir)) as connection:
+        meta = dict(connection.execute("SELECT key, value FROM meta"))
+    if meta.get("tickers_hash") != tickers_hash(tickers) or meta.get("completed") == "1":
+        return None
+    return json.loads(meta["parameters"])
+
+
+def new_run(run_dir, tickers, shard_size=SHARD_SIZE, **parameters):
+    """
+    Creates the job store of a new run in run_dir, removing the shards and parts of any previous run.
+
+    Parameters:
+    - run_dir: The directory holding the job store and the parts.
+    - tickers: The tickers to crawl, in order.
+    - shard_size: The number of tickers per shard.
+    - parameters: Values shared by all the workers (e.g. risk_free_rate, market_return).
+    """
+    os.makedirs(run_dir, exist_ok=True)
+    with closing(connect(run_dir)) as connection:
+        connection.execute("BEGIN IMMEDIATE")
+        connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS shards (id INTEGER PRIMARY KEY, tickers TEXT NOT NULL, status TEXT NOT NULL, "
+            "worker TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0, part TEXT, failed TEXT)"
+        )
+        connection.execute("DELETE FROM meta")
+        connection.execute("DELETE FROM shards")
+        for part in glob.glob(os.path.join(run_dir, "shard-*.parquet")):
+            os.remove(part)
+        connection.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+            ("tickers_hash", tickers_hash(tickers)),
+            ("n_tickers", str(len(tickers))),
+            ("parameters", json.dumps(parameters)),
+            ("completed", "0"),
+        ])
+        connection.executemany(
+            "INSERT INTO shards (id, tickers, status) VALUES (?, ?, 'pending')",
+            [(i, json.dumps(tickers[start:start + shard_size])) for i, start in enumerate(range(0, len(tickers), shard_size))]
+        )
+        connection.execute("COMMIT")
+    return parameters
+
+
+def run_parameters(connection):
+    return json.loads(connection.execute("SELECT value FROM meta WHERE key = 'parameters'").fetchone()[0])
+
+
+def _expire_leases(connection, now):
+    # Within a transaction: expired leases go back to pending, or to failed after MAX_ATTEMPTS attempts
+    connection.execute(
+        "UPDATE shards SET status = 'failed' WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+        (now, MAX_ATTEMPTS)
+    )
+    connection.execute("UPDATE shards SET status = 'pending' WHERE status = 'leased' AND lease_expires < ?", (now,))
+
+
+def expire_leases(connection):
+    """
+    Gives back the shards whose lease expired, or marks them as failed after MAX_ATTEMPTS attempts, as
+    claim_shard does: the coordinator calls it too, since the workers that would claim them may be gone.
+    """
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        _expire_leases(connection, time.time())
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+
+
+def claim_shard(connection, worker, lease_seconds=LEASE_SECONDS):
+    """
+    Leases the next shard to crawl to worker: a pending shard, or a shard whose lease expired.
+    Shards whose lease expired MAX_ATTEMPTS times are marked as failed instead.
+
+    Returns:
+    - A dictionary with the shard 'id', its 'tickers' and the 'attempt' number, or None if no shard can be claimed.
+    """
+    now = time.time()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        _expire_leases(connection, now)
+        row = connection.execute(
+            "SELECT id, tickers, attempts FROM shards WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+            "ORDER BY id LIMIT 1",
+            (now,)
+        ).fetchone()
+        if row is not None:
+            connection.execute(
+                "UPDATE shards SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker, now + lease_seconds, row[0])
+            )
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    if row is None:
+        return None
+    return {"id": row[0], "tickers": json.loads(row[1]), "attempt": row[2] + 1}
+
+
+def renew_lease(connection, shard, worker, lease_seconds=LEASE_SECONDS):
+    """
+    Extends the lease of a shard. Returns False if the worker lost it (the shard was given to another worker).
+    """
+    cursor = connection.execute(
+        "UPDATE shards SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+        (time.time() + lease_seconds, shard["id"], worker)
+    )
+    return cursor.rowcount == 1
+
+
+def complete_shard(connection, run_dir, shard, worker, rows, failed):
+    """
+    Writes the rows of a shard to its part and marks it as done, if the worker still holds its lease.
+    Otherwise the part is discarded: the shard belongs to another worker now.
+
+    Returns:
+    - True if the shard was completed.
+    """
+    part = PART_PATTERN.format(shard["id"], shard["attempt"])
+    if rows:
+        write_part(os.path.join(run_dir, part), rows, column_order, text_columns)
+    cursor = connection.execute(
+        "UPDATE shards SET status = 'done', part = ?, failed = ?, lease_expires = NULL "
+        "WHERE id = ? AND worker = ? AND status = 'leased'",
+        (part if rows else None, json.dumps(failed), shard["id"], worker)
+    )
+    if cursor.rowcount != 1:
+        if rows:
+            os.remove(os.path.join(run_dir, part))
+        return False
+    return True
+
+
+def run_status(connection):
+    """
+    Returns the number of shards by status ('pending', 'leased', 'done', 'failed').
+    """
+    counts = dict(connection.execute("SELECT status, COUNT(*) FROM shards GROUP BY status"))
+    return {status: counts.get(status, 0) for status in ["pending", "leased", "done", "failed"]}
+
+
+def load_fetcher(name):
+    """
+    Imports a fetch function given as 'module:function', with the signature of get_stock_data.
+    """
+    module_name, function_name = name.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def run_worker(run_dir, worker=None, fetch=None, lease_seconds=LEASE_SECONDS, time_sleep=None, price_store_dir=None):
+    """
+    Claims and crawls shards until there is nothing left to claim, then returns the number of shards it completed.
+
+    Parameters:
+    - run_dir: The directory of the run.
+    - worker: A unique name of the worker, the host name and process id by default.
+    - fetch: The function crawling one ticker, get_stock_data by default. It is called as
+      fetch(ticker, risk_free_rate, market_return) and returns the row of the ticker.
+    - lease_seconds: The duration of the leases, renewed every third of it while a shard is crawled.
+    - time_sleep: The pause between two tickers (the rate budget of this worker), TIME_SLEEP by default.
+    - price_store_dir: The local price store used by get_stock_data (see price_store), on the host of the worker.
+    """
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    fetch = fetch or partial(data_functions.get_stock_data, store=price_store_dir)
+    time_sleep = data_functions.TIME_SLEEP if time_sleep is None else time_sleep
+    completed = 0
+
+    with closing(connect(run_dir)) as connection:
+        parameters = run_parameters(connection)
+        while True:
+            shard = claim_shard(connection, worker, lease_seconds)
+            if shard is None:
+                # Shards leased by other workers can still expire and come back
+                if run_status(connection)["leased"] == 0:
+                    return completed
+                time.sleep(min(POLL_SECONDS * 5, lease_seconds / 4))
+                continue
+
+            print(f"Worker {worker}: shard {shard['id']} (attempt {shard['attempt']}), {len(shard['tickers'])} tickers")
+            rows, failed = [], []
+            last_renewal = time.time()
+            lost = False
+            for ticker in shard["tickers"]:
+                if '.' in ticker:
+                    ticker = ticker.replace('.', '-')
+                try:
+                    rows.append(fetch(ticker, parameters.get("risk_free_rate"), parameters.get("market_return")))
+                except Exception as e:
+                    print(f"Error processing {ticker}: {e}")
+                    failed.append(ticker)
+                time.sleep(time_sleep)
+                if time.time() - last_renewal > lease_seconds / 3:
+                    if not renew_lease(connection, shard, worker, lease_seconds):
+                        lost = True
+                        break
+                    last_renewal = time.time()
+
+            if lost or not complete_shard(connection, run_dir, shard, worker, rows, failed):
+                print(f"Worker {worker}: lost the lease of shard {shard['id']}, its rows are discarded")
+            else:
+                completed += 1
+
+
+def merge_run(run_dir):
+    """
+    Puts the parts of the completed shards together, in the order of the tickers, and reports the
+    tickers that could not be crawled.
+
+    Returns:
+    - The DataFrame of all the crawled stocks.
+    """
+    with closing(connect(run_dir)) as connection:
+        shards = connection.execute("SELECT id, status, part, failed, tickers FROM shards ORDER BY id").fetchall()
+    parts = [part for _, status, part, _, _ in shards if status == "done" and part]
+    failed = [t for _, status, _, f, _ in shards if status == "done" for t in json.loads(f)]
+    lost_shards = [(i, json.loads(tickers)) for i, status, _, _, tickers in shards if status != "done"]
+    if failed:
+        print(f"{len(failed)} tickers could not be crawled: {failed[:20]}")
+    for i, tickers in lost_shards:
+        print(f"Shard {i} ({len(tickers)} tickers from {tickers[0]}) was given up after {MAX_ATTEMPTS} attempts")
+    df = read_parts(run_dir, {"parts": parts}, column_order)
+    return df.loc[:, column_order]
+
+
+def complete_run(run_dir, remove_parts=True):
+    """
+    Marks the run as completed, so that the next run starts over, and removes its parts.
+    """
+    with closing(connect(run_dir)) as connection:
+        connection.execute("UPDATE meta SET value = '1' WHERE key = 'completed'")
+    if remove_parts:
+        for part in glob.glob(os.path.join(run_dir, "shard-*.parquet")):
+            os.remove(part)
+
+
+def run_coordinator(run_dir, tickers, n_workers=4, fetch=None, shard_size=SHARD_SIZE, lease_seconds=LEASE_SECONDS,
+                    time_sleep=None, risk_free_rate=None, market_return=None, price_store_dir=None):
+    """
+    Runs a sharded crawl of the tickers: creates the shards (or resumes an unfinished run of the same
+    tickers), starts n_workers local worker processes (workers on other hosts can join with the
+    'worker' command), waits for all the shards and merges them.
+
+    Parameters:
+    - run_dir: The directory of the run, shared with the remote workers.
+    - tickers: The tickers to crawl.
+    - n_workers: The number of local worker processes. Local workers that die are replaced, up to
+      n_workers * MAX_ATTEMPTS times: RuntimeError is raised if shards are left without a worker.
+    - fetch: The function crawling one ticker (see run_worker). It must be importable by the workers.
+    - shard_size, lease_seconds, time_sleep: See new_run and run_worker.
+    - risk_free_rate, market_return: The market parameters, from get_market_parameters by default.
+    - price_store_dir: The local price store of the local workers.
+
+    Returns:
+    - The DataFrame of all the crawled stocks.
+    """
+    parameters = load_run(run_dir, tickers)
+    if parameters is None:
+        if risk_free_rate is None or market_return is None:
+            risk_free_rate, market_return = data_functions.get_market_parameters()
+        new_run(run_dir, tickers, shard_size, risk_free_rate=float(risk_free_rate), market_return=float(market_return))
+    else:
+        print(f"Resuming the crawl of {len(tickers)} tickers in {run_dir}")
+
+    def start_worker(i):
+        process = multiprocessing.Process(
+            target=run_worker, args=(run_dir, f"{socket.gethostname()}-local-{i}-{time.time():.0f}", fetch, lease_seconds, time_sleep, price_store_dir)
+        )
+        process.start()
+        return process
+
+    processes = [start_worker(i) for i in range(n_workers)]
+    restarts = 0
+    with closing(connect(run_dir)) as connection:
+        while True:
+            expire_leases(connection)
+            status = run_status(connection)
+            if status["pending"] + status["leased"] == 0:
+                break
+            for i, process in enumerate(processes):
+                if not process.is_alive() and process.exitcode != 0 and restarts < n_workers * MAX_ATTEMPTS:
+                    print(f"Worker {i} died (exit code {process.exitcode}), starting a new one")
+                    processes[i] = start_worker(i)
+                    restarts += 1
+            if status["pending"] > 0 and not any(process.is_alive() for process in processes):
+                # Nothing would ever crawl them: the run is kept, to be resumed
+                raise RuntimeError(
+                    f"All the local workers died ({restarts} restarts) with {status['pending']} shards left: "
+                    f"run again to resume the crawl, or start workers with the 'worker' command."
+                )
+            time.sleep(POLL_SECONDS)
+    for process in processes:
+        process.join()
+
+    df = merge_run(run_dir)
+    complete_run(run_dir)
+    return df
+
+
+def load_tickers():
+    try:
+        with open("./data/sp500_tickers.txt", "r") as f:
+            tickers = [l.strip() for l in f]
+        with open("./data/other_tickers.txt", "r") as f:
+            tickers.extend([l.strip() for l in f])
+    except Exception:
+        tickers = ['AAPL', 'GOOGL', 'BRK.B', 'NVDA', 'NFLX', 'V', 'AMZN']
+    return [t for t in tickers if t]
+
+
+def _dying_fetch(ticker, risk_free_rate=None, market_return=None):
+    # Fetch function of the self-check: the worker process dies
+    os._exit(1)
+
+
+def self_check():
+    """
+    Crawls a synthetic universe with 3 local workers, a worker dying with a shard leased, and checks
+    that the shard is reassigned once its lease expires and that every ticker is merged exactly once.
+    """
+    import tempfile
+    import pandas as pd
+    from benchmarks.synthetic import synthetic_stock_data, make_universe
+
+    tickers = make_universe(230, seed=0)['Ticker'].tolist()
+    with tempfile.TemporaryDirectory() as run_dir:
+        new_run(run_dir, tickers, shard_size=20, risk_free_rate=0.04, market_return=0.08)
+        with closing(connect(run_dir)) as connection:
+            dead_shard = claim_shard(connection, "dead-worker", lease_seconds=2)
+
+        start = time.time()
+        df = run_coordinator(run_dir, tickers, n_workers=3, fetch=synthetic_stock_data, lease_seconds=2, time_sleep=0.01)
+        print(f"Crawled {len(df)} tickers in {time.time() - start:.1f} s")
+        with closing(connect(run_dir)) as connection:
+            worker, attempts = connection.execute("SELECT worker, attempts FROM shards WHERE id = ?", (dead_shard["id"],)).fetchone()
+            assert run_status(connection)["done"] == 12
+
+    assert df["Ticker"].tolist() == tickers
+    expected = pd.DataFrame([synthetic_stock_data(t) for t in tickers]).loc[:, column_order]
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+    assert attempts == 2 and worker != "dead-worker"
+    print(f"Shard {dead_shard['id']} of the dead worker was reassigned to {worker}; all the rows match")
+
+    # Workers dying on every ticker: the coordinator stops once the restarts are used up
+    with tempfile.TemporaryDirectory() as run_dir:
+        new_run(run_dir, tickers, shard_size=20, risk_free_rate=0.04, market_return=0.08)
+        try:
+            run_coordinator(run_dir, tickers, n_workers=1, fetch=_dying_fetch, lease_seconds=1, time_sleep=0.01)
+            raise AssertionError("The coordinator did not stop")
+        except RuntimeError as e:
+            print(f"Stopped: {e}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["run", "worker", "status", "self-check"])
+    parser.add_argument("--run-dir", default=RUN_DIR)
+    parser.add_argument("--workers", type=int, default=4, help="Local worker processes started by 'run'")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--lease", type=float, default=LEASE_SECONDS, help="Lease duration in seconds")
+    parser.add_argument("--fetcher", help="Function crawling one ticker, as 'module:function' (default: get_stock_data)")
+    parser.add_argument("--worker-id", help="Name of the worker (default: host name and process id)")
+    parser.add_argument("--price-store", default="./data/prices", help="Local price store of the workers ('' to download all the history)")
+    parser.add_argument("--no-score", action="store_true", help="Only merge the crawled stocks, without scoring them")
+    args = parser.parse_args()
+    fetch = load_fetcher(args.fetcher) if args.fetcher else None
+
+    if args.command == "self-check":
+        self_check()
+
+    elif args.command == "worker":
+        n_shards = run_worker(args.run_dir, args.worker_id, fetch, args.lease, price_store_dir=args.price_store or None)
+        print(f"Worker done: {n_shards} shards crawled")
+
+    elif args.command == "status":
+        with closing(connect(args.run_dir)) as connection:
+            print(run_status(connection))
+
+    else:
+        stocks_file_name = "./data/stocks_universe.csv"
+        scores_file_name = "./data/stocks_scores.csv"
+        metrics_config_file_name = "./metrics_config/default_metrics.json"
+
+        df = run_coordinator(
+            args.run_dir, load_tickers(), args.workers, fetch, args.shard_size, args.lease, price_store_dir=args.price_store or None
+        )
+        df.to_csv(stocks_file_name, index=False)
+        print(f"Merged {len(df)} stocks into {stocks_file_name}")
+
+        if not args.no_score:
+            from data_loader import load_stocks_and_scores_data
+            from derived_metrics import load_derived_metrics, derived_metrics_config
+
+            with open(metrics_config_file_name, 'r') as f:
+                metrics = json.load(f)
+            derived_metrics = load_derived_metrics()
+            metrics.update({k: v for k, v in derived_metrics_config(derived_metrics).items() if k not in metrics})
+            load_stocks_and_scores_data(
+                metrics, stocks_from_file=stocks_file_name, scores_to_file=scores_file_name, derived_metrics=derived_metrics
+            )
+            print(f"Scores written to {scores_file_name}")
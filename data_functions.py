@@ -4,9 +4,13 @@ import pandas as pd
 from datetime import datetime, timedelta
 from helper_functions import get_peg_ratio, get_growth_factors
 from discount_cash_flow import get_discounted_cash_flow
+import crawl_checkpoint
+import price_store
+from market_data_transport import get_session, endpoint_stats
 import time 
 
 TIME_SLEEP = 1.2
+CHUNK_SIZE = 25
 
 column_order = [
 	'Ticker',
@@ -84,12 +88,18 @@ column_order = [
 	'Monthly RSI (14)'
 ]
 
+text_columns = [
+    'Ticker', 'Company', 'Exchange', 'Sector', 'Industry', 'Country',
+    '20-Day High/Low', '50-Day High/Low', '52-Week High/Low'
+]
+
 def get_sp500_tickers():
     sp500 = pd.read_html('https://en.wikipedia.org/wiki/List_of_S%26P_500_companies')[0]
     return sp500['Symbol'].tolist()
 
-def get_stock_data(ticker, risk_free_rate=None, market_return=None):
-    stock = yf.Ticker(ticker)
+def get_stock_data(ticker, risk_free_rate=None, market_return=None, store=None):
+    # All the requests of the ticker go through the shared pooled session
+    stock = yf.Ticker(ticker, session=get_session())
     info = stock.info
     data = {
         'Ticker': ticker,
@@ -151,8 +161,13 @@ def get_stock_data(ticker, risk_free_rate=None, market_return=None):
     # Get historical data
     end_date = datetime.now()
     start_date = end_date - timedelta(days=365*5)  # 5 years of data
-    hist = stock.history(start=start_date, end=end_date)
-    hist_mo = stock.history(period="max", interval="1mo")
+    if store is None:
+        hist = stock.history(start=start_date, end=end_date)
+        hist_mo = stock.history(period="max", interval="1mo")
+    else:
+        # Local price store (see price_store): only the bars after the last stored ones are downloaded
+        hist = price_store.history_bars(store, ticker, stock.history, '1d', start=start_date.date())
+        hist_mo = price_store.history_bars(store, ticker, stock.history, '1mo')
     
     # Calculate moving averages
     for window in [20, 50, 200]:
@@ -201,26 +216,82 @@ def get_stock_data(ticker, risk_free_rate=None, market_return=None):
     return data
 
 
-def load_data(tickers=None, from_file=None, to_file='./data/stocks_fundamentals.csv'):
+def get_market_parameters():
+    # These will be used for discounted cash flow model valuation
+    treasury_data = yf.Ticker("^TNX", session=get_session()).history(period="1d")
+    market_history = yf.Ticker("^GSPC", session=get_session()).history() 
+    risk_free_rate = treasury_data['Close'].iloc[0] / 100
+    market_return = market_history['Close'].pct_change().mean() * 252
+    return risk_free_rate, market_return
+
+
+def crawl_with_checkpoints(tickers, checkpoint_dir, chunk_size=CHUNK_SIZE, price_store_dir=None):
+    """
+    Crawls the tickers, committing the results every chunk_size tickers to parquet parts in checkpoint_dir
+    (see crawl_checkpoint). If a crawl of the same tickers was interrupted, it resumes after the last
+    committed ticker instead of starting over. With price_store_dir, the price histories are read from
+    and appended to the local price store.
+
+    Returns:
+    - The DataFrame of all the crawled stocks.
+    """
+    manifest = crawl_checkpoint.load_manifest(checkpoint_dir, tickers)
+    if manifest is None:
+        risk_free_rate, market_return = get_market_parameters()
+        manifest = crawl_checkpoint.new_manifest(
+            checkpoint_dir, tickers, risk_free_rate=float(risk_free_rate), market_return=float(market_return)
+        )
+    else:
+        print(f"Resuming crawl from ticker {manifest['next_index']} out of {len(tickers)}")
+    risk_free_rate = manifest['parameters']['risk_free_rate']
+    market_return = manifest['parameters']['market_return']
+    
+    rows, failed = [], []
+    for i in range(manifest['next_index'], len(tickers)):
+        ticker = tickers[i]
+        if '.' in ticker:
+            ticker = ticker.replace('.', '-')
+        print(f'Ticker:{ticker} -- {i} out of {len(tickers)}')
+        try:
+            rows.append(get_stock_data(ticker, risk_free_rate, market_return, price_store_dir))
+        except Exception as e:
+            print(f"Error processing {ticker}: {e}")
+            failed.append(ticker)
+        
+        if len(rows) + len(failed) >= chunk_size or i == len(tickers) - 1:
+            crawl_checkpoint.commit_chunk(checkpoint_dir, manifest, rows, failed, i + 1, column_order, text_columns)
+            rows, failed = [], []
+        
+        time.sleep(TIME_SLEEP)
+    
+    df = crawl_checkpoint.read_parts(checkpoint_dir, manifest, column_order)
+    crawl_checkpoint.complete(checkpoint_dir, manifest)
+    return df
+
+
+def load_data(tickers=None, from_file=None, to_file='./data/stocks_fundamentals.csv', checkpoint_dir=None, chunk_size=CHUNK_SIZE, price_store_dir=None):
     
     if from_file is None and tickers is None:
         tickers = ['AAPL', 'GOOGL', 'BRK.B', 'NVDA', 'NFLX', 'V', 'AMZN']
     
-    if from_file is None:
+    if from_file is None and checkpoint_dir is not None:
+        # Resumable crawl: rows are streamed to disk instead of being kept in memory (parts are in column order)
+        df = crawl_with_checkpoints(tickers, checkpoint_dir, chunk_size, price_store_dir)
+        
+        if to_file is not None:
+            df.to_csv(to_file, index=False)
+            
+    elif from_file is None:
         data = []
         
-        # These will be used for discounted cash flow model valuation
-        treasury_data = yf.Ticker("^TNX").history(period="1d")
-        market_history = yf.Ticker("^GSPC").history() 
-        risk_free_rate = treasury_data['Close'].iloc[0] / 100
-        market_return = market_history['Close'].pct_change().mean() * 252
+        risk_free_rate, market_return = get_market_parameters()
         
         for i,ticker in enumerate(tickers):
             if '.' in ticker:
                 ticker = ticker.replace('.', '-')
             print(f'Ticker:{ticker} -- {i} out of {len(tickers)}')
             try:
-                stock_data = get_stock_data(ticker, risk_free_rate, market_return)
+                stock_data = get_stock_data(ticker, risk_free_rate, market_return, price_store_dir)
                 data.append(stock_data)
             except Exception as e:
                 print(f"Error processing {ticker}: {e}")
@@ -228,11 +299,16 @@ def load_data(tickers=None, from_file=None, to_file='./data/stocks_fundamentals.
             time.sleep(TIME_SLEEP)
 
         # Create DataFrame
-        df = pd.DataFrame(data).round(2)
+        df = pd.DataFrame(data).round(2).loc[:, column_order]
         
         if to_file is not None:
-            df.loc[:, column_order].to_csv(to_file, index=False)
+            df.to_csv(to_file, index=False)
     else: 
-        df = pd.read_csv(from_file)
+        df = pd.read_csv(from_file).loc[:, column_order]
+        
+    stats = endpoint_stats()
+    if from_file is None and len(stats):
+        # Traffic of the crawl per market data endpoint
+        print(stats.round(2).to_string())
         
-    return df.loc[:,column_order]
\ No newline at end of file
+    return df
\ No newline at end of file
@@ -1,5 +1,5 @@
-from data_functions import load_data
 from scoring_functions import load_scores
+from derived_metrics import add_derived_metrics, load_derived_metrics, derived_metrics_config
 import json 
 
 def load_stocks_and_scores_data(
@@ -9,9 +9,19 @@ def load_stocks_and_scores_data(
     scores_from_file=None, 
     stocks_to_file=None, 
     scores_to_file=None,
-    merge_scores=True
+    merge_scores=True,
+    checkpoint_dir=None,
+    derived_metrics=None,
+    price_store_dir=None
 ):
-    df = load_data(tickers=tickers, from_file=stocks_from_file, to_file=stocks_to_file).set_index('Ticker')
+    # data_functions pulls in yfinance: only import it when the data is actually loaded
+    from data_functions import load_data
+    
+    df = load_data(
+        tickers=tickers, from_file=stocks_from_file, to_file=stocks_to_file, checkpoint_dir=checkpoint_dir, price_store_dir=price_store_dir
+    ).set_index('Ticker')
+    if derived_metrics:
+        df = add_derived_metrics(df, derived_metrics)
     df_scores = load_scores(df, metrics, from_file=scores_from_file, to_file=scores_to_file, return_merged=merge_scores)
     
     if merge_scores:
@@ -19,12 +29,20 @@ def load_stocks_and_scores_data(
     else:
         df_global_scores,df_sector_scores = df_scores
         return df, df_global_scores, df_sector_scores
+    
+def order_score_columns(global_scores_df, sector_scores_df):
+    # Move 'Sector' and the aggregated score in front of the single metric scores
+    global_scores_df = global_scores_df.loc[:,['Sector','Overall_Score'] + list(global_scores_df.columns[:-2])]
+    sector_scores_df = sector_scores_df.loc[:,['Sector','Sector_Score'] + list(sector_scores_df.columns[:-2])]
+    return global_scores_df, sector_scores_df
         
     
 if __name__ == '__main__':
     
     stocks_file_name = "./data/stocks_universe.csv"
     scores_file_name = "./data/stocks_scores.csv"
+    checkpoint_dir = "./data/crawl"
+    price_store_dir = "./data/prices"
     metrics_config_file_name = "./metrics_config/default_metrics.json"
     
     try: 
@@ -39,7 +57,9 @@ if __name__ == '__main__':
         
     with open(metrics_config_file_name, 'r') as f:
         metrics = json.load(f)
+    derived_metrics = load_derived_metrics()
+    metrics.update({k: v for k, v in derived_metrics_config(derived_metrics).items() if k not in metrics})
     
-    df,df_scores = load_stocks_and_scores_data(metrics, tickers, None, None, stocks_file_name, scores_file_name, True)
+    df,df_scores = load_stocks_and_scores_data(metrics, tickers, None, None, stocks_file_name, scores_file_name, True, checkpoint_dir, derived_metrics, price_store_dir)
     
     print(df.columns)
\ No newline at end of file
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import re
+from graphlib import TopologicalSorter, CycleError
+import numpy as np
+import pandas as pd
+
+DERIVED_METRICS_FILE = "./metrics_config/derived_metrics.json"
+
+NAME_PATTERN = re.compile(r"`([^`]+)`|\b([A-Za-z_][A-Za-z0-9_]*)\b")
+# Bare names that are not columns: the functions and keywords of DataFrame.eval
+EXPRESSION_NAMES = {
+    'sin', 'cos', 'exp', 'log', 'expm1', 'log1p', 'sqrt', 'sinh', 'cosh', 'tanh', 'arcsin', 'arccos', 'arctan',
+    'arccosh', 'arcsinh', 'arctanh', 'abs', 'log10', 'floor', 'ceil', 'arctan2',
+    'and', 'or', 'not', 'in', 'True', 'False',
+}
+
+# Last computed values of every derived metric, keyed by the hash of its inputs
+_node_cache = {}
+
+
+def load_derived_metrics(file_name=DERIVED_METRICS_FILE):
+    """
+    Loads the derived metrics registry: a dictionary mapping every derived metric to its 'expression'
+    (a pandas expression over stock columns and other derived metrics, with backticks around names
+    that are not identifiers) and, for scored metrics, its 'preference', 'weight' and 'penalize_negative'.
+
+    Returns an empty registry if the file does not exist.
+    """
+    try:
+        with open(file_name, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def derived_metrics_config(derived):
+    """
+    Returns the scoring configuration of the derived metrics that have a weight, in the format of
+    the metrics configuration files.
+    """
+    return {
+        name: {
+            'preference': definition.get('preference', 'high'),
+            'weight': definition['weight'],
+            'penalize_negative': definition.get('penalize_negative', False),
+        }
+        for name, definition in derived.items() if 'weight' in definition
+    }
+
+
+def dependencies(expression, names):
+    """
+    Returns the names (columns or derived metrics) used in an expression, in order of appearance.
+    Bare names that are neither in names nor functions (see EXPRESSION_NAMES) are returned too, so
+    that a misspelled column is reported as unknown.
+    """
+    found = []
+    for quoted, bare in NAME_PATTERN.findall(expression):
+        name = quoted or bare
+        if (quoted or name in names or name not in EXPRESSION_NAMES) and name not in found:
+            found.append(name)
+    return found
+
+
+def evaluation_order(derived, columns):
+    """
+    Resolves the dependencies between derived metrics into a DAG and sorts it topologically.
+
+    Parameters:
+    - derived: The derived metrics registry.
+    - columns: The columns available in the stocks DataFrame.
+
+    Returns:
+    - The list of (name, inputs) of the derived metrics, every metric after its inputs.
+    """
+    names = set(columns) | set(derived)
+    graph = {}
+    for name, definition in derived.items():
+        inputs = dependencies(definition['expression'], names)
+        unknown = [i for i in inputs if i not in names]
+        if unknown:
+            raise ValueError(f"Unknown columns {unknown} in the expression of '{name}'.")
+        graph[name] = [i for i in inputs if i in derived]
+    try:
+        order = list(TopologicalSorter(graph).static_order())
+    except CycleError as e:
+        raise ValueError(f"Circular definition of derived metrics: {' -> '.join(e.args[1])}")
+    return [(name, dependencies(derived[name]['expression'], names)) for name in order]
+
+
+def _hash_column(values):
+    return hashlib.sha1(pd.util.hash_pandas_object(values, index=True).to_numpy().tobytes()).hexdigest()
+
+
+def add_derived_metrics(df, derived):
+    """
+    Evaluates the derived metrics vectorized over the whole universe and adds them to the DataFrame.
+
+    Results are memoized: every derived metric is keyed by its expression and the hashes of its inputs,
+    and only the metrics whose inputs changed (e.g. after a quote refresh) are evaluated again.
+    Infinite values (divisions by zero) are stored as NaN.
+
+    Parameters:
+    - df: The stocks DataFrame, indexed by Ticker.
+    - derived: The derived metrics registry (see load_derived_metrics).
+
+    Returns:
+    - A new DataFrame with the derived metrics as additional columns.
+    """
+    if not derived:
+        return df
+    base_columns = [c for c in df.columns if c not in derived]
+
+    keys, values = {}, {}
+    for name, inputs in evaluation_order(derived, base_columns):
+        expression = derived[name]['expression']
+        input_keys = [keys[i] if i in derived else _hash_column(df[i]) for i in inputs]
+        key = hashlib.sha1("\n".join([expression] + input_keys).encode()).hexdigest()
+        keys[name] = key
+        if name in _node_cache and _node_cache[name][0] == key:
+            values[name] = _node_cache[name][1]
+            continue
+        inputs_df = pd.DataFrame({i: values[i] if i in derived else df[i] for i in inputs}, index=df.index)
+        result = inputs_df.eval(expression) if inputs else pd.eval(expression)
+        result = pd.Series(result, index=df.index, dtype=float).replace([np.inf, -np.inf], np.nan)
+        _node_cache[name] = (key, result)
+        values[name] = result
+
+    derived_df = pd.DataFrame({name: values[name] for name in derived}, index=df.index)
+    return pd.concat([df[base_columns], derived_df], axis=1)
@@ -0,0 +1,510 @@
+import re
+from collections import OrderedDict
+import numpy as np
+
+# Filters are written like: P/E < 15 AND ROE > 0.15 AND Sector in {Technology, Healthcare}
+#
+# - Column names are matched as written (case-insensitive, longest name first), or can be quoted with backticks.
+# - Comparisons: <, <=, >, >=, = (or ==), !=, IN {...}, NOT IN {...}. Both sides can be arithmetic
+#   expressions over columns and numbers, e.g. Price < 0.9 * Target Price.
+# - Numbers accept the suffixes % (divided by 100) and K, M, B, T.
+# - Conditions are combined with AND, OR, NOT and parentheses.
+
+COMPARISON_OPERATORS = ['<=', '>=', '!=', '==', '=', '<', '>']
+ARITHMETIC_OPERATORS = ['+', '-', '*', '/']
+KEYWORDS = {'and': 'AND', 'or': 'OR', 'not': 'NOT', 'in': 'IN', '&&': 'AND', '||': 'OR', '!': 'NOT'}
+NUMBER_SUFFIXES = {'%': 0.01, 'k': 1e3, 'm': 1e6, 'b': 1e9, 't': 1e12}
+NUMBER_PATTERN = re.compile(r"(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?([%kKmMbBtT](?![A-Za-z0-9_]))?")
+WORD_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_.&'-]*")
+MAX_CACHED_MASKS = 256
+
+
+### PARSING
+
+def _tokenize(expression, columns):
+    """
+    Splits a filter expression into (kind, value) tokens.
+    """
+    columns_by_length = sorted(columns, key=len, reverse=True)
+    lower_columns = [c.lower() for c in columns_by_length]
+    tokens = []
+    i = 0
+    while i < len(expression):
+        char = expression[i]
+        if char.isspace():
+            i += 1
+            continue
+        if char == '`':
+            end = expression.find('`', i + 1)
+            if end < 0:
+                raise ValueError(f"Unterminated column name at position {i}.")
+            tokens.append(('column', expression[i + 1:end]))
+            i = end + 1
+            continue
+        if char in '\'"':
+            end = expression.find(char, i + 1)
+            if end < 0:
+                raise ValueError(f"Unterminated string at position {i}.")
+            tokens.append(('string', expression[i + 1:end]))
+            i = end + 1
+            continue
+        if char == '{':
+            end = expression.find('}', i + 1)
+            if end < 0:
+                raise ValueError(f"Unterminated set at position {i}.")
+            tokens.append(('set', tuple(_parse_set_item(item) for item in expression[i + 1:end].split(',') if item.strip())))
+            i = end + 1
+            continue
+
+        # Column names may contain spaces and operator characters ('P/E', '20-Day High/Low'): try them first
+        lower_rest = expression[i:].lower()
+        column = None
+        for name, lower_name in zip(columns_by_length, lower_columns):
+            end = i + len(name)
+            if lower_rest.startswith(lower_name) and not (end < len(expression) and (expression[end].isalnum() or expression[end] == '_')):
+                column = name
+                break
+        if column is not None:
+            tokens.append(('column', column))
+            i += len(column)
+            continue
+
+        operator = next((op for op in COMPARISON_OPERATORS + ['&&', '||'] if expression.startswith(op, i)), None)
+        if operator is not None:
+            tokens.append(('keyword', KEYWORDS[operator]) if operator in KEYWORDS else ('operator', operator))
+            i += len(operator)
+            continue
+        if char in ARITHMETIC_OPERATORS or char in '(),!':
+            tokens.append(('keyword', 'NOT') if char == '!' else ('operator', char))
+            i += 1
+            continue
+
+        match = NUMBER_PATTERN.match(expression, i)
+        if match:
+            tokens.append(('number', _parse_number(match.group(0))))
+            i = match.end()
+            continue
+        match = WORD_PATTERN.match(expression, i)
+        if match:
+            word = match.group(0)
+            if word.lower() in KEYWORDS:
+                tokens.append(('keyword', KEYWORDS[word.lower()]))
+            elif tokens and tokens[-1][0] == 'word':
+                # Unquoted values can have several words: Sector = Consumer Cyclical
+                tokens[-1] = ('word', tokens[-1][1] + ' ' + word)
+            else:
+                tokens.append(('word', word))
+            i = match.end()
+            continue
+        raise ValueError(f"Unexpected character '{char}' at position {i}.")
+    return [('string', value) if kind == 'word' else (kind, value) for kind, value in tokens]
+
+
+def _parse_number(text):
+    factor = NUMBER_SUFFIXES.get(text[-1].lower(), 1.0)
+    if factor != 1.0:
+        text = text[:-1]
+    return float(text) * factor
+
+
+def _parse_set_item(item):
+    item = item.strip().strip('\'"')
+    match = NUMBER_PATTERN.fullmatch(item.lstrip('-'))
+    if match:
+        return -_parse_number(item[1:]) if item.startswith('-') else _parse_number(item)
+    return item
+
+
+class _Parser:
+    """
+    Recursive descent parser producing nested tuples:
+    ('and', children), ('or', children), ('not', child), ('cmp', op, left, right), ('in', operand, values),
+    with operands ('col', name), ('num', value), ('str', value) and ('arith', op, left, right).
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self, offset=0):
+        position = self.position + offset
+        return self.tokens[position] if position < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind is not None and token[0] != kind) or (value is not None and token[1] != value):
+            expected = value or kind or 'a value'
+            raise ValueError(f"Expected {expected} but found {token[1] if token[0] else 'the end of the filter'}.")
+        self.position += 1
+        return token
+
+    def parse(self):
+        node = self.parse_or()
+        if self.peek()[0] is not None:
+            raise ValueError(f"Unexpected '{self.peek()[1]}' in filter.")
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == ('keyword', 'OR'):
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else ('or', tuple(children))
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek() == ('keyword', 'AND'):
+            self.take()
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else ('and', tuple(children))
+
+    def parse_not(self):
+        if self.peek() == ('keyword', 'NOT'):
+            self.take()
+            return ('not', self.parse_not())
+        if self.peek() == ('operator', '('):
+            # Either a parenthesized condition or an arithmetic operand: try the condition first
+            start = self.position
+            condition_error = None
+            try:
+                self.take()
+                node = self.parse_or()
+                self.take('operator', ')')
+                if self.peek()[0] != 'operator' or self.peek()[1] in ('(', ')'):
+                    return node
+            except ValueError as e:
+                condition_error = e
+            self.position = start
+            try:
+                return self.parse_comparison()
+            except ValueError:
+                if condition_error is not None:
+                    raise condition_error
+                raise
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        left = self.parse_sum()
+        negated = self.peek() == ('keyword', 'NOT')
+        if negated:
+            self.take()
+        if self.peek() == ('keyword', 'IN'):
+            self.take()
+            values = self.take('set')[1]
+            node = ('in', left, values)
+            return ('not', node) if negated else node
+        if negated:
+            raise ValueError("Expected IN after NOT.")
+        operator = self.take('operator')[1]
+        if operator not in COMPARISON_OPERATORS:
+            raise ValueError(f"Expected a comparison but found '{operator}'.")
+        right = self.parse_sum()
+        if left[0] == 'str' and right[0] == 'col':
+            left, right = right, left
+        if left[0] == 'str':
+            raise ValueError(f"Unknown column '{left[1]}'.")
+        if right[0] == 'str' and left[0] != 'col':
+            raise ValueError(f"'{right[1]}' can only be compared with a column.")
+        return ('cmp', '=' if operator == '==' else operator, left, right)
+
+    def parse_sum(self):
+        node = self.parse_product()
+        while self.peek() in (('operator', '+'), ('operator', '-')):
+            node = ('arith', self.take()[1], node, self.parse_product())
+        return node
+
+    def parse_product(self):
+        node = self.parse_unary()
+        while self.peek() in (('operator', '*'), ('operator', '/')):
+            node = ('arith', self.take()[1], node, self.parse_unary())
+        return node
+
+    def parse_unary(self):
+        if self.peek() == ('operator', '-'):
+            self.take()
+            operand = self.parse_unary()
+            return ('num', -operand[1]) if operand[0] == 'num' else ('arith', '*', ('num', -1.0), operand)
+        return self.parse_primary()
+
+    def parse_primary(self):
+        kind, value = self.take()
+        if kind == 'number':
+            return ('num', value)
+        if kind == 'column':
+            return ('col', value)
+        if kind == 'string':
+            return ('str', value)
+        if (kind, value) == ('operator', '('):
+            node = self.parse_sum()
+            self.take('operator', ')')
+            return node
+        raise ValueError(f"Unexpected '{value}' in filter.")
+
+
+def _canonical(node):
+    """
+    Canonical form of a node, used as the mask cache key: AND/OR children are sorted, so that
+    'A AND B' and 'B AND A' share the same cached mask.
+    """
+    if node[0] in ('and', 'or'):
+        children = tuple(sorted({_canonical(child) for child in node[1]}, key=repr))
+        return (node[0], children) if len(children) > 1 else children[0]
+    if node[0] == 'not':
+        return ('not', _canonical(node[1]))
+    if node[0] == 'in':
+        return ('in', node[1], tuple(sorted(set(node[2]), key=repr)))
+    return node
+
+
+def text_columns(df):
+    """
+    Returns the columns of df that are filtered as text (all the non-numeric ones).
+    """
+    return list(df.select_dtypes(exclude='number').columns)
+
+
+def _check_number(node, text):
+    # Operands of arithmetic and of the comparisons with numbers must be numbers
+    if node[0] == 'str' or (node[0] == 'col' and node[1] in text):
+        raise ValueError(f"'{node[1]}' is not a number.")
+    if node[0] == 'arith':
+        _check_number(node[2], text)
+        _check_number(node[3], text)
+
+
+def _check_types(node, text):
+    """
+    Checks the types of the operands of a parsed filter, as _evaluate will combine them.
+    """
+    kind = node[0]
+    if kind in ('and', 'or'):
+        for child in node[1]:
+            _check_types(child, text)
+    elif kind == 'not':
+        _check_types(node[1], text)
+    elif kind == 'in':
+        operand, values = node[1], node[2]
+        if operand[0] == 'col' and operand[1] in text:
+            return
+        _check_number(operand, text)
+        for value in values:
+            if isinstance(value, str):
+                raise ValueError(f"'{value}' is not a number.")
+    else:
+        _, operator, left, right = node
+        if left[0] in ('num', 'str') and right[0] == 'col':
+            operator, left, right = FLIPPED[operator], right, left
+        if left[0] == 'col' and left[1] in text and right[0] in ('str', 'num'):
+            if operator not in ('=', '!='):
+                raise ValueError(f"Only = and != can compare '{left[1]}' with text.")
+        elif left[0] == 'col' and left[1] in text:
+            raise ValueError(f"'{left[1]}' can only be compared with a value (quote the values containing operators).")
+        else:
+            _check_number(left, text)
+            _check_number(right, text)
+
+
+def compile_filter(expression, columns, text=None):
+    """
+    Parses a filter expression against the given column names.
+
+    Parameters:
+    - expression: The filter expression.
+    - columns: The column names.
+    - text: The text columns among them (see text_columns). When given, the types of the operands are
+      checked too, so that evaluate_filter cannot fail on the compiled filter.
+
+    Returns:
+    - The compiled filter, to be evaluated with evaluate_filter. Raises ValueError if the expression is invalid.
+    """
+    tokens = _tokenize(expression, columns)
+    if not tokens:
+        raise ValueError("Empty filter.")
+    node = _canonical(_Parser(tokens).parse())
+    for column in _node_columns(node):
+        if column not in columns:
+            raise ValueError(f"Unknown column '{column}'.")
+    if text is not None:
+        _check_types(node, set(text))
+    return node
+
+
+def _node_columns(node):
+    kind = node[0]
+    if kind == 'col':
+        yield node[1]
+    elif kind in ('and', 'or'):
+        for child in node[1]:
+            yield from _node_columns(child)
+    elif kind in ('not', 'in'):
+        yield from _node_columns(node[1])
+    elif kind in ('cmp', 'arith'):
+        yield from _node_columns(node[2])
+        yield from _node_columns(node[3])
+
+
+### INDEXES
+
+def build_filter_index(df):
+    """
+    Precomputes, for every numeric column of df, the row positions sorted by value (NaNs excluded), so that
+    range conditions become a binary search and a scatter into a bitmap. Text columns get one bitmap per
+    value, built on first use. Masks of evaluated sub-expressions are cached in the index.
+    """
+    index = {'n_rows': len(df), 'numeric': {}, 'text': {}, 'masks': OrderedDict()}
+    for column in df.select_dtypes(include='number').columns:
+        values = df[column].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        order = np.flatnonzero(valid)
+        order = order[np.argsort(values[order], kind='stable')]
+        index['numeric'][column] = {'order': order, 'sorted': values[order], 'valid': valid}
+    for column in text_columns(df):
+        codes, uniques = df[column].map(lambda v: v.lower() if isinstance(v, str) else None).factorize()
+        index['text'][column] = {'codes': codes, 'values': {v: i for i, v in enumerate(uniques)}, 'bitmaps': {}}
+    return index
+
+
+def _pack(mask):
+    return np.packbits(mask)
+
+
+def _unpack(bitmap, n_rows):
+    return np.unpackbits(bitmap, count=n_rows).astype(bool)
+
+
+def _range_bitmap(column_index, n_rows, ranges):
+    """
+    Bitmap of the rows whose sorted positions fall in the given [start, end) ranges.
+    """
+    order = column_index['order']
+    selected = sum(end - start for start, end in ranges)
+    if selected * 2 <= len(order):
+        mask = np.zeros(n_rows, dtype=bool)
+        for start, end in ranges:
+            mask[order[start:end]] = True
+    else:
+        # Cheaper to clear the complement from the valid rows
+        mask = column_index['valid'].copy()
+        previous = 0
+        for start, end in sorted(ranges) + [(len(order), len(order))]:
+            mask[order[previous:start]] = False
+            previous = max(previous, end)
+    return _pack(mask)
+
+
+def _indexed_comparison(column_index, n_rows, operator, value):
+    sorted_values = column_index['sorted']
+    left = np.searchsorted(sorted_values, value, side='left')
+    right = np.searchsorted(sorted_values, value, side='right')
+    n_valid = len(sorted_values)
+    ranges = {
+        '<': [(0, left)],
+        '<=': [(0, right)],
+        '>': [(right, n_valid)],
+        '>=': [(left, n_valid)],
+        '=': [(left, right)],
+        '!=': [(0, left), (right, n_valid)],
+    }[operator]
+    return _range_bitmap(column_index, n_rows, ranges)
+
+
+def _value_bitmap(index, column, value):
+    """
+    Bitmap of the rows of a text column equal to value (case-insensitive).
+    """
+    column_index = index['text'][column]
+    value = str(value).lower()
+    if value not in column_index['bitmaps']:
+        code = column_index['values'].get(value, -2)
+        column_index['bitmaps'][value] = _pack(column_index['codes'] == code)
+    return column_index['bitmaps'][value]
+
+
+### EVALUATION
+
+FLIPPED = {'<': '>', '<=': '>=', '>': '<', '>=': '<=', '=': '=', '!=': '!='}
+NUMPY_COMPARISONS = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal, '=': np.equal, '!=': np.not_equal}
+NUMPY_ARITHMETIC = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide}
+
+
+def _operand_values(df, node):
+    if node[0] == 'num':
+        return node[1]
+    if node[0] == 'col':
+        return df[node[1]].to_numpy(dtype=float)
+    if node[0] == 'arith':
+        return NUMPY_ARITHMETIC[node[1]](_operand_values(df, node[2]), _operand_values(df, node[3]))
+    raise ValueError(f"'{node[1]}' is not a number.")
+
+
+def _evaluate(node, df, index):
+    masks = index['masks']
+    if node in masks:
+        masks.move_to_end(node)
+        return masks[node]
+
+    n_rows = index['n_rows']
+    kind = node[0]
+    if kind == 'and' or kind == 'or':
+        # Cached children first, so that an empty AND can stop early
+        children = sorted(node[1], key=lambda child: child not in masks)
+        bitmap = _evaluate(children[0], df, index).copy()
+        for child in children[1:]:
+            if kind == 'and':
+                if not bitmap.any():
+                    break
+                np.bitwise_and(bitmap, _evaluate(child, df, index), out=bitmap)
+            else:
+                np.bitwise_or(bitmap, _evaluate(child, df, index), out=bitmap)
+    elif kind == 'not':
+        bitmap = _pack(~_unpack(_evaluate(node[1], df, index), n_rows))
+    elif kind == 'in':
+        operand, values = node[1], node[2]
+        bitmap = np.zeros((n_rows + 7) // 8, dtype=np.uint8)
+        for value in values:
+            np.bitwise_or(bitmap, _evaluate(('cmp', '=', operand, ('str', value) if isinstance(value, str) else ('num', value)), df, index), out=bitmap)
+    else:
+        _, operator, left, right = node
+        if left[0] in ('num', 'str') and right[0] == 'col':
+            operator, left, right = FLIPPED[operator], right, left
+        if left[0] == 'col' and right[0] == 'num' and left[1] in index['numeric']:
+            bitmap = _indexed_comparison(index['numeric'][left[1]], n_rows, operator, right[1])
+        elif left[0] == 'col' and left[1] in index['text'] and right[0] in ('str', 'num'):
+            if operator not in ('=', '!='):
+                raise ValueError(f"Only = and != can compare '{left[1]}' with text.")
+            bitmap = _value_bitmap(index, left[1], right[1])
+            if operator == '!=':
+                bitmap = _pack(~_unpack(bitmap, n_rows))
+        else:
+            # General case: evaluate both sides over the whole columns at once
+            with np.errstate(divide='ignore', invalid='ignore'):
+                left_values, right_values = _operand_values(df, left), _operand_values(df, right)
+                # Missing values never match, as with the indexed comparisons
+                mask = NUMPY_COMPARISONS[operator](left_values, right_values) & ~(np.isnan(left_values) | np.isnan(right_values))
+            bitmap = _pack(np.broadcast_to(mask, (n_rows,)))
+
+    masks[node] = bitmap
+    if len(masks) > MAX_CACHED_MASKS:
+        masks.popitem(last=False)
+    return bitmap
+
+
+def evaluate_filter(compiled, df, index=None):
+    """
+    Evaluates a compiled filter over df, using (and filling) the masks cached in index.
+
+    Parameters:
+    - compiled: The output of compile_filter.
+    - df: The DataFrame the index was built from.
+    - index: The output of build_filter_index(df); built on the fly if None.
+
+    Returns:
+    - A boolean numpy array, True for the rows matching the filter.
+    """
+    if index is None:
+        index = build_filter_index(df)
+    return _unpack(_evaluate(compiled, df, index), index['n_rows'])
+
+
+def filter_rows(df, expression, index=None):
+    return df.loc[evaluate_filter(compile_filter(expression, df.columns), df, index)]
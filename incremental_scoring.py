@@ -0,0 +1,376 @@
+"""
+Incremental scoring: the scores of scoring_functions.get_scores kept up to date when the metrics of
+a few tickers change, by patching the sorted values of every metric instead of ranking it again.
+
+Usage:
+    python incremental_scoring.py self-check
+"""
+import numpy as np
+import pandas as pd
+from scoring_functions import scored_metrics
+
+# Above this fraction of changed tickers, the changed metrics are sorted again instead of patched
+BULK_UPDATE_FRACTION = 0.1
+
+
+def _group_codes(values, group_names):
+    codes = np.full(len(values), -1, dtype=np.int64)
+    for i, value in enumerate(values):
+        if isinstance(value, str):
+            if value not in group_names:
+                group_names[value] = len(group_names)
+            codes[i] = group_names[value]
+    return codes
+
+
+def _sorted_values(values, rows):
+    """
+    Returns the valid values of the given rows sorted, with the rows in the same order.
+    """
+    order = rows[np.argsort(values[rows], kind='stable')]
+    return values[order], order
+
+
+def _percentiles(sorted_values, values):
+    """
+    Percentile ranks of values within sorted_values, computed exactly as pandas/scipy do with
+    method='average': (number of smaller values + (number of equal values + 1) / 2) / count * 100.
+    """
+    lower = np.searchsorted(sorted_values, values, side='left')
+    upper = np.searchsorted(sorted_values, values, side='right')
+    ranks = lower + (upper - lower + 1) / 2
+    return ranks / len(sorted_values) * 100
+
+
+def _is_valid(values, penalize_negative):
+    valid = ~np.isnan(values)
+    if penalize_negative:
+        valid &= values >= 0
+    return valid
+
+
+def _final_percentiles(sorted_values, values, preference, penalize_negative, in_group=True, percentiles=_percentiles):
+    """
+    Percentiles of the given values after the preference and the negative penalty are applied,
+    as in calculate_scores: NaN for missing values, 0 for penalized negative values.
+
+    percentiles(sorted_values, values) computes the percentile ranks: exact ones by default, or
+    those of a sketch (quantile_sketch passes its cdf and sketch_percentiles).
+    """
+    result = np.full(len(values), np.nan)
+    valid = _is_valid(values, penalize_negative) & in_group
+    if valid.any():
+        result[valid] = percentiles(sorted_values, values[valid])
+        if preference == 'low':
+            result[valid] = 100 - result[valid]
+    if penalize_negative:
+        result[values < 0] = 0
+    return result
+
+
+def _update_sorted(sorted_values, order, removed_rows, removed_values, added_rows, values):
+    """
+    Removes the entries of removed_rows (found by bisecting their old values) from a sorted array
+    and inserts added_rows at their sorted position, without sorting the whole array again.
+    """
+    if len(removed_rows):
+        lower = np.searchsorted(sorted_values, removed_values, side='left')
+        upper = np.searchsorted(sorted_values, removed_values, side='right')
+        positions = [start + np.flatnonzero(order[start:end] == row)[0] for row, start, end in zip(removed_rows, lower, upper)]
+        sorted_values, order = np.delete(sorted_values, positions), np.delete(order, positions)
+    if len(added_rows):
+        added_rows = added_rows[np.argsort(values[added_rows], kind='stable')]
+        positions = np.searchsorted(sorted_values, values[added_rows], side='left')
+        sorted_values = np.insert(sorted_values, positions, values[added_rows])
+        order = np.insert(order, positions, added_rows)
+    return sorted_values, order
+
+
+def _rows_in_ranges(sorted_values, order, low, high):
+    """
+    Returns the rows whose value lies in any of the [low, high] intervals.
+    """
+    starts = np.searchsorted(sorted_values, low, side='left')
+    ends = np.searchsorted(sorted_values, high, side='right')
+    if not len(starts):
+        return np.empty(0, dtype=order.dtype)
+    return np.unique(np.concatenate([order[start:end] for start, end in zip(starts, ends)]))
+
+
+def _score_metric(state, j):
+    """
+    Sorts the values of the j-th metric, globally and by sector, and computes all its percentiles.
+    """
+    _, config = state['metrics'][j]
+    values = state['values'][:, j]
+    penalize_negative = config.get('penalize_negative', False)
+    all_rows = np.arange(len(values))
+    sorted_values, order = _sorted_values(values, all_rows[_is_valid(values, penalize_negative)])
+    state['global'][j] = (sorted_values, order)
+    state['global_pct'][:, j] = _final_percentiles(sorted_values, values, config['preference'], penalize_negative)
+
+    groups = {}
+    for code in range(len(state['group_names'])):
+        rows = all_rows[state['groups'] == code]
+        groups[code] = _sorted_values(values, rows[_is_valid(values[rows], penalize_negative)])
+        state['sector_pct'][rows, j] = _final_percentiles(groups[code][0], values[rows], config['preference'], penalize_negative)
+    state['sector'][j] = groups
+    no_group = all_rows[state['groups'] < 0]
+    state['sector_pct'][no_group, j] = _final_percentiles(None, values[no_group], config['preference'], penalize_negative, in_group=False)
+
+
+def build_score_state(df, metrics, group_column='Sector'):
+    """
+    Scores the DataFrame like get_scores and keeps, for every metric, the sorted valid values of the
+    whole universe and of every sector, so that the scores can then be updated incrementally with
+    update_score_state when a few tickers change.
+
+    Parameters:
+    - df: The stocks DataFrame, indexed by Ticker.
+    - metrics: The metrics configuration.
+    - group_column: The column defining the groups of the sector scores.
+
+    Returns:
+    - A dictionary holding the sorted arrays, the percentiles and the scores DataFrame ('scores'),
+      equal to get_scores(df, metrics).
+    """
+    df_ = df.set_index('Ticker') if 'Ticker' in df.columns else df
+    if group_column not in df_.columns:
+        raise ValueError(f"The DataFrame must contain a '{group_column}' column to calculate {group_column.lower()}-specific scores.")
+
+    # The configurations are copied: the state is only valid for the metrics it was built with
+    scored = [(metric, dict(config)) for metric, config in scored_metrics(df_, metrics)]
+    group_names = {}
+    state = {
+        'metrics': scored,
+        'group_column': group_column,
+        'index': df_.index,
+        'positions': {ticker: i for i, ticker in enumerate(df_.index)},
+        'values': np.column_stack([df_[metric].to_numpy(dtype=float) for metric, _ in scored]) if scored else np.empty((len(df_), 0)),
+        'group_names': group_names,
+        'groups': _group_codes(df_[group_column].tolist(), group_names),
+        'group_values': df_[group_column].to_numpy(dtype=object).copy(),
+        'global': [],
+        'sector': [],
+    }
+    n = len(df_)
+    state['global_pct'] = np.full((n, len(scored)), np.nan)
+    state['sector_pct'] = np.full((n, len(scored)), np.nan)
+    state['global'] = [None] * len(scored)
+    state['sector'] = [None] * len(scored)
+    for j in range(len(scored)):
+        _score_metric(state, j)
+
+    state['scores'] = _score_rows(state, np.arange(n))
+    return state
+
+
+def scores_from_percentiles(index, metrics, global_pct, sector_pct, group_values, group_column='Sector'):
+    """
+    Builds get_scores rows from the unweighted percentiles of every scored metric, with the same
+    operations (weighting, row sums, unweighting, rounding) as calculate_scores and calculate_group_scores.
+
+    Parameters:
+    - index: The tickers of the rows.
+    - metrics: The scored (metric, config) pairs, in the order of the percentile columns.
+    - global_pct, sector_pct: The global and group percentiles, one row per ticker and one column per metric.
+    - group_values: The group (sector) of every row.
+    - group_column: The column defining the groups of the sector scores.
+    """
+    metric_names = [metric for metric, _ in metrics]
+    metric_weights = np.array([config['weight'] for _, config in metrics], dtype=float)
+    total_weight = sum(config['weight'] for _, config in metrics)
+
+    weighted = global_pct * metric_weights
+    overall = pd.DataFrame(weighted, index=index).sum(axis=1).to_numpy() / total_weight
+    weighted_group = sector_pct * metric_weights
+    group_score = pd.DataFrame(weighted_group, index=index).sum(axis=1).to_numpy() / total_weight
+
+    columns = {metric + '_Score': values for metric, values in zip(metric_names, (weighted / metric_weights).round(2).T)}
+    columns['Overall_Score'] = overall.round(2)
+    suffix = f'_{group_column}_Score'
+    unweighted_group = (weighted_group / metric_weights).round(2).T
+    columns.update({metric + suffix: values for metric, values in zip(metric_names, unweighted_group)})
+    columns[f'{group_column}_Score'] = group_score.round(2)
+    columns[group_column] = group_values
+    return pd.DataFrame(columns, index=index)
+
+
+def _score_rows(state, rows):
+    return scores_from_percentiles(
+        state['index'][rows], state['metrics'], state['global_pct'][rows], state['sector_pct'][rows],
+        state['group_values'][rows], state['group_column']
+    )
+
+
+def update_score_state(state, changed_df):
+    """
+    Updates the scores after the metric values (or the sector) of some tickers changed.
+
+    For every metric, the old values of the changed tickers are removed from the sorted arrays and
+    the new ones inserted. Only the percentiles that can have moved are recomputed: those of the
+    values between the old and the new value of a changed ticker, or of the whole universe/sector
+    when its number of valid values changed. The scores of the affected rows are then patched in
+    state['scores'], which stays equal to a full get_scores of the updated universe.
+
+    Parameters:
+    - state: The state returned by build_score_state.
+    - changed_df: The new rows of the changed tickers, indexed by Ticker. Columns that are not
+      given keep their previous values.
+
+    Returns:
+    - The positions of the rows whose scores were recomputed.
+    """
+    changed_df = changed_df.set_index('Ticker') if 'Ticker' in changed_df.columns else changed_df
+    unknown = [t for t in changed_df.index if t not in state['positions']]
+    if unknown:
+        raise ValueError(f"Unknown tickers {unknown[:5]}: new tickers need a full scoring with build_score_state.")
+    rows = np.fromiter((state['positions'][t] for t in changed_df.index), dtype=np.int64, count=len(changed_df))
+    if not len(rows):
+        return rows
+
+    group_column = state['group_column']
+    old_groups = state['groups'][rows].copy()
+    if group_column in changed_df.columns:
+        new_group_values = changed_df[group_column].to_numpy(dtype=object)
+        state['group_values'][rows] = new_group_values
+        state['groups'][rows] = _group_codes(new_group_values.tolist(), state['group_names'])
+    new_groups = state['groups'][rows]
+    sector_unchanged = (old_groups == new_groups).all()
+
+    affected = [rows]
+    for j, (metric, config) in enumerate(state['metrics']):
+        values = state['values'][:, j]
+        old_values = values[rows].copy()
+        if metric in changed_df.columns:
+            values[rows] = changed_df[metric].to_numpy(dtype=float)
+        new_values = values[rows]
+        penalize_negative = config.get('penalize_negative', False)
+        same_values = (old_values == new_values) | (np.isnan(old_values) & np.isnan(new_values))
+        if same_values.all() and sector_unchanged:
+            continue
+        if len(rows) > len(values) * BULK_UPDATE_FRACTION:
+            # Most of the universe changed (e.g. a quote refresh): sorting again is cheaper than patching
+            _score_metric(state, j)
+            affected.append(np.arange(len(values)))
+            continue
+        old_valid = _is_valid(old_values, penalize_negative)
+        new_valid = _is_valid(new_values, penalize_negative)
+
+        # Global percentiles
+        sorted_values, order = state['global'][j]
+        moved = (old_valid != new_valid) | (old_values != new_values)
+        sorted_values, order = _update_sorted(
+            sorted_values, order, rows[old_valid & moved], old_values[old_valid & moved], rows[new_valid & moved], values
+        )
+        state['global'][j] = (sorted_values, order)
+        if (old_valid != new_valid).any():
+            # The number of valid values changed: all the percentiles move
+            metric_rows = np.arange(len(values))
+        else:
+            both = moved & old_valid & new_valid
+            metric_rows = np.union1d(rows, _rows_in_ranges(
+                sorted_values, order, np.minimum(old_values[both], new_values[both]), np.maximum(old_values[both], new_values[both])
+            ))
+        state['global_pct'][metric_rows, j] = _final_percentiles(sorted_values, values[metric_rows], config['preference'], penalize_negative)
+        affected.append(metric_rows)
+
+        # Sector percentiles: a changed ticker can also move to another sector
+        groups = state['sector'][j]
+        for code in np.unique(np.concatenate([old_groups, new_groups])):
+            if code < 0:
+                continue
+            was_in, is_in = (old_groups == code) & old_valid, (new_groups == code) & new_valid
+            moved_in_group = (was_in != is_in) | (old_values != new_values)
+            sorted_values, order = groups.get(code, (np.empty(0), np.empty(0, dtype=np.int64)))
+            sorted_values, order = _update_sorted(
+                sorted_values, order, rows[was_in & moved_in_group], old_values[was_in & moved_in_group], rows[is_in & moved_in_group], values
+            )
+            groups[code] = (sorted_values, order)
+            if (was_in != is_in).any():
+                # Rows entered or left the sector: its count changed, all its percentiles move
+                group_rows = np.flatnonzero(state['groups'] == code)
+            else:
+                both = moved_in_group & was_in & is_in
+                group_rows = _rows_in_ranges(
+                    sorted_values, order, np.minimum(old_values[both], new_values[both]), np.maximum(old_values[both], new_values[both])
+                )
+            group_rows = np.union1d(group_rows, rows[new_groups == code])
+            state['sector_pct'][group_rows, j] = _final_percentiles(sorted_values, values[group_rows], config['preference'], penalize_negative)
+            affected.append(group_rows)
+        no_group = rows[new_groups < 0]
+        state['sector_pct'][no_group, j] = _final_percentiles(None, values[no_group], config['preference'], penalize_negative, in_group=False)
+
+    affected = np.unique(np.concatenate(affected))
+    scores = state['scores']
+    if len(affected) > len(scores) // 2:
+        state['scores'] = _score_rows(state, np.arange(len(scores)))
+    else:
+        patch = _score_rows(state, affected)
+        numeric_columns = [scores.columns.get_loc(c) for c in patch.columns if c != group_column]
+        scores.iloc[affected, numeric_columns] = patch.drop(columns=group_column).to_numpy(dtype=float)
+        scores.iloc[affected, scores.columns.get_loc(group_column)] = patch[group_column].to_numpy(dtype=object)
+    return affected
+
+
+def self_check(n_tickers=3000, n_steps=60, seed=0):
+    """
+    Applies random update sequences (quote refreshes, NaNs, sign changes, ties, sector changes) and
+    checks that the incremental scores are exactly those of a full get_scores after every step.
+    """
+    import json
+    import time
+    from benchmarks.synthetic import make_universe
+    from scoring_functions import get_scores
+
+    with open("./metrics_config/default_metrics.json", 'r') as f:
+        metrics = json.load(f)
+
+    rng = np.random.default_rng(seed)
+    df = make_universe(n_tickers, seed=3).set_index('Ticker')
+    state = build_score_state(df, metrics)
+    pd.testing.assert_frame_equal(state['scores'], get_scores(df, metrics), check_exact=True)
+
+    numeric_columns = [metric for metric, _ in state['metrics']]
+    sectors = df['Sector'].unique().tolist() + ['New Sector', np.nan]
+    for step in range(n_steps):
+        n_changed = len(df) if step % 20 == 19 else rng.integers(1, 40)
+        tickers = rng.choice(df.index, size=n_changed, replace=False)
+        changed = df.loc[tickers].copy()
+        # Most steps look like a quote refresh (values move a little), the others also change
+        # the valid values: NaN, sign changes, ties with other tickers and sector changes
+        structural = step % 3 == 0
+        for metric in rng.choice(numeric_columns, size=rng.integers(1, len(numeric_columns)), replace=False):
+            values = changed[metric].to_numpy(dtype=float)
+            if not structural:
+                changed[metric] = values * rng.uniform(0.97, 1.03, size=len(values))
+                continue
+            kind = rng.integers(0, 4, size=len(values))
+            values = np.where(kind == 0, rng.normal(0, 50, size=len(values)), values)
+            values = np.where(kind == 1, np.nan, values)
+            values = np.where(kind == 2, rng.choice(df[metric].to_numpy(dtype=float), size=len(values)), values)
+            changed[metric] = values
+        if structural and step % 2 == 0:
+            changed['Sector'] = rng.choice(np.array(sectors, dtype=object), size=len(changed))
+        df.loc[changed.index, changed.columns] = changed
+
+        start = time.perf_counter()
+        affected = update_score_state(state, changed)
+        incremental_time = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = get_scores(df, metrics)
+        full_time = time.perf_counter() - start
+        pd.testing.assert_frame_equal(state['scores'], expected, check_exact=True)
+        if step % 10 < 2 or n_changed == len(df):
+            print(f"step {step}{' (structural)' if structural else ''}: {len(changed)} changed, {len(affected)} rescored, "
+                  f"incremental {incremental_time * 1000:.1f} ms, full {full_time * 1000:.1f} ms")
+    print("Incremental scores match get_scores")
+
+
+if __name__ == '__main__':
+    import sys
+
+    if sys.argv[1:] != ['self-check']:
+        print(__doc__)
+    else:
+        self_check()
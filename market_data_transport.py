@@ -0,0 +1,240 @@
+"""
+Shared HTTP transport of the market data calls (yfinance): one keep-alive session per process with a
+pool of connections, coalescing of concurrent identical requests and per-endpoint statistics.
+
+Every yf.Ticker and yf.download call made with session=get_session() reuses the pooled connections
+instead of opening new ones. Concurrent GET requests for the same URL and parameters (e.g. the same
+ticker and endpoint requested by two threads) share one response.
+
+Usage:
+    python market_data_transport.py self-check
+"""
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit, unquote
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+POOL_SIZE = 32
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+# Last path segments that are symbols (AAPL, BRK-B, ^GSPC, EURUSD=X): grouped into one endpoint
+SYMBOL_PATTERN = re.compile(r"^[A-Z0-9^][A-Z0-9^.=\-]*$")
+
+_session = {'pid': None, 'session': None}
+_session_lock = threading.Lock()
+
+
+def endpoint(url):
+    """
+    Returns the endpoint of a URL, the host and the path with the symbol replaced by {symbol}:
+    'query2.finance.yahoo.com/v10/finance/quoteSummary/{symbol}'.
+    """
+    parts = urlsplit(url)
+    segments = unquote(parts.path).rstrip('/').split('/')
+    if len(segments) > 2 and SYMBOL_PATTERN.match(segments[-1]):
+        segments[-1] = '{symbol}'
+    return parts.netloc + '/'.join(segments)
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class MarketDataSession(requests.Session):
+    """
+    A requests session with a pool of pool_size keep-alive connections per host, retries with
+    backoff on throttling and server errors, coalescing of concurrent identical GET requests and
+    per-endpoint statistics (see endpoint_stats).
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, retries=RETRIES):
+        super().__init__()
+        retry = Retry(total=retries, backoff_factor=BACKOFF_FACTOR, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=['GET', 'HEAD'], respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.hooks['response'].append(self._record)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.stats = {}
+
+    def _endpoint_stats(self, url):
+        # With the lock held
+        return self.stats.setdefault(endpoint(url), {'requests': 0, 'coalesced': 0, 'errors': 0, 'bytes': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+
+    def _record(self, response, *args, **kwargs):
+        # Response hook: called once per response received (after the redirects and the retries)
+        size = len(response.content)
+        seconds = response.elapsed.total_seconds()
+        with self._lock:
+            stats = self._endpoint_stats(response.request.url)
+            stats['requests'] += 1
+            stats['errors'] += response.status_code >= 400
+            stats['bytes'] += size
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        return response
+
+    def request(self, method, url, params=None, **kwargs):
+        if method.upper() != 'GET':
+            return super().request(method, url, params=params, **kwargs)
+
+        key = (url, _freeze(params), _freeze(kwargs.get('cookies')))
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = {'done': threading.Event(), 'response': None, 'error': None}
+        if not leader:
+            call['done'].wait()
+            with self._lock:
+                self._endpoint_stats(url)['coalesced'] += 1
+            if call['error'] is not None:
+                raise call['error']
+            return call['response']
+
+        try:
+            # The body is read (by the statistics hook) before the response is shared
+            call['response'] = super().request(method, url, params=params, **kwargs)
+            return call['response']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call['done'].set()
+
+
+def get_session():
+    """
+    Returns the market data session of the process, created on first use (and again in a forked
+    child process, which must not share the connections of its parent).
+    """
+    with _session_lock:
+        if _session['session'] is None or _session['pid'] != os.getpid():
+            _session['session'] = MarketDataSession()
+            _session['pid'] = os.getpid()
+        return _session['session']
+
+
+def endpoint_stats(session=None):
+    """
+    Returns the statistics of a session (the shared one if None), one row per endpoint: requests
+    sent, requests served by an identical request in flight, errors, MB received and latencies.
+    """
+    session = session or get_session()
+    with session._lock:
+        stats = {name: dict(values) for name, values in session.stats.items()}
+    df = pd.DataFrame.from_dict(stats, orient='index', columns=['requests', 'coalesced', 'errors', 'bytes', 'seconds', 'max_seconds'])
+    return pd.DataFrame({
+        'Requests': df['requests'],
+        'Coalesced': df['coalesced'],
+        'Errors': df['errors'],
+        'MB': df['bytes'] / 2 ** 20,
+        'Mean (ms)': df['seconds'] / df['requests'].clip(lower=1) * 1000,
+        'Max (ms)': df['max_seconds'] * 1000,
+    }).rename_axis('Endpoint').sort_values('MB', ascending=False)
+
+
+def self_check():
+    """
+    Runs the session against a local HTTP server standing in for the market data API: connections
+    are reused, concurrent identical requests are coalesced and the statistics match the traffic.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import json
+
+    served = {'requests': 0, 'connections': set(), 'failures': 1}
+    served_lock = threading.Lock()
+
+    class StandIn(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            with served_lock:
+                served['requests'] += 1
+                served['connections'].add(self.client_address)
+                fail = self.path.startswith('/v7/finance/quote') and served['failures'] > 0
+                served['failures'] -= fail
+            if fail:
+                # Throttled once: retried by the session
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            time.sleep(0.05)
+            body = json.dumps({'path': self.path, 'padding': 'x' * 1000}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    session = MarketDataSession(pool_size=8)
+
+    # 8 threads x 5 tickers x 2 endpoints, every request made by the 8 threads at the same time
+    requests_made = [
+        (f"{base}/v10/finance/quoteSummary/{ticker}", {'modules': 'financialData'}) if kind == 0 else
+        (f"{base}/v8/finance/chart/{ticker}", {'range': '1y', 'interval': '1d'})
+        for ticker in ['AAPL', 'MSFT', 'BRK-B', '^GSPC', 'NVDA'] for kind in range(2)
+    ]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(8) as pool:
+        for url, params in requests_made:
+            barrier = threading.Barrier(8)
+
+            def get(_):
+                barrier.wait()
+                return session.get(url, params=params, timeout=5)
+
+            responses = list(pool.map(get, range(8)))
+            assert all(r is responses[0] for r in responses) and responses[0].json()['path'].startswith(urlsplit(responses[0].url).path)
+    print(f"{8 * len(requests_made)} requests served by {served['requests']} round-trips in "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms over {len(served['connections'])} connections")
+    assert served['requests'] == len(requests_made)
+
+    # Sequential requests reuse one keep-alive connection; a throttled request is retried
+    connections = len(served['connections'])
+    for _ in range(20):
+        session.get(f"{base}/v7/finance/quote", params={'symbols': 'AAPL'}, timeout=5).raise_for_status()
+    assert len(served['connections']) <= connections + 1
+
+    stats = endpoint_stats(session)
+    print(stats.round(2).to_string())
+    assert set(stats.index) == {
+        f"127.0.0.1:{server.server_address[1]}{path}" for path in ['/v10/finance/quoteSummary/{symbol}', '/v8/finance/chart/{symbol}', '/v7/finance/quote']
+    }
+    assert stats['Requests'].sum() + stats['Coalesced'].sum() == 8 * len(requests_made) + 20
+    assert stats['Requests'].sum() == served['requests'] - 1
+    server.shutdown()
+    server.server_close()
+    print("Market data transport OK")
+
+
+if __name__ == '__main__':
+    import sys
+
+    if sys.argv[1:] != ['self-check']:
+        print(__doc__)
+    else:
+        self_check()
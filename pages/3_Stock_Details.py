@@ -1,4 +1,92 @@
 import streamlit as st
+import pandas as pd
+from column_groups import column_groups
+from derived_metrics import load_derived_metrics
+from score_attribution import build_attribution, top_drivers, separating_metrics
+from search_index import search
+from table_views import style_table, score_styles
 
 st.title("Stock Details")
-st.write("This page will provide detailed information about individual stocks.")
+st.page_link("Stocks_Screener.py", label="Back to Overview")
+
+if "snapshot" not in st.session_state:
+    st.info("The data is not loaded yet: open the Overview page first.")
+    st.stop()
+
+stocks_df = st.session_state.stocks_df
+global_scores_df = st.session_state.global_scores_df
+sector_scores_df = st.session_state.sector_scores_df
+
+# The attribution is precomputed with the snapshot; after a recalculation of the scores it is rebuilt here
+if "attribution" not in st.session_state:
+    st.session_state.attribution = build_attribution(global_scores_df, sector_scores_df, st.session_state.metrics)
+attribution = st.session_state.attribution
+
+### SELECT STOCK
+query = st.text_input("Search by ticker, company, industry or sector", key="details_query")
+options = search(st.session_state.snapshot['search_index'], query, limit=25) if query else []
+if not options and st.session_state.get("details_ticker") in stocks_df.index:
+    options = [st.session_state.details_ticker]
+if not options:
+    st.write("No stock selected." if not query else "No stocks found.")
+    st.stop()
+
+ticker = st.selectbox("Stock", options, format_func=lambda t: f"{t} - {stocks_df.at[t, 'Company']}")
+st.session_state.details_ticker = ticker
+
+### STOCK DATA (index lookups on the Ticker index)
+stock = stocks_df.loc[ticker]
+global_scores = global_scores_df.loc[ticker]
+sector_scores = sector_scores_df.loc[ticker]
+
+def format_value(value):
+    if isinstance(value, str):
+        return value
+    return "-" if pd.isna(value) else f"{value:,.2f}"
+
+st.header(f"{stock['Company']} ({ticker})")
+col_1, col_2, col_3, col_4 = st.columns(4)
+col_1.metric("Price", f"{stock['Price']:,.2f}")
+col_2.metric("Overall Score", f"{global_scores['Overall_Score']:,.2f}")
+col_3.metric("Sector Score", f"{sector_scores['Sector_Score']:,.2f}")
+col_4.metric("Sector", stock['Sector'] if isinstance(stock['Sector'], str) else "-")
+
+groups = column_groups + [('Derived Metrics', list(load_derived_metrics()))]
+for title, columns in groups:
+    columns = [c for c in columns if c in stocks_df.columns]
+    if not columns:
+        continue
+    with st.expander(title, expanded=title == 'General Information'):
+        group_df = pd.DataFrame({
+            'Value': [format_value(stock[c]) for c in columns],
+            'Score': [global_scores.get(c + '_Score') for c in columns],
+            'Sector Score': [sector_scores.get(c + '_Sector_Score') for c in columns],
+        }, index=columns)
+        group_df[['Score', 'Sector Score']] = group_df[['Score', 'Sector Score']].astype(float)
+        group_df = group_df.dropna(axis=1, how='all')
+        score_columns = [c for c in ['Score', 'Sector Score'] if c in group_df.columns]
+        st.dataframe(style_table(group_df, score_styles(group_df[score_columns]) if score_columns else None))
+
+### SCORE DRIVERS
+st.subheader("Score Drivers")
+st.caption("Contribution of every metric to the score, in score points: weight x percentile / total weight. "
+           "'Missed' is what the metric could still add.")
+col_1, col_2 = st.columns(2)
+with col_1:
+    st.write("Overall Score")
+    st.dataframe(top_drivers(attribution, ticker, n=5, kind='global').round(2))
+with col_2:
+    st.write("Sector Score")
+    st.dataframe(top_drivers(attribution, ticker, n=5, kind='sector').round(2))
+
+# Peers of the same sector, best first
+sector_peers = sector_scores_df.loc[sector_scores_df['Sector'] == stock['Sector'], 'Sector_Score'].nlargest(26)
+sector_peers = [t for t in sector_peers.index if t != ticker][:25]
+if sector_peers:
+    peer = st.selectbox("Compare with", sector_peers, format_func=lambda t: f"{t} - {stocks_df.at[t, 'Company']}", key="details_peer")
+    kind = st.radio("Score", ["Overall Score", "Sector Score"], horizontal=True, key="details_peer_score")
+    score_column, kind = ('Overall_Score', 'global') if kind == "Overall Score" else ('Sector_Score', 'sector')
+    scores_df = global_scores_df if kind == 'global' else sector_scores_df
+    st.write(f"{ticker} {scores_df.at[ticker, score_column]:,.2f} vs {peer} {scores_df.at[peer, score_column]:,.2f}: "
+             f"metrics separating them the most")
+    st.dataframe(separating_metrics(attribution, ticker, peer, n=5, kind=kind).round(2))
@@ -1,4 +1,71 @@
 import streamlit as st
+import pandas as pd
+from column_groups import column_groups
+from row_store import build_row_store, gather_rows
+from search_index import search
+from table_views import style_table, score_styles
 
 st.title("Stocks Comparisons")
-st.write("This page will allow users to compare multiple stocks.")
\ No newline at end of file
+st.page_link("Stocks_Screener.py", label="Back to Overview")
+
+if "snapshot" not in st.session_state:
+    st.info("The data is not loaded yet: open the Overview page first.")
+    st.stop()
+
+# The store is precomputed with the snapshot; after a recalculation of the scores it is rebuilt here
+if "row_store" not in st.session_state:
+    with st.spinner("Preparing comparison data...Please wait."):
+        st.session_state.row_store = build_row_store(
+            st.session_state.stocks_df,
+            st.session_state.global_scores_df,
+            st.session_state.sector_scores_df,
+            st.session_state.metrics
+        )
+store = st.session_state.row_store
+stocks_df = st.session_state.stocks_df
+
+### SELECT STOCKS
+query = st.text_input("Search stocks to add by ticker, company, industry or sector", key="compare_query")
+# Tickers selected before a data update may have been dropped from the universe
+selected = [t for t in st.session_state.get("compare_tickers", []) if t in stocks_df.index]
+matches = search(st.session_state.snapshot['search_index'], query, limit=25) if query else []
+tickers = st.multiselect(
+    "Stocks",
+    list(dict.fromkeys(selected + matches)),
+    default=selected,
+    format_func=lambda t: f"{t} - {stocks_df.at[t, 'Company']}"
+)
+st.session_state.compare_tickers = tickers
+
+if len(tickers) == 0:
+    st.write("Select the stocks to compare.")
+    st.stop()
+
+### COMPARE
+view = st.radio("Show", ["Values", "Global Percentiles", "Sector Percentiles", "Industry Percentiles"], horizontal=True)
+suffix = {"Values": "", "Global Percentiles": "_Score", "Sector Percentiles": "_Sector_Score", "Industry Percentiles": "_Industry_Score"}[view]
+
+# One gathered read for all the selected stocks
+data = gather_rows(store, tickers)
+
+def format_value(value):
+    if isinstance(value, str):
+        return value
+    return "-" if pd.isna(value) else f"{value:,.2f}"
+
+summary_columns = ['Company', 'Sector', 'Industry', 'Price', 'Overall_Score', 'Sector_Score', 'Industry_Score']
+summary = data.loc[:, [c for c in summary_columns if c in data.columns]]
+st.dataframe(style_table(summary, score_styles(summary[[c for c in summary.columns if c.endswith('Score')]])))
+
+for title, columns in column_groups:
+    columns = [c for c in columns if c + suffix in data.columns]
+    if len(columns) == 0:
+        continue
+    with st.expander(title, expanded=True):
+        group_df = data.loc[:, [c + suffix for c in columns]].T
+        group_df.index = columns
+        if suffix:
+            group_df = group_df.astype(float)
+            st.dataframe(style_table(group_df, score_styles(group_df)))
+        else:
+            st.dataframe(group_df.map(format_value))
@@ -0,0 +1,89 @@
+import streamlit as st
+import pandas as pd
+from snapshot import load_snapshot
+from snapshot_diff import read_change_log, load_alert_rules, save_alert_rules, check_alert_rule, CHANGE_LOG_FILE, ALERT_RULES_FILE
+
+snapshot_file_name = "./data/snapshot.pkl"
+
+st.title("Changes & Alerts")
+st.page_link("Stocks_Screener.py", label="Back to Overview")
+
+### CHANGE LOG
+entries = read_change_log(CHANGE_LOG_FILE, last=20)
+if len(entries) == 0:
+    st.info("No changes logged yet: they are logged every time the data is updated or the quotes refreshed.")
+else:
+    entry = st.selectbox(
+        "Update",
+        entries,
+        format_func=lambda e: f"{e['time']} ({e['from_version']} -> {e['to_version']})"
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader(f"Entered the top {entry['top_n']}")
+        st.write(", ".join(entry['entered']) or "-")
+    with col2:
+        st.subheader(f"Left the top {entry['top_n']}")
+        st.write(", ".join(entry['left']) or "-")
+
+    sectors = sorted(set(entry['sector_entered']) | set(entry['sector_left']))
+    if sectors:
+        st.subheader(f"Top {entry['top_n']} by sector")
+        st.dataframe(pd.DataFrame({
+            'Entered': [", ".join(entry['sector_entered'].get(s, [])) for s in sectors],
+            'Left': [", ".join(entry['sector_left'].get(s, [])) for s in sectors],
+        }, index=pd.Index(sectors, name='Sector')))
+
+    st.subheader(f"Overall_Score moves of {entry['threshold']:g} points or more")
+    moves = pd.DataFrame(
+        entry['score_moves'], columns=['Ticker', 'Old Score', 'New Score', 'Change', 'Old Rank', 'New Rank']
+    ).set_index('Ticker')
+    st.dataframe(moves)
+
+    if entry['added'] or entry['removed']:
+        st.write(f"Added: {', '.join(entry['added']) or '-'}")
+        st.write(f"Removed: {', '.join(entry['removed']) or '-'}")
+
+### ALERTS
+st.header("Alerts")
+rules = load_alert_rules(ALERT_RULES_FILE)
+user = st.text_input("User", "default", key="alerts_user")
+
+if entries:
+    triggered = [alert for alert in entry['alerts'] if alert['user'] == user]
+    if len(triggered) == 0:
+        st.write("No alert triggered by this update.")
+    for alert in triggered:
+        st.warning(f"**{alert['rule']}** ({alert['filter']}): {', '.join(alert['tickers'])}")
+
+user_rules = rules.get(user, [])
+if user_rules:
+    st.dataframe(pd.DataFrame([
+        {'Name': r['name'], 'Filter': r['filter'], 'Watchlist': ", ".join(r.get('tickers', []))} for r in user_rules
+    ]))
+
+with st.expander("Add an alert rule", expanded=False):
+    name = st.text_input("Name", key="alert_name")
+    expression = st.text_input("Filter", placeholder="e.g. DCF Ratio < 1 and Sector = Technology", key="alert_filter")
+    watchlist = st.text_input("Watchlist (comma separated tickers, all the stocks if empty)", key="alert_watchlist")
+    if st.button("Add rule"):
+        # Checked against the snapshot the rules are evaluated over (the saved one if the Overview
+        # page was not opened in this session)
+        snapshot = st.session_state.get('snapshot') or load_snapshot(snapshot_file_name)
+        try:
+            if snapshot is None:
+                raise ValueError("the data is not loaded yet, open the Overview page first.")
+            check_alert_rule(expression, snapshot)
+            tickers = [t.strip().upper() for t in watchlist.split(",") if t.strip()]
+            rules.setdefault(user, []).append({'name': name or expression, 'filter': expression, 'tickers': tickers})
+            save_alert_rules(rules, ALERT_RULES_FILE)
+            st.rerun()
+        except ValueError as e:
+            st.error(f"Invalid filter: {e}")
+
+if user_rules:
+    removed = st.selectbox("Remove a rule", [r['name'] for r in user_rules], key="alert_remove")
+    if st.button("Remove rule"):
+        rules[user] = [r for r in user_rules if r['name'] != removed]
+        save_alert_rules(rules, ALERT_RULES_FILE)
+        st.rerun()
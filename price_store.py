@@ -0,0 +1,249 @@
+import os
+import numpy as np
+import pandas as pd
+
+PRICE_STORE_DIR = "./data/prices"
+INTERVAL_DIRS = {'1d': 'daily', '1mo': 'monthly'}
+BAR_FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+# Daily history kept for the tickers that are not stored yet, as crawled by get_stock_data
+DAILY_PERIOD = "5y"
+BATCH_SIZE = 200
+
+# Number of stored bars downloaded again on every update, to check that the history was not adjusted
+OVERLAP_BARS = 5
+# Relative difference of the overlapping prices above which the history is considered adjusted
+ADJUSTMENT_TOLERANCE = 1e-5
+
+
+def _file_name(store_dir, ticker, interval):
+    return os.path.join(store_dir, INTERVAL_DIRS[interval], f"{ticker}.parquet")
+
+
+def _normalize(bars):
+    """
+    Keeps the OHLCV columns of bars (from Ticker.history or yf.download) with a tz-naive date index,
+    without the dates that have no close.
+    """
+    bars = bars.reindex(columns=BAR_FIELDS).astype(float)
+    bars = bars.loc[bars['Close'].notna()]
+    index = bars.index.tz_localize(None) if getattr(bars.index, 'tz', None) is not None else bars.index
+    bars.index = pd.DatetimeIndex(index, name='Date')
+    return bars.loc[~bars.index.duplicated(keep='last')].sort_index()
+
+
+def read_bars(store_dir, ticker, interval='1d'):
+    """
+    Returns the stored bars of a ticker, or None if the ticker is not stored.
+    """
+    file_name = _file_name(store_dir, ticker, interval)
+    if not os.path.exists(file_name):
+        return None
+    return pd.read_parquet(file_name)
+
+
+def write_bars(store_dir, ticker, bars, interval='1d'):
+    """
+    Replaces the stored bars of a ticker (one zstd compressed parquet file per ticker and interval).
+    The file is written to a temporary file first, so that a reader never sees a partial file.
+    """
+    file_name = _file_name(store_dir, ticker, interval)
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    tmp_file_name = file_name + ".tmp"
+    bars.to_parquet(tmp_file_name, compression='zstd')
+    os.replace(tmp_file_name, file_name)
+
+
+def overlap_start(stored):
+    """
+    Returns the first date to download to update stored bars: the last OVERLAP_BARS bars are downloaded again.
+    """
+    return stored.index[max(0, len(stored) - OVERLAP_BARS)]
+
+
+def merge_bars(stored, fetched):
+    """
+    Appends the fetched bars (downloaded from overlap_start) to the stored ones.
+
+    The last stored bar can be a session or a month that was still open: it is replaced, not compared.
+    The bars before it are compared with the fetched ones: prices are adjusted backwards for splits and
+    dividends, so any difference means that the whole history of the ticker changed.
+
+    Returns:
+    - The updated bars, or None if the stored history was adjusted and must be downloaded again.
+    """
+    fetched = _normalize(fetched)
+    if not len(fetched):
+        return stored
+    overlap = stored.index[:-1].intersection(fetched.index)
+    if len(stored) > 1 and not len(overlap):
+        return None
+    prices = ['Open', 'High', 'Low', 'Close']
+    if not np.allclose(stored.loc[overlap, prices].to_numpy(), fetched.loc[overlap, prices].to_numpy(),
+                       rtol=ADJUSTMENT_TOLERANCE, atol=0.0, equal_nan=True):
+        return None
+    return pd.concat([stored.loc[stored.index < fetched.index[0]], fetched])
+
+
+def update_ticker(store_dir, ticker, history, interval='1d', start=None):
+    """
+    Brings the stored bars of one ticker up to date, downloading only the bars after the last stored
+    date (and the overlap). If the history was adjusted (split, dividend), it is downloaded again
+    and the file of the ticker rewritten.
+
+    Parameters:
+    - store_dir: The directory of the store.
+    - ticker: The ticker.
+    - history: The history function of the ticker (yf.Ticker(ticker).history).
+    - interval: '1d' or '1mo'.
+    - start: The first date of the history downloaded for a ticker that is not stored (all of it if None).
+
+    Returns:
+    - All the stored bars of the ticker.
+    """
+    stored = read_bars(store_dir, ticker, interval)
+    if stored is not None and len(stored):
+        merged = merge_bars(stored, history(start=overlap_start(stored), interval=interval))
+        if merged is not None:
+            if not merged.equals(stored):
+                write_bars(store_dir, ticker, merged, interval)
+            return merged
+        print(f"The {INTERVAL_DIRS[interval]} history of {ticker} was adjusted, downloading it again")
+
+    if start is None:
+        bars = _normalize(history(period="max", interval=interval))
+    else:
+        bars = _normalize(history(start=start, interval=interval))
+    write_bars(store_dir, ticker, bars, interval)
+    return bars
+
+
+def history_bars(store_dir, ticker, history, interval='1d', start=None):
+    """
+    Updates the stored bars of a ticker (see update_ticker) and returns them from start on.
+    """
+    bars = update_ticker(store_dir, ticker, history, interval, start)
+    return bars if start is None else bars.loc[bars.index >= pd.Timestamp(start)]
+
+
+def _ticker_bars(bars, ticker):
+    if ticker not in bars['Close'].columns:
+        return pd.DataFrame(columns=BAR_FIELDS)
+    return pd.DataFrame({field: bars[field][ticker] for field in BAR_FIELDS})
+
+
+def update_store(store_dir, tickers, download, period=DAILY_PERIOD, batch_size=BATCH_SIZE):
+    """
+    Brings the daily bars of many tickers up to date with batched downloads: the stored tickers from
+    their overlap start (batched by close start dates), then the tickers that are not stored yet or
+    whose history was adjusted, over period.
+
+    Parameters:
+    - store_dir: The directory of the store.
+    - tickers: The tickers to update.
+    - download: A batched download function, called as download(tickers, period=...) or
+      download(tickers, start=...) and returning the bars as quote_refresh.download_bars does.
+    - period: The history downloaded for the tickers that are not stored.
+    - batch_size: The number of tickers per download.
+
+    Returns:
+    - The number of tickers updated incrementally and the number downloaded in full.
+    """
+    stored = {ticker: read_bars(store_dir, ticker) for ticker in tickers}
+    new = [ticker for ticker in tickers if stored[ticker] is None or not len(stored[ticker])]
+    incremental = sorted((t for t in tickers if t not in new), key=lambda t: overlap_start(stored[t]))
+    adjusted = []
+
+    for i in range(0, len(incremental), batch_size):
+        batch = incremental[i:i + batch_size]
+        bars = download(batch, start=overlap_start(stored[batch[0]]))
+        for ticker in batch:
+            fetched = _normalize(_ticker_bars(bars, ticker))
+            merged = merge_bars(stored[ticker], fetched.loc[fetched.index >= overlap_start(stored[ticker])])
+            if merged is None:
+                print(f"The daily history of {ticker} was adjusted, downloading it again")
+                adjusted.append(ticker)
+            elif not merged.equals(stored[ticker]):
+                write_bars(store_dir, ticker, merged)
+
+    full = new + adjusted
+    for i in range(0, len(full), batch_size):
+        batch = full[i:i + batch_size]
+        bars = download(batch, period=period)
+        for ticker in batch:
+            write_bars(store_dir, ticker, _normalize(_ticker_bars(bars, ticker)))
+    return len(incremental) - len(adjusted), len(full)
+
+
+def panel_bars(store_dir, tickers, start=None):
+    """
+    Reads the stored daily bars of the tickers from start on, laid out as quote_refresh.download_bars
+    returns them: a dictionary mapping 'Open', 'High', 'Low', 'Close', 'Volume' to DataFrames (dates x tickers).
+    """
+    frames = {}
+    for ticker in tickers:
+        bars = read_bars(store_dir, ticker)
+        if bars is not None:
+            frames[ticker] = bars if start is None else bars.loc[bars.index >= pd.Timestamp(start)]
+    return {field: pd.DataFrame({ticker: bars[field] for ticker, bars in frames.items()}).sort_index() for field in BAR_FIELDS}
+
+
+if __name__ == '__main__':
+    # Self-check on synthetic bars: incremental updates, adjustment detection and batched updates
+    import tempfile
+    from benchmarks.synthetic import make_universe
+    from benchmarks.fake_yfinance import synthetic_responses, RecordedTicker, _download
+
+    universe = make_universe(30, seed=2)
+    tickers = universe['Ticker'].tolist()
+    responses = synthetic_responses(universe, seed=2, n_days=1300)
+    full_history = {t: responses[t]['history'] for t in tickers}
+
+    def at_day(n_days):
+        # The responses as they were n_days sessions into the history
+        return {t: {**responses[t], 'history': full_history[t].iloc[:n_days]} for t in tickers}
+
+    downloaded = []
+
+    def counting_history(ticker, day_responses):
+        def history(**kwargs):
+            bars = RecordedTicker(ticker, day_responses).history(**kwargs)
+            downloaded.append(len(bars))
+            return bars
+        return history
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        ticker = tickers[0]
+        update_ticker(store_dir, ticker, counting_history(ticker, at_day(1280)), start='2000-01-01')
+        downloaded.clear()
+        bars = update_ticker(store_dir, ticker, counting_history(ticker, at_day(1290)), start='2000-01-01')
+        pd.testing.assert_frame_equal(bars, _normalize(full_history[ticker].iloc[:1290]))
+        assert downloaded == [OVERLAP_BARS + 10], downloaded
+        print(f"Incremental update: {downloaded[0]} bars downloaded instead of 1290")
+
+        # A 2:1 split after the last stored bar: the whole history before it is halved by the provider
+        split = full_history[ticker].copy()
+        split.iloc[:1292, :4] /= 2
+        responses[ticker] = {**responses[ticker], 'history': split}
+        full_history[ticker] = split
+        downloaded.clear()
+        bars = update_ticker(store_dir, ticker, counting_history(ticker, at_day(1295)), start='2000-01-01')
+        pd.testing.assert_frame_equal(bars, _normalize(split.iloc[:1295]))
+        assert downloaded == [OVERLAP_BARS + 5, 1295], downloaded
+        print("Split detected: the history of the ticker was downloaded again")
+
+        # Batched updates of the whole universe, as done by quote_refresh
+        def downloader(day_responses):
+            return lambda batch, period=None, start=None: _download(day_responses, batch, period or '1mo', start=start)
+
+        update_store(store_dir, tickers, downloader(at_day(1250)), period='5y')
+        n_incremental, n_full = update_store(store_dir, tickers, downloader(at_day(1300)), period='5y')
+        print(f"Batched update: {n_incremental} tickers updated incrementally, {n_full} downloaded in full")
+        panel = panel_bars(store_dir, tickers)
+        expected = _download(at_day(1300), tickers, '5y')
+        for field in BAR_FIELDS:
+            tail = expected[field].index[-1000:]
+            pd.testing.assert_frame_equal(
+                panel[field].loc[tail.tz_localize(None)], expected[field].loc[tail].set_axis(tail.tz_localize(None).rename('Date')),
+                check_names=False, check_freq=False
+            )
+    print("Stored bars match the downloaded history")
@@ -0,0 +1,302 @@
+import copy
+import numpy as np
+import pandas as pd
+from scoring_functions import scored_metrics
+from incremental_scoring import scores_from_percentiles, _is_valid, _final_percentiles
+
+DEFAULT_K = 200
+# Smallest capacity of a compactor level, as in the KLL paper
+MIN_LEVEL_CAPACITY = 8
+
+
+def rank_error(k):
+    """
+    Normalized rank error of a KLL sketch of parameter k, at 99% confidence for a single query
+    (empirical fit of the Apache DataSketches KLL sketch, which uses the same compaction scheme).
+    A percentile score is then within 100 * rank_error(k) points of the exact one.
+    """
+    return 2.296 / k ** 0.9723
+
+
+def k_for_rank_error(error):
+    """
+    Returns the smallest k whose rank error is at most error (e.g. 0.01 for 1 percentile point).
+    """
+    return int(np.ceil((2.296 / error) ** (1 / 0.9723)))
+
+
+def new_sketch(k=DEFAULT_K, seed=None):
+    """
+    Creates an empty KLL quantile sketch: a stack of compactor levels, the items of level h standing
+    for 2^h values each. Sketches are plain dictionaries (picklable) and mergeable with merge_sketch.
+    """
+    return {'k': k, 'n': 0, 'levels': [np.empty(0)], 'rng': np.random.default_rng(seed)}
+
+
+def _capacity(k, level, n_levels):
+    return max(MIN_LEVEL_CAPACITY, int(np.ceil(k * (2 / 3) ** (n_levels - 1 - level))))
+
+
+def _compress(sketch):
+    """
+    Compacts the lowest full levels until the sketch fits its capacity: a full level is sorted and
+    every other item (starting at a random offset) is promoted to the next level with twice the weight.
+    """
+    levels = sketch['levels']
+    while True:
+        capacities = [_capacity(sketch['k'], h, len(levels)) for h in range(len(levels))]
+        if sum(len(items) for items in levels) <= sum(capacities):
+            return sketch
+        h = next(h for h, items in enumerate(levels) if len(items) >= capacities[h])
+        if h == len(levels) - 1:
+            levels.append(np.empty(0))
+        items = levels[h]
+        # With an odd number of items, one stays at its level so that the total weight is kept
+        stay, items = (items[-1:], items[:-1]) if len(items) % 2 else (items[:0], items)
+        items = np.sort(items)
+        levels[h + 1] = np.concatenate([levels[h + 1], items[sketch['rng'].integers(2)::2]])
+        levels[h] = stay
+
+
+def update_sketch(sketch, values):
+    """
+    Adds a batch of values (without NaN) to the sketch.
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values):
+        sketch['levels'][0] = np.concatenate([sketch['levels'][0], values])
+        sketch['n'] += len(values)
+        _compress(sketch)
+    return sketch
+
+
+def merge_sketch(sketch, other):
+    """
+    Merges other into sketch, level by level. Both sketches must have the same k.
+    """
+    if sketch['k'] != other['k']:
+        raise ValueError(f"Cannot merge sketches of different sizes (k={sketch['k']} and k={other['k']}).")
+    levels = sketch['levels']
+    levels.extend(np.empty(0) for _ in range(len(other['levels']) - len(levels)))
+    for h, items in enumerate(other['levels']):
+        levels[h] = np.concatenate([levels[h], items])
+    sketch['n'] += other['n']
+    return _compress(sketch)
+
+
+def sketch_cdf(sketch):
+    """
+    Returns the retained items sorted and the cumulated weights before each of them (with the total
+    weight at the end), from which sketch_percentiles answers rank queries.
+    """
+    items = np.concatenate(sketch['levels'])
+    weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(sketch['levels'])])
+    order = np.argsort(items, kind='stable')
+    return items[order], np.concatenate([[0.0], np.cumsum(weights[order])])
+
+
+def sketch_percentiles(cdf, values):
+    """
+    Approximate percentile ranks of values, defined as pandas/scipy do with method='average':
+    (number of smaller values + (number of equal values + 1) / 2) / count * 100. They are exact
+    as long as the sketch has not compacted anything (fewer values than its capacity).
+    """
+    items, cumulated = cdf
+    smaller = cumulated[np.searchsorted(items, values, side='left')]
+    smaller_or_equal = cumulated[np.searchsorted(items, values, side='right')]
+    ranks = smaller + (smaller_or_equal - smaller + 1) / 2
+    return np.minimum(ranks / cumulated[-1] * 100, 100.0)
+
+
+def build_sketches(df, metrics, k=DEFAULT_K, group_column='Sector', seed=None):
+    """
+    Builds the sketches of one shard of the universe: for every scored metric, a sketch of its valid
+    values over the shard and one per sector.
+
+    Parameters:
+    - df: The stocks DataFrame of the shard.
+    - metrics: The metrics configuration.
+    - k: The size parameter of the sketches (see rank_error).
+    - group_column: The column defining the groups of the sector scores.
+    - seed: The seed of the random compactions, to be different for every shard.
+
+    Returns:
+    - A dictionary holding the scored metrics and their sketches, to be merged with merge_sketches.
+    """
+    df_ = df.set_index('Ticker') if 'Ticker' in df.columns else df
+    if group_column not in df_.columns:
+        raise ValueError(f"The DataFrame must contain a '{group_column}' column to calculate {group_column.lower()}-specific scores.")
+
+    rng = np.random.default_rng(seed)
+    groups = df_[group_column]
+    sketches = {
+        'k': k,
+        'group_column': group_column,
+        'metrics': [(metric, dict(config)) for metric, config in scored_metrics(df_, metrics)],
+        'global': {},
+        'groups': {},
+    }
+    for metric, config in sketches['metrics']:
+        values = df_[metric].to_numpy(dtype=float)
+        valid = _is_valid(values, config.get('penalize_negative', False))
+        sketches['global'][metric] = update_sketch(new_sketch(k, rng.integers(2 ** 32)), values[valid])
+        sketches['groups'][metric] = {
+            group: update_sketch(new_sketch(k, rng.integers(2 ** 32)), values[valid & (groups == group).to_numpy()])
+            for group in groups.dropna().unique()
+        }
+    return sketches
+
+
+def merge_sketches(shard_sketches):
+    """
+    Merges the sketches of several shards (as returned by build_sketches) into new sketches of the
+    whole universe. The sketches of the shards are not modified.
+    """
+    shard_sketches = list(shard_sketches)
+    merged = copy.deepcopy(shard_sketches[0])
+    for sketches in shard_sketches[1:]:
+        if [metric for metric, _ in sketches['metrics']] != [metric for metric, _ in merged['metrics']]:
+            raise ValueError("Cannot merge sketches built with different metrics.")
+        for metric, _ in merged['metrics']:
+            merge_sketch(merged['global'][metric], sketches['global'][metric])
+            groups = merged['groups'][metric]
+            for group, sketch in sketches['groups'][metric].items():
+                groups[group] = merge_sketch(groups[group], sketch) if group in groups else copy.deepcopy(sketch)
+    return merged
+
+
+def stream_scores(shards, sketches):
+    """
+    Scores the shards one after the other against the merged sketches, in the format of get_scores.
+
+    Parameters:
+    - shards: An iterable of stocks DataFrames or of parquet file names.
+    - sketches: The merged sketches of the whole universe (see merge_sketches).
+
+    Returns:
+    - A generator of the scores DataFrame of every shard.
+    """
+    group_column = sketches['group_column']
+    metrics = sketches['metrics']
+    global_cdfs = [sketch_cdf(sketches['global'][metric]) for metric, _ in metrics]
+    group_cdfs = [{group: sketch_cdf(sketch) for group, sketch in sketches['groups'][metric].items()} for metric, _ in metrics]
+
+    for shard in shards:
+        df = _read_shard(shard)
+        df = df.set_index('Ticker') if 'Ticker' in df.columns else df
+        groups = df[group_column].to_numpy(dtype=object)
+        global_pct = np.full((len(df), len(metrics)), np.nan)
+        sector_pct = np.full((len(df), len(metrics)), np.nan)
+        for j, (metric, config) in enumerate(metrics):
+            values = df[metric].to_numpy(dtype=float)
+            preference, penalize_negative = config['preference'], config.get('penalize_negative', False)
+            global_pct[:, j] = _final_percentiles(global_cdfs[j], values, preference, penalize_negative, percentiles=sketch_percentiles)
+            in_group = np.zeros(len(df), dtype=bool)
+            for group, cdf in group_cdfs[j].items():
+                rows = groups == group
+                if rows.any():
+                    in_group |= rows
+                    sector_pct[rows, j] = _final_percentiles(cdf, values[rows], preference, penalize_negative, percentiles=sketch_percentiles)
+            # Rows without a sector only get the negative penalty, as in calculate_group_scores
+            sector_pct[~in_group, j] = _final_percentiles(None, values[~in_group], preference, penalize_negative, in_group=False)
+        yield scores_from_percentiles(df.index, metrics, global_pct, sector_pct, groups, group_column)
+
+
+def _read_shard(shard):
+    return pd.read_parquet(shard) if isinstance(shard, str) else shard
+
+
+def approximate_scores(shards, metrics, k=None, error=None, group_column='Sector'):
+    """
+    Scores a universe partitioned in shards (DataFrames or parquet files, e.g. the parts of a crawl
+    checkpoint) without ever holding it in memory: a first pass builds the sketches of every shard,
+    which are merged, and a second pass scores every shard against the merged sketches.
+
+    Parameters:
+    - shards: A list of stocks DataFrames or of parquet file names.
+    - metrics: The metrics configuration.
+    - k: The size parameter of the sketches, DEFAULT_K by default.
+    - error: The rank error wanted instead of k (e.g. 0.005 for half a percentile point, see k_for_rank_error).
+    - group_column: The column defining the groups of the sector scores.
+
+    Returns:
+    - The scores DataFrame, in the format of get_scores, with percentiles within about 100 * rank_error(k) points.
+    """
+    if k is None:
+        k = k_for_rank_error(error) if error is not None else DEFAULT_K
+    sketches = merge_sketches(
+        build_sketches(_read_shard(shard), metrics, k, group_column, seed=i) for i, shard in enumerate(shards)
+    )
+    return pd.concat(stream_scores(shards, sketches))
+
+
+def compare_with_exact(approx_scores_df, exact_scores_df):
+    """
+    Compares approximate scores with the exact ones (from get_scores) column by column.
+
+    Returns:
+    - A DataFrame with, for every score column, the mean, 99th percentile and maximum absolute error
+      (in percentile points) and the number of rows where only one of them is missing.
+    """
+    approx_scores_df = approx_scores_df.reindex(exact_scores_df.index)
+    rows = {}
+    for column in exact_scores_df.columns:
+        if not column.endswith('_Score'):
+            continue
+        exact, approx = exact_scores_df[column].to_numpy(dtype=float), approx_scores_df[column].to_numpy(dtype=float)
+        both = ~np.isnan(exact) & ~np.isnan(approx)
+        errors = np.abs(exact[both] - approx[both])
+        rows[column] = {
+            'mean_error': errors.mean() if len(errors) else 0.0,
+            'p99_error': np.percentile(errors, 99) if len(errors) else 0.0,
+            'max_error': errors.max() if len(errors) else 0.0,
+            'missing_mismatch': int((np.isnan(exact) != np.isnan(approx)).sum()),
+        }
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+if __name__ == '__main__':
+    # Self-check: scores of a sharded synthetic universe against the exact get_scores, for several sketch sizes
+    import json
+    import time
+    from benchmarks.synthetic import make_universe
+    from scoring_functions import get_scores
+
+    with open("./metrics_config/default_metrics.json", 'r') as f:
+        metrics = json.load(f)
+
+    df = make_universe(20000, seed=5).set_index('Ticker')
+    shards = [df.iloc[i::8] for i in range(8)]
+    start = time.perf_counter()
+    exact = get_scores(df, metrics)
+    print(f"exact get_scores: {time.perf_counter() - start:.2f} s")
+
+    # Small shards are never compacted: the sketches hold every value and the scores are exact
+    small = df.iloc[:150]
+    pd.testing.assert_frame_equal(approximate_scores([small.iloc[:50], small.iloc[50:]], metrics), get_scores(small, metrics), check_exact=True)
+
+    # Merging leaves the sketches of the shards unchanged
+    shard_sketches = [build_sketches(shard, metrics, k=50, seed=i) for i, shard in enumerate(shards[:2])]
+    before = copy.deepcopy(shard_sketches)
+    merge_sketches(shard_sketches)
+    for sketches, original in zip(shard_sketches, before):
+        for metric, _ in sketches['metrics']:
+            for sketch, original_sketch in [(sketches['global'][metric], original['global'][metric])] + [
+                (sketches['groups'][metric][group], original['groups'][metric][group]) for group in original['groups'][metric]
+            ]:
+                assert sketch['n'] == original_sketch['n'] and all(np.array_equal(a, b) for a, b in zip(sketch['levels'], original_sketch['levels']))
+
+    for k in [50, 200, 800]:
+        start = time.perf_counter()
+        approx = approximate_scores(shards, metrics, k=k)
+        elapsed = time.perf_counter() - start
+        comparison = compare_with_exact(approx, exact)
+        bound = 100 * rank_error(k)
+        metric_columns = [c for c in comparison.index if c.endswith('_Score') and c not in ('Overall_Score', 'Sector_Score')]
+        print(f"k={k}: {elapsed:.2f} s, bound {bound:.2f} points, metric scores p99 error "
+              f"{comparison.loc[metric_columns, 'p99_error'].max():.2f} (max {comparison.loc[metric_columns, 'max_error'].max():.2f}), "
+              f"Overall_Score max error {comparison.loc['Overall_Score', 'max_error']:.2f}")
+        assert list(approx.columns) == list(exact.columns)
+        assert comparison['missing_mismatch'].sum() == 0
+        assert comparison.loc[metric_columns, 'p99_error'].max() <= bound + 0.01
+    print("Approximate scores are within the error bounds")
@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+import price_store
+
+# Enough daily bars for the longest window (252 days of returns for the volatility)
+BARS_YEARS = 2
+BARS_PERIOD = f"{BARS_YEARS}y"
+BATCH_SIZE = 200
+BAR_FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Columns proportional to the price: with unchanged fundamentals (EPS, sales, book value, FCF, shares)
+# they move with the ratio new price / old price
+PRICE_SCALED_COLUMNS = ['Market Cap', 'P/E', 'Forward P/E', 'PEG', 'Forward PEG', 'P/S', 'P/B', 'Price/Free Cash Flow']
+# Columns inversely proportional to the price
+PRICE_INVERSE_COLUMNS = ['Dividend Yield', 'Yearly Volume/Market Cap']
+# Columns recomputed from the daily bars, as in data_functions.get_stock_data
+BAR_COLUMNS = [
+    'Price', 'Current Volume', 'Daily Last Close', 'Daily Last Change', 'Daily Last Change from Open',
+    '20-Day Simple Moving Average', '50-Day Simple Moving Average', '200-Day Simple Moving Average',
+    '20-Day High/Low', '50-Day High/Low', '52-Week High/Low',
+    'Daily 1m Price Change', 'Daily 3m Price Change', 'Daily 6m Price Change', 'Daily 12m Price Change',
+    'Performance Y', 'Performance 6M', 'Volatility', 'Daily RSI (14)', 'Monthly RSI (14)'
+]
+QUOTE_COLUMNS = PRICE_SCALED_COLUMNS + PRICE_INVERSE_COLUMNS + ['DCF Ratio'] + BAR_COLUMNS
+
+
+def download_bars(tickers, period=BARS_PERIOD, batch_size=BATCH_SIZE, start=None):
+    """
+    Downloads the daily bars of the tickers with batched yf.download calls (one request per batch
+    instead of one history call per ticker), over period or from start on.
+
+    Returns:
+    - A dictionary mapping 'Open', 'High', 'Low', 'Close', 'Volume' to DataFrames (dates x tickers).
+    """
+    import yfinance as yf
+    from market_data_transport import get_session
+
+    frames = []
+    for i in range(0, len(tickers), batch_size):
+        batch = list(tickers[i:i + batch_size])
+        history = {'start': start} if start is not None else {'period': period}
+        bars = yf.download(batch, interval="1d", auto_adjust=True, group_by='column', progress=False, threads=True,
+                           session=get_session(), **history)
+        if not isinstance(bars.columns, pd.MultiIndex):
+            bars.columns = pd.MultiIndex.from_product([bars.columns, batch])
+        frames.append(bars)
+    bars = pd.concat(frames, axis=1).sort_index()
+    return {field: bars[field] for field in BAR_FIELDS}
+
+
+def store_bars(store_dir, tickers):
+    """
+    Brings the daily bars of the tickers up to date in the local price store (see price_store.update_store),
+    downloading only the bars after the stored ones, and reads the last BARS_YEARS years of them.
+    """
+    price_store.update_store(store_dir, tickers, download_bars)
+    start = pd.Timestamp.now().normalize() - pd.DateOffset(years=BARS_YEARS)
+    return price_store.panel_bars(store_dir, tickers, start)
+
+
+def _compact(frame, valid):
+    """
+    Moves the bars of every ticker (the rows where valid) to the end of its column, in date order,
+    so that the last n rows hold its own last n bars even when bars are missing (trading halts, gaps
+    in the price store) on dates where other tickers traded. The other rows are NaN.
+    """
+    valid = valid.to_numpy()
+    # Stable sort of every column: the missing bars first, then the bars in date order
+    order = np.argsort(valid, axis=0, kind='stable')
+    values = np.take_along_axis(frame.to_numpy(dtype=float), order, axis=0)
+    values[np.arange(len(frame))[:, None] < len(frame) - valid.sum(axis=0)] = np.nan
+    return pd.DataFrame(values, index=frame.index, columns=frame.columns)
+
+
+def _last_window(frame, window, reduce):
+    """
+    Value of a rolling window over the last `window` bars of every ticker (the last row of
+    frame.rolling(window).<reduce>()), computed on that window only: NaN if the ticker has fewer bars.
+    """
+    if len(frame) < window:
+        return pd.Series(np.nan, index=frame.columns)
+    return pd.Series(reduce(frame.to_numpy(dtype=float)[-window:], axis=0), index=frame.columns)
+
+
+def _rsi(close):
+    delta = close.diff()
+    gain = _last_window(delta.where(delta > 0, 0), 14, np.mean)
+    loss = _last_window(-delta.where(delta < 0, 0), 14, np.mean)
+    rs = gain / loss
+    return 100 - (100 / (1 + rs))
+
+
+def _high_low(high, low, window):
+    highs = _last_window(high, window, np.max)
+    lows = _last_window(low, window, np.min)
+    return (highs.map("{:.2f}".format) + "/" + lows.map("{:.2f}".format)).where(highs.notna() & lows.notna())
+
+
+def bar_columns(bars):
+    """
+    Computes the bar-dependent columns of all the tickers at once, with the formulas of get_stock_data
+    applied to the dates x tickers frames. Only the windows ending on the last bar are computed.
+    The windows count the bars of every ticker, not the dates of the frame (see _compact).
+
+    Returns:
+    - A DataFrame indexed by Ticker with the BAR_COLUMNS (NaN where a ticker has too few bars).
+    """
+    valid = bars['Close'].notna()
+    open_, high, low, close, volume = (_compact(bars[field], valid) for field in BAR_FIELDS)
+    # Tickers without a bar on the last session have no price (and are not refreshed)
+    last = bars['Close'].iloc[-1]
+    returns = close / close.shift(1) - 1
+
+    data = {
+        'Price': last,
+        'Current Volume': volume.iloc[-1],
+        'Daily Last Close': last,
+        'Daily Last Change': returns.iloc[-1],
+        'Daily Last Change from Open': (last - open_.iloc[-1]) / open_.iloc[-1],
+    }
+    for window in [20, 50, 200]:
+        data[f'{window}-Day Simple Moving Average'] = _last_window(close, window, np.mean)
+    data['20-Day High/Low'] = _high_low(high, low, 20)
+    data['50-Day High/Low'] = _high_low(high, low, 50)
+    data['52-Week High/Low'] = _high_low(high, low, 252)
+    for period in [1, 3, 6, 12]:
+        data[f'Daily {period}m Price Change'] = last / close.shift(period * 20).iloc[-1] - 1
+    data['Performance Y'] = last / close.shift(252).iloc[-1] - 1
+    data['Performance 6M'] = last / close.shift(126).iloc[-1] - 1
+    data['Volatility'] = _last_window(returns, 252, lambda values, axis: np.std(values, axis=axis, ddof=1)) * (252 ** 0.5)
+    data['Daily RSI (14)'] = _rsi(close)
+    # Monthly bars: the last close of every month (the current month closes at the last price)
+    data['Monthly RSI (14)'] = _rsi(bars['Close'].resample('ME').last())
+
+    df = pd.DataFrame(data)
+    df.index.name = 'Ticker'
+    return df
+
+
+def refresh_quotes(stocks_df, bars=None, store_dir=None):
+    """
+    Refreshes the price-dependent columns of the stocks from their last daily bars, without crawling
+    the fundamentals again: ratios proportional to the price are scaled by new price / old price,
+    the DCF Ratio is recomputed from the new market cap and the bar-based columns (changes, moving
+    averages, high/low, performance, volatility, RSI) from the bars.
+
+    Only tickers with a bar on the last session are refreshed, the others keep their values.
+
+    Parameters:
+    - stocks_df: The stocks DataFrame, indexed by Ticker.
+    - bars: The daily bars, as returned by download_bars (downloaded if None).
+    - store_dir: The local price store to read the bars from, when bars is None (see store_bars).
+
+    Returns:
+    - A new stocks DataFrame.
+    """
+    if bars is None and store_dir is not None:
+        bars = store_bars(store_dir, stocks_df.index.tolist())
+    elif bars is None:
+        bars = download_bars(stocks_df.index.tolist())
+    new_values = bar_columns(bars)
+    new_values = new_values.loc[new_values.index.isin(stocks_df.index) & new_values['Price'].notna()]
+    tickers = new_values.index
+
+    df = stocks_df.copy()
+    old_price = df.loc[tickers, 'Price'].fillna(df.loc[tickers, 'Daily Last Close'])
+    ratio = new_values['Price'] / old_price
+    for column in PRICE_SCALED_COLUMNS:
+        if column in df.columns:
+            df.loc[tickers, column] = (df.loc[tickers, column] * ratio).round(2)
+    for column in PRICE_INVERSE_COLUMNS:
+        if column in df.columns:
+            df.loc[tickers, column] = (df.loc[tickers, column] / ratio).round(2)
+    if 'DCF Ratio' in df.columns:
+        dcf = df.loc[tickers, 'Discounted Cash Flow']
+        df.loc[tickers, 'DCF Ratio'] = (df.loc[tickers, 'Market Cap'] / dcf).where(dcf > 0.0, np.inf).round(2)
+
+    for column in BAR_COLUMNS:
+        if column in df.columns:
+            # A ticker with too few bars for a window keeps its previous value
+            values = new_values[column].dropna()
+            df.loc[values.index, column] = values.round(2) if pd.api.types.is_numeric_dtype(values) else values
+    return df
+
+
+if __name__ == '__main__':
+    import json
+    import time
+    from scoring_functions import load_scores
+
+    stocks_file_name = "./data/stocks_universe.csv"
+    scores_file_name = "./data/stocks_scores.csv"
+    metrics_config_file_name = "./metrics_config/default_metrics.json"
+
+    with open(metrics_config_file_name, 'r') as f:
+        metrics = json.load(f)
+
+    start = time.perf_counter()
+    stocks_df = pd.read_csv(stocks_file_name).set_index('Ticker')
+    stocks_df = refresh_quotes(stocks_df, store_dir=price_store.PRICE_STORE_DIR)
+    stocks_df.reset_index().to_csv(stocks_file_name, index=False)
+    load_scores(stocks_df, metrics, to_file=scores_file_name)
+    print(f"Refreshed {len(stocks_df)} stocks in {time.perf_counter() - start:.1f} s")
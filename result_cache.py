@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+RESULT_CACHE_DIR = "./data/score_cache"
+MAX_CACHED_RESULTS = 16
+MAX_DISK_RESULTS = 64
+
+# Process-wide: shared by all the sessions of the app (and the threads of the API server)
+_results = OrderedDict()
+_lock = threading.Lock()
+# Keys being computed, so that concurrent requests for the same result compute it once
+_pending = {}
+_stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def metrics_hash(metrics):
+    """
+    Returns a canonical hash of a metrics configuration: only the metrics with a positive weight
+    change the scores, and neither the order of the metrics nor 1 vs 1.0 matter.
+    """
+    canonical = {
+        metric: [config['preference'], float(config['weight']), bool(config.get('penalize_negative', False))]
+        for metric, config in metrics.items() if config['weight'] > 0.0
+    }
+    return hashlib.sha1(json.dumps(canonical, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _file_name(cache_dir, key):
+    return os.path.join(cache_dir, f"{key[0]}-{key[1]}.pkl")
+
+
+def _read(cache_dir, key):
+    file_name = _file_name(cache_dir, key)
+    try:
+        value = pd.read_pickle(file_name)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Could not read cached result {file_name}: {e}")
+        return None
+    # Mark it as recently used, for the pruning of the directory
+    os.utime(file_name)
+    return value
+
+
+def _write(cache_dir, key, value, max_files):
+    os.makedirs(cache_dir, exist_ok=True)
+    file_name = _file_name(cache_dir, key)
+    tmp_file_name = f"{file_name}.{threading.get_ident()}.tmp"
+    pd.to_pickle(value, tmp_file_name)
+    os.replace(tmp_file_name, file_name)
+    files = sorted(
+        (os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith(".pkl")),
+        key=os.path.getmtime
+    )
+    for old_file_name in files[:max(0, len(files) - max_files)]:
+        os.remove(old_file_name)
+
+
+def _insert(key, value, max_size):
+    # With the lock held
+    _results[key] = value
+    _results.move_to_end(key)
+    while len(_results) > max_size:
+        _results.popitem(last=False)
+        _stats['evictions'] += 1
+
+
+def cached_result(version, metrics, compute, cache_dir=None, max_size=MAX_CACHED_RESULTS, max_files=MAX_DISK_RESULTS):
+    """
+    Returns the result computed from a dataset version with a metrics configuration, from the
+    process-wide LRU cache, from disk, or by calling compute() once: sessions with identical
+    configurations share it.
+
+    Parameters:
+    - version: The dataset version (see snapshot.dataset_version).
+    - metrics: The metrics configuration, hashed with metrics_hash.
+    - compute: A function without arguments computing the result. Results are shared: do not modify them.
+    - cache_dir: The directory the results are also kept in (memory only if None).
+    - max_size: The number of results kept in memory.
+    - max_files: The number of results kept on disk.
+    """
+    key = (version, metrics_hash(metrics))
+    with _lock:
+        if key in _results:
+            _results.move_to_end(key)
+            _stats['hits'] += 1
+            return _results[key]
+        event = _pending.get(key)
+        owner = event is None
+        if owner:
+            event = _pending[key] = threading.Event()
+
+    if not owner:
+        # Another thread is computing it
+        event.wait()
+        with _lock:
+            if key in _results:
+                _stats['hits'] += 1
+                return _results[key]
+        return cached_result(version, metrics, compute, cache_dir, max_size, max_files)
+
+    try:
+        value = _read(cache_dir, key) if cache_dir else None
+        from_disk = value is not None
+        if not from_disk:
+            value = compute()
+            if cache_dir:
+                _write(cache_dir, key, value, max_files)
+        with _lock:
+            _stats['disk_hits' if from_disk else 'misses'] += 1
+            _insert(key, value, max_size)
+        return value
+    finally:
+        with _lock:
+            del _pending[key]
+        event.set()
+
+
+def put_result(version, metrics, value, max_size=MAX_CACHED_RESULTS):
+    """
+    Adds an already computed result to the cache (in memory only).
+    """
+    with _lock:
+        _insert((version, metrics_hash(metrics)), value, max_size)
+
+
+def cache_stats():
+    """
+    Returns the counts of hits (memory and disk), misses and evictions, the hit rate and the number
+    of results in memory.
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats['size'] = len(_results)
+    requests = stats['hits'] + stats['disk_hits'] + stats['misses']
+    stats['hit_rate'] = (stats['hits'] + stats['disk_hits']) / requests if requests else 0.0
+    return stats
+
+
+def clear_cache():
+    with _lock:
+        _results.clear()
+        for name in _stats:
+            _stats[name] = 0
+
+
+if __name__ == '__main__':
+    # Self-check: concurrent sessions with the same configuration compute the scores once
+    import copy
+    import tempfile
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from benchmarks.synthetic import make_universe
+    from scoring_functions import load_scores
+
+    with open("./metrics_config/default_metrics.json", 'r') as f:
+        metrics = json.load(f)
+    df = make_universe(5000, seed=7).set_index('Ticker')
+    n_computed = []
+
+    def compute(metrics):
+        n_computed.append(1)
+        return load_scores(df, metrics, return_merged=False)
+
+    # The same configuration, reordered and with integer weights
+    reordered = {metric: {**config, 'weight': int(config['weight']) if config['weight'] == int(config['weight']) else config['weight']}
+                 for metric, config in reversed(list(metrics.items()))}
+    assert metrics_hash(reordered) == metrics_hash(metrics)
+    custom = copy.deepcopy(metrics)
+    custom[next(iter(custom))]['weight'] += 1.0
+    assert metrics_hash(custom) != metrics_hash(metrics)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(
+                lambda m: cached_result('v1', m, lambda: compute(m), cache_dir),
+                [metrics, reordered] * 8 + [custom] * 4
+            ))
+        print(f"20 sessions served in {(time.perf_counter() - start) * 1000:.0f} ms, {len(n_computed)} score sets computed")
+        assert len(n_computed) == 2
+        assert all(r is results[0] for r in results[:16]) and results[16] is not results[0]
+
+        start = time.perf_counter()
+        cached_result('v1', metrics, lambda: compute(metrics), cache_dir)
+        print(f"Memory hit in {(time.perf_counter() - start) * 1e6:.0f} us")
+
+        # A new process (cleared memory) reads the scores from disk
+        clear_cache()
+        start = time.perf_counter()
+        global_scores_df, sector_scores_df = cached_result('v1', metrics, lambda: compute(metrics), cache_dir)
+        print(f"Disk hit in {(time.perf_counter() - start) * 1000:.1f} ms")
+        assert len(n_computed) == 2
+        pd.testing.assert_frame_equal(global_scores_df, results[0][0])
+
+        # LRU eviction
+        for i in range(3):
+            cached_result(f'v{i + 2}', metrics, lambda: compute(metrics), max_size=2)
+        stats = cache_stats()
+        print(stats)
+        assert stats['size'] == 2 and stats['evictions'] == 2 and stats['disk_hits'] == 1
+    print("Result cache OK")
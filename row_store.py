@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from scoring_functions import calculate_group_scores
+
+
+def build_row_store(stocks_df, global_scores_df, sector_scores_df, metrics, peer_column='Industry'):
+    """
+    Builds a keyed store holding, for every ticker, the raw metrics, the global and sector percentiles and
+    the percentiles relative to its peers (same Industry), so that any set of tickers can be read at once.
+
+    Numeric columns are stored in a single row-major float matrix and text columns in an object matrix,
+    so that reading N tickers is one gather of N rows instead of a .loc and a concat per frame.
+
+    Parameters:
+    - stocks_df: The stocks DataFrame, indexed by Ticker.
+    - global_scores_df, sector_scores_df: The score DataFrames, indexed by Ticker.
+    - metrics: The metrics configuration used for the peer group percentiles.
+    - peer_column: The column defining the peer groups.
+
+    Returns:
+    - A dictionary with the tickers, their row positions, the column names and the two matrices.
+    """
+    peer_scores_df = calculate_group_scores(stocks_df, metrics, peer_column)
+    frames = [stocks_df]
+    for scores_df in [global_scores_df, sector_scores_df, peer_scores_df]:
+        frames.append(scores_df.drop(columns=[c for c in scores_df.columns if c in stocks_df.columns]).reindex(stocks_df.index))
+    df = pd.concat(frames, axis=1)
+
+    numeric_columns = list(df.select_dtypes(include='number').columns)
+    text_columns = [c for c in df.columns if c not in numeric_columns]
+    return {
+        'tickers': stocks_df.index.to_numpy(),
+        'positions': {ticker: i for i, ticker in enumerate(stocks_df.index)},
+        'peer_column': peer_column,
+        'numeric_columns': numeric_columns,
+        'numeric': np.ascontiguousarray(df[numeric_columns].to_numpy(dtype=float)),
+        'text_columns': text_columns,
+        'text': df[text_columns].to_numpy(dtype=object),
+    }
+
+
+def gather_rows(store, tickers, columns=None):
+    """
+    Reads the rows of the given tickers (unknown tickers are skipped) in one gather.
+
+    Returns:
+    - A DataFrame indexed by Ticker, with the requested columns (all columns if None).
+    """
+    tickers = [t for t in tickers if t in store['positions']]
+    positions = np.fromiter((store['positions'][t] for t in tickers), dtype=np.intp, count=len(tickers))
+    numeric = pd.DataFrame(store['numeric'].take(positions, axis=0), index=tickers, columns=store['numeric_columns'])
+    text = pd.DataFrame(store['text'].take(positions, axis=0), index=tickers, columns=store['text_columns'])
+    df = pd.concat([text, numeric], axis=1)
+    df.index.name = 'Ticker'
+    if columns is not None:
+        df = df.loc[:, [c for c in columns if c in df.columns]]
+    return df
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+
+def build_attribution(global_scores_df, sector_scores_df, metrics):
+    """
+    Builds the score attribution matrices: the weighted contribution of every metric to the
+    Overall_Score and to the Sector_Score of every ticker, weight * percentile / total weight, so that
+    the contributions of a ticker add up to its score (missing percentiles contribute 0).
+
+    Parameters:
+    - global_scores_df, sector_scores_df: The score DataFrames, indexed by Ticker.
+    - metrics: The metrics configuration the scores were computed with.
+
+    Returns:
+    - A dictionary with the tickers, their row positions, the scored metrics, their weights and the
+      two tickers x metrics float32 matrices ('global' and 'sector').
+    """
+    scored = [
+        metric for metric, config in metrics.items()
+        if config['weight'] > 0.0 and f"{metric}_Score" in global_scores_df.columns
+    ]
+    weights = np.array([metrics[metric]['weight'] for metric in scored], dtype=float)
+    share = weights / weights.sum() if len(scored) else weights
+    sector_scores_df = sector_scores_df.reindex(global_scores_df.index)
+    sector_columns = [f"{metric}_Sector_Score" for metric in scored]
+
+    global_scores = global_scores_df.loc[:, [f"{metric}_Score" for metric in scored]].to_numpy(dtype=float)
+    sector_scores = sector_scores_df.reindex(columns=sector_columns).to_numpy(dtype=float)
+    return {
+        'tickers': global_scores_df.index.to_numpy(),
+        'positions': {ticker: i for i, ticker in enumerate(global_scores_df.index)},
+        'metrics': scored,
+        'weights': weights.astype(np.float32),
+        'global': np.nan_to_num(global_scores * share, nan=0.0).astype(np.float32),
+        'sector': np.nan_to_num(sector_scores * share, nan=0.0).astype(np.float32),
+    }
+
+
+def contributions(attribution, ticker, kind='global'):
+    """
+    Returns the contribution of every metric to the score of a ticker ('global' for the Overall_Score,
+    'sector' for the Sector_Score).
+    """
+    return pd.Series(attribution[kind][attribution['positions'][ticker]], index=attribution['metrics'], dtype=float)
+
+
+def top_drivers(attribution, ticker, n=5, kind='global'):
+    """
+    Returns the n metrics contributing the most to the score of a ticker, with their contribution,
+    the points they could still add (their maximum contribution minus the actual one) and their
+    share of the score.
+    """
+    contribution = contributions(attribution, ticker, kind)
+    maximum = pd.Series(attribution['weights'] / attribution['weights'].sum() * 100, index=attribution['metrics'], dtype=float)
+    drivers = pd.DataFrame({
+        'Contribution': contribution,
+        'Missed': maximum - contribution,
+        'Share (%)': contribution / contribution.sum() * 100 if contribution.sum() else 0.0,
+    })
+    return drivers.nlargest(n, 'Contribution')
+
+
+def separating_metrics(attribution, ticker, peer, n=5, kind='global'):
+    """
+    Returns the n metrics whose contributions differ the most between a ticker and a peer: the
+    differences of all the metrics add up to the difference of their scores.
+    """
+    df = pd.DataFrame({
+        ticker: contributions(attribution, ticker, kind),
+        peer: contributions(attribution, peer, kind),
+    })
+    df['Difference'] = df[ticker] - df[peer]
+    return df.loc[df['Difference'].abs().nlargest(n).index]
+
+
+if __name__ == '__main__':
+    # Self-check: the contributions add up to the scores and the queries agree with the score columns
+    import json
+    import time
+    from benchmarks.synthetic import make_universe
+    from scoring_functions import load_scores
+
+    with open("./metrics_config/default_metrics.json", 'r') as f:
+        metrics = json.load(f)
+
+    df = make_universe(10000, seed=6).set_index('Ticker')
+    global_scores_df, sector_scores_df = load_scores(df, metrics, return_merged=False)
+    start = time.perf_counter()
+    attribution = build_attribution(global_scores_df, sector_scores_df, metrics)
+    print(f"Attribution of {len(df)} tickers x {len(attribution['metrics'])} metrics built in "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms, {(attribution['global'].nbytes + attribution['sector'].nbytes) / 2 ** 20:.1f} MB")
+
+    # The scores are rounded to 2 decimals per metric: the sums match up to the rounding
+    assert np.allclose(attribution['global'].sum(axis=1), global_scores_df['Overall_Score'], atol=0.02)
+    assert np.allclose(attribution['sector'].sum(axis=1), sector_scores_df['Sector_Score'], atol=0.02)
+
+    ticker, peer = global_scores_df['Overall_Score'].nlargest(2).index
+    start = time.perf_counter()
+    drivers = top_drivers(attribution, ticker)
+    separating = separating_metrics(attribution, ticker, peer, kind='sector')
+    print(f"Queries answered in {(time.perf_counter() - start) * 1000:.2f} ms")
+    print(drivers.round(2))
+    print(separating.round(2))
+    metric_scores = global_scores_df.loc[ticker, [f"{m}_Score" for m in attribution['metrics']]].astype(float)
+    weighted = metric_scores.fillna(0).to_numpy() * attribution['weights']
+    assert drivers.index[0] == attribution['metrics'][int(np.argmax(weighted))]
+    assert abs(contributions(attribution, ticker, 'sector').sum() - contributions(attribution, peer, 'sector').sum()
+               - (sector_scores_df.at[ticker, 'Sector_Score'] - sector_scores_df.at[peer, 'Sector_Score'])) < 0.03
+    print("Attribution matches the scores")
@@ -1,6 +1,14 @@
 import pandas as pd
 import numpy as np
-from scipy import stats
+
+def scored_metrics(df, metrics):
+    """
+    Returns the (metric, config) pairs that are scored: numeric columns of df with a positive weight.
+    """
+    return [
+        (metric, config) for metric, config in metrics.items()
+        if metric in df.columns and np.issubdtype(df[metric].dtype, np.number) and config['weight'] > 0.0
+    ]
 
 def calculate_scores(df, metrics, show_unweighted=True):
     """
@@ -80,14 +88,34 @@ def calculate_sector_scores(df, metrics, show_unweighted=True):
     Returns:
     - A DataFrame with 'Sector Score' for each row, relative to its sector.
     """
-    if 'Sector' not in df.columns:
-        raise ValueError("The DataFrame must contain a 'Sector' column to calculate sector-specific scores.")
+    return calculate_group_scores(df, metrics, 'Sector', show_unweighted)
+
+def calculate_group_scores(df, metrics, group_column, show_unweighted=True):
+    """
+    Calculates scores for each row in the DataFrame relative to the rows with the same value of group_column
+    (e.g. 'Sector' or 'Industry'). The columns are named '<metric>_<group_column>_Score' and '<group_column>_Score'.
+
+    Parameters:
+    - df: The DataFrame containing the dataset.
+    - metrics: The metrics configuration, as in calculate_sector_scores.
+    - group_column: The column defining the peer groups.
+    - show_unweighted: if True, the scores for each metric will be returned unweighted.
+
+    Returns:
+    - A DataFrame with '<group_column>_Score' for each row, relative to its group.
+    """
+    if group_column not in df.columns:
+        raise ValueError(f"The DataFrame must contain a '{group_column}' column to calculate {group_column.lower()}-specific scores.")
+
+    # scipy is slow to import, so it is only loaded when group scores are actually computed
+    from scipy import stats
 
     df_ = df.copy()
     if 'Ticker' in df_.columns:
         df_ = df_.set_index('Ticker')
     scores_df = pd.DataFrame(index=df_.index)
     weights = []
+    suffix = f'_{group_column}_Score'
 
 
     for metric, config in metrics.items():
@@ -96,15 +124,15 @@ def calculate_sector_scores(df, metrics, show_unweighted=True):
         penalize_negative = config.get('penalize_negative', False)
 
         if metric in df_.columns and np.issubdtype(df_[metric].dtype, np.number) and weight > 0.0:
-            # Create a DataFrame for the metric and sector
-            metric_values = df_[[metric, 'Sector']]
+            # Create a DataFrame for the metric and group
+            metric_values = df_[[metric, group_column]]
 
             # Mask negative values if penalize_negative is True (temporarily)
             if penalize_negative:
                 metric_values.loc[metric_values[metric] < 0, metric] = np.nan
 
-            # Calculate percentiles grouped by sector, handling NaNs properly
-            sector_percentiles = metric_values.groupby('Sector')[metric].transform(
+            # Calculate percentiles grouped by group_column, handling NaNs properly
+            group_percentiles = metric_values.groupby(group_column)[metric].transform(
                 lambda x: pd.Series(
                     stats.rankdata(x.dropna(), method='average') / len(x.dropna()) * 100,
                     index=x.dropna().index
@@ -113,25 +141,25 @@ def calculate_sector_scores(df, metrics, show_unweighted=True):
 
             # Adjust percentiles for preference (high or low)
             if preference == 'low':
-                sector_percentiles = 100 - sector_percentiles
+                group_percentiles = 100 - group_percentiles
 
             # Penalize rows with negative values explicitly if penalize_negative is True
             if penalize_negative:
-                sector_percentiles[df_[metric] < 0] = 0
+                group_percentiles[df_[metric] < 0] = 0
 
             # Weight the scores and store them
-            scores_df[metric + '_Sector_Score'] = sector_percentiles * weight
+            scores_df[metric + suffix] = group_percentiles * weight
             weights.append(weight)
 
-    # Calculate weighted sector score
-    scores_df['Sector_Score'] = scores_df.sum(axis=1) / sum(weights)
-    scores_df['Sector'] = df['Sector']
+    # Calculate weighted group score
+    scores_df[f'{group_column}_Score'] = scores_df.sum(axis=1) / sum(weights)
+    scores_df[group_column] = df[group_column]
 
     if show_unweighted:
         for metric, config in metrics.items():
             weight = config['weight']
-            if metric + '_Sector_Score' in scores_df.columns:
-                scores_df[metric + '_Sector_Score'] /= weight
+            if metric + suffix in scores_df.columns:
+                scores_df[metric + suffix] /= weight
 
     return scores_df.round(2)
 
@@ -160,12 +188,18 @@ def load_scores(df, metrics, from_file=None, to_file=None, return_merged=True):
         
         
     if not return_merged: 
-        sector_columns = [c for c in df_scores.columns if c.endswith('Sector_Score') or c == 'Sector']
-        df_sector_scores = df_scores.loc[:,sector_columns]
-        df_scores = df_scores.loc[:,[c for c in df_scores if c not in sector_columns or c == 'Sector']]
-        return df_scores, df_sector_scores
+        return split_scores(df_scores)
         
-    return df_scores 
+    return df_scores
+
+def split_scores(df_scores):
+    """
+    Splits the merged scores (as returned by get_scores) into the global and the sector scores DataFrames.
+    """
+    sector_columns = [c for c in df_scores.columns if c.endswith('Sector_Score') or c == 'Sector']
+    df_sector_scores = df_scores.loc[:,sector_columns]
+    df_scores = df_scores.loc[:,[c for c in df_scores if c not in sector_columns or c == 'Sector']]
+    return df_scores, df_sector_scores 
         
 
 
@@ -0,0 +1,450 @@
+"""
+Read-only HTTP API serving the scores of the current snapshot (see snapshot.py), for services that
+do not go through the Streamlit app.
+
+    GET  /version                          The dataset version
+    GET  /top?k=20&sector=...&by=overall   Top k stocks by Overall_Score (by=sector: Sector_Score)
+    GET  /ticker/AAPL                      The metrics and scores of one stock
+    GET  /filter?q=DCF Ratio < 1&limit=100 The stocks matching a filter (see filter_engine)
+    POST /score                            Top k with custom weights: {"weights": {"ROE": 2, ...}, "k": 20, "sector": ..., "by": ...}
+
+GET responses carry the dataset version and the format of the response as ETag and answer 304
+to a matching If-None-Match. Tables
+are returned as JSON ({"version", "columns", "data"}) or, with ?format=arrow or an
+'Accept: application/vnd.apache.arrow.stream' header, as an Arrow IPC stream.
+
+Usage:
+    python screening_api.py serve [--port 8502] [--snapshot ./data/snapshot.pkl]
+    python screening_api.py self-check
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+import numpy as np
+import pandas as pd
+from filter_engine import compile_filter, evaluate_filter, text_columns
+from result_cache import cached_result
+from snapshot import load_snapshot
+
+SNAPSHOT_FILE = "./data/snapshot.pkl"
+PERCENTILES_DIR = "./data/api"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+SUMMARY_COLUMNS = ['Company', 'Sector', 'Industry', 'Price', 'Market Cap']
+# Snapshot file checked for a new version at most every RELOAD_INTERVAL seconds
+RELOAD_INTERVAL = 1.0
+MAX_ROWS = 1000
+# Files written by export_percentiles: <version>-global.npy and <version>-sector.npy
+PERCENTILES_PATTERN = re.compile(r"^(.+)-(global|sector)\.npy(\.tmp\.npy)?$")
+
+_state = {'snapshot': None, 'mtime': None, 'checked': 0.0}
+_lock = threading.Lock()
+# The mask cache of the filter index (filter_engine) is shared by the request threads and not thread-safe
+_filter_lock = threading.Lock()
+
+
+### DATA
+
+def export_percentiles(snapshot, directory=PERCENTILES_DIR):
+    """
+    Writes the per-metric percentiles of a snapshot (unweighted, global and within the sector) as
+    tickers x metrics float32 .npy files, once per dataset version, removes the files of the other
+    versions and opens them memory-mapped.
+
+    Returns:
+    - A dictionary with the scored 'metrics', their default 'weights' and the 'global' and 'sector' matrices.
+    """
+    attribution = snapshot['attribution']
+    metrics = attribution['metrics']
+    prefix = os.path.join(directory, snapshot['version'])
+    for kind, suffix in [('global', '_Score'), ('sector', '_Sector_Score')]:
+        file_name = f"{prefix}-{kind}.npy"
+        if not os.path.exists(file_name):
+            scores_df = snapshot['global_scores_df' if kind == 'global' else 'sector_scores_df']
+            values = scores_df.reindex(index=attribution['tickers'], columns=[m + suffix for m in metrics])
+            os.makedirs(directory, exist_ok=True)
+            np.save(file_name + ".tmp.npy", values.to_numpy(dtype=np.float32))
+            os.replace(file_name + ".tmp.npy", file_name)
+    _prune_percentiles(directory, snapshot['version'])
+    return {
+        'metrics': metrics,
+        'weights': dict(zip(metrics, attribution['weights'].astype(float))),
+        'global': np.load(f"{prefix}-global.npy", mmap_mode='r'),
+        'sector': np.load(f"{prefix}-sector.npy", mmap_mode='r'),
+    }
+
+
+def _prune_percentiles(directory, version):
+    # The files of the other versions (the ones being served stay readable until they are unmapped)
+    for name in os.listdir(directory):
+        match = PERCENTILES_PATTERN.match(name)
+        if match and match.group(1) != version:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError as e:
+                print(f"Could not remove {name}: {e}")
+
+
+def current_snapshot(file_name=SNAPSHOT_FILE, percentiles_dir=PERCENTILES_DIR):
+    """
+    Returns the snapshot served, reloaded when the snapshot file changes (e.g. after a data update
+    in the app), with its memory-mapped percentiles under 'percentiles'.
+    """
+    with _lock:
+        now = time.monotonic()
+        if _state['snapshot'] is not None and now - _state['checked'] < RELOAD_INTERVAL:
+            return _state['snapshot']
+        _state['checked'] = now
+        mtime = os.path.getmtime(file_name) if os.path.exists(file_name) else None
+        if _state['snapshot'] is None or mtime != _state['mtime']:
+            snapshot = load_snapshot(file_name)
+            if snapshot is None:
+                if _state['snapshot'] is None:
+                    raise ValueError(f"No snapshot in {file_name}: open the app or run data_loader.py first.")
+                print(f"Could not load {file_name}, still serving version {_state['snapshot']['version']}")
+            else:
+                snapshot['percentiles'] = export_percentiles(snapshot, percentiles_dir)
+                _state['snapshot'] = snapshot
+            _state['mtime'] = mtime
+        return _state['snapshot']
+
+
+def _summary(snapshot, tickers):
+    stocks_df = snapshot['stocks_df']
+    df = stocks_df.loc[tickers, [c for c in SUMMARY_COLUMNS if c in stocks_df.columns]]
+    df['Overall_Score'] = snapshot['global_scores_df']['Overall_Score'].reindex(tickers)
+    df['Sector_Score'] = snapshot['sector_scores_df']['Sector_Score'].reindex(tickers)
+    return df.rename_axis('Ticker').reset_index()
+
+
+def top_stocks(snapshot, k=20, sector=None, by='overall'):
+    """
+    Returns the k stocks with the best Overall_Score (by='overall') or Sector_Score (by='sector'),
+    optionally in one sector, read from the sorted indexes of the snapshot.
+    """
+    table = 'global_scores' if by == 'overall' else 'sector_scores'
+    index = snapshot['indexes'][table][2]
+    positions = index['order'].get('All' if sector is None else sector, np.array([], dtype=int))
+    scores_df = snapshot['global_scores_df' if by == 'overall' else 'sector_scores_df']
+    return _summary(snapshot, scores_df.index[positions[:k]])
+
+
+def filter_stocks(snapshot, expression, limit=100):
+    """
+    Returns the first limit stocks (by Overall_Score) matching a filter expression.
+    """
+    stocks_df = snapshot['stocks_df']
+    compiled = compile_filter(expression, stocks_df.columns, text_columns(stocks_df))
+    with _filter_lock:
+        mask = evaluate_filter(compiled, stocks_df, snapshot['filter_index'])
+    tickers = stocks_df.index[mask]
+    scores = snapshot['global_scores_df']['Overall_Score'].reindex(tickers)
+    return _summary(snapshot, scores.sort_values(ascending=False, na_position='last').index[:limit])
+
+
+def custom_scores(snapshot, weights):
+    """
+    Scores all the stocks with custom metric weights from the cached percentile matrices, as
+    scoring_functions does: the weighted percentiles (missing ones count 0) over the sum of the weights.
+    The metrics that are not given keep their weight.
+
+    Returns:
+    - The Overall_Score and Sector_Score Series, indexed by Ticker.
+    """
+    percentiles = snapshot['percentiles']
+    unknown = [metric for metric in weights if metric not in percentiles['weights']]
+    if unknown:
+        raise ValueError(f"Not scored metrics: {', '.join(unknown)}. Scored metrics: {', '.join(percentiles['metrics'])}.")
+    weights = {**percentiles['weights'], **{metric: float(w) for metric, w in weights.items()}}
+    w = np.array([weights[metric] for metric in percentiles['metrics']])
+    if (w < 0).any() or w.sum() <= 0:
+        raise ValueError("Weights must be positive, with at least one above 0.")
+
+    def compute():
+        tickers = snapshot['attribution']['tickers']
+        used = np.flatnonzero(w > 0)
+        return tuple(
+            pd.Series(np.nan_to_num(percentiles[kind][:, used], nan=0.0) @ w[used] / w.sum(), index=tickers).round(2)
+            for kind in ['global', 'sector']
+        )
+
+    # Keyed like the scores of a configuration: the preferences are already in the percentiles
+    config = {metric: {'preference': 'high', 'weight': weight} for metric, weight in weights.items()}
+    return cached_result(f"{snapshot['version']}-percentiles", config, compute)
+
+
+def top_custom(snapshot, weights, k=20, sector=None, by='overall'):
+    overall, sector_score = custom_scores(snapshot, weights)
+    scores = overall if by == 'overall' else sector_score
+    if sector is not None:
+        scores = scores.loc[snapshot['global_scores_df']['Sector'].reindex(scores.index).to_numpy() == sector]
+    df = _summary(snapshot, scores.nlargest(k).index)
+    df['Custom_Overall_Score'] = overall.reindex(df['Ticker']).to_numpy()
+    df['Custom_Sector_Score'] = sector_score.reindex(df['Ticker']).to_numpy()
+    return df
+
+
+### HTTP
+
+def _to_arrow(df):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class ScreeningHandler(BaseHTTPRequestHandler):
+    snapshot_file = SNAPSHOT_FILE
+    percentiles_dir = PERCENTILES_DIR
+    verbose = True
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type="application/json", etag=None):
+        self.send_response(status)
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Vary", "Accept")
+        if body is not None:
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, json.dumps({'error': message}).encode())
+
+    def _wants_arrow(self, query):
+        return query.get('format', [''])[0] == 'arrow' or ARROW_MEDIA_TYPE in self.headers.get('Accept', '')
+
+    def _send_table(self, df, version, query, etag=None):
+        if self._wants_arrow(query):
+            self._send(200, _to_arrow(df), ARROW_MEDIA_TYPE, etag)
+        else:
+            # pandas writes the rows directly as JSON, NaN as null
+            body = f'{{"version":"{version}",' + df.to_json(orient='split', index=False, double_precision=4)[1:]
+            self._send(200, body.encode(), etag=etag)
+
+    def _snapshot(self):
+        try:
+            return current_snapshot(self.snapshot_file, self.percentiles_dir)
+        except ValueError as e:
+            self._error(503, str(e))
+            return None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        snapshot = self._snapshot()
+        if snapshot is None:
+            return
+        version = snapshot['version']
+
+        # Routed and validated first: unknown paths and invalid queries are errors whatever the If-None-Match
+        try:
+            k = min(int(query.get('k', ['20'])[0]), MAX_ROWS)
+            limit = min(int(query.get('limit', ['100'])[0]), MAX_ROWS)
+            sector = query.get('sector', [None])[0]
+            by = query.get('by', ['overall'])[0]
+            if by not in ('overall', 'sector'):
+                raise ValueError("by must be 'overall' or 'sector'.")
+
+            df = None
+            if url.path == '/top':
+                df = top_stocks(snapshot, k, sector, by)
+            elif url.path.startswith('/ticker/'):
+                ticker = unquote(url.path[len('/ticker/'):]).upper()
+                if ticker not in snapshot['stocks_df'].index:
+                    self._error(404, f"Unknown ticker {ticker}.")
+                    return
+                row = pd.concat([
+                    snapshot['stocks_df'].loc[ticker],
+                    snapshot['global_scores_df'].loc[ticker].drop('Sector'),
+                    snapshot['sector_scores_df'].loc[ticker].drop('Sector'),
+                ])
+                df = row.to_frame().T.rename_axis('Ticker').reset_index()
+            elif url.path == '/filter':
+                df = filter_stocks(snapshot, query.get('q', [''])[0], limit)
+            elif url.path != '/version':
+                self._error(404, f"Unknown path {url.path}.")
+                return
+        except ValueError as e:
+            self._error(400, str(e))
+            return
+
+        # One ETag per version and representation: a cached JSON response does not answer an Arrow request
+        arrow = df is not None and self._wants_arrow(query)
+        etag = f'"{version}-{"arrow" if arrow else "json"}"'
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self._send(304, None, etag=etag)
+        elif df is None:
+            self._send(200, json.dumps({'version': version}).encode(), etag=etag)
+        else:
+            self._send_table(df, version, query, etag)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/score':
+            self._error(404, f"Unknown path {url.path}.")
+            return
+        snapshot = self._snapshot()
+        if snapshot is None:
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            by = request.get('by', 'overall')
+            if by not in ('overall', 'sector'):
+                raise ValueError("by must be 'overall' or 'sector'.")
+            df = top_custom(snapshot, request.get('weights', {}), min(int(request.get('k', 20)), MAX_ROWS), request.get('sector'), by)
+        except (ValueError, TypeError, AttributeError) as e:
+            self._error(400, str(e))
+            return
+        self._send_table(df, snapshot['version'], parse_qs(url.query))
+
+
+def serve(port=8502, host="127.0.0.1", snapshot_file=SNAPSHOT_FILE, percentiles_dir=PERCENTILES_DIR, verbose=True):
+    """
+    Returns the API server (not started: call serve_forever).
+    """
+    handler = type('Handler', (ScreeningHandler,), {
+        'snapshot_file': snapshot_file, 'percentiles_dir': percentiles_dir, 'verbose': verbose
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def self_check():
+    """
+    Serves a synthetic snapshot and checks every endpoint, the revalidation, the Arrow responses and
+    the custom scores against scoring_functions.
+    """
+    import copy
+    import io
+    import tempfile
+    import urllib.request
+    import urllib.error
+    import pyarrow as pa
+    from benchmarks.synthetic import make_universe
+    from scoring_functions import load_scores
+    from snapshot import build_snapshot, save_snapshot
+
+    with open("./metrics_config/default_metrics.json", 'r') as f:
+        metrics = json.load(f)
+    df = make_universe(5000, seed=8).set_index('Ticker')
+    global_scores_df, sector_scores_df = load_scores(df, metrics, return_merged=False)
+
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_file = os.path.join(directory, "snapshot.pkl")
+        snapshot = build_snapshot("v1", df, global_scores_df, sector_scores_df, metrics)
+        save_snapshot(snapshot, snapshot_file)
+        server = serve(0, snapshot_file=snapshot_file, percentiles_dir=directory, verbose=False)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+
+        def get(path, headers=None, data=None):
+            request = urllib.request.Request(base + path, headers=headers or {}, data=data)
+            try:
+                with urllib.request.urlopen(request) as response:
+                    return response.status, response.headers, response.read()
+            except urllib.error.HTTPError as e:
+                return e.code, e.headers, e.read()
+
+        start = time.perf_counter()
+        status, headers, body = get("/top?k=10")
+        print(f"First request (snapshot load, percentiles export) in {(time.perf_counter() - start) * 1000:.0f} ms")
+        top = json.loads(body)
+        assert status == 200 and headers['ETag'] == '"v1-json"' and top['version'] == 'v1'
+        assert [row[0] for row in top['data']] == global_scores_df['Overall_Score'].nlargest(10).index.tolist()
+
+        start = time.perf_counter()
+        for _ in range(100):
+            get("/top?k=50&sector=Technology&by=sector")
+        print(f"Top 50 of a sector: {(time.perf_counter() - start) * 10:.2f} ms per request")
+        status, headers, body = get("/top?k=5&sector=Technology&by=sector", {'Accept': ARROW_MEDIA_TYPE})
+        assert headers['ETag'] == '"v1-arrow"'
+        table = pa.ipc.open_stream(io.BytesIO(body)).read_all().to_pandas()
+        technology = sector_scores_df.loc[sector_scores_df['Sector'] == 'Technology', 'Sector_Score']
+        assert table['Ticker'].tolist() == technology.nlargest(5).index.tolist()
+
+        assert get("/top", {'If-None-Match': '"v1-json"'})[0] == 304
+        # Revalidation never hides an error, nor answers another representation
+        assert get("/nope", {'If-None-Match': '"v1-json"'})[0] == 404
+        assert get("/top?k=abc", {'If-None-Match': '"v1-json"'})[0] == 400
+        assert get("/top?format=arrow", {'If-None-Match': '"v1-json"'})[0] == 200
+        status, _, body = get("/ticker/" + df.index[3].lower())
+        row = json.loads(body)
+        assert status == 200 and row['data'][0][row['columns'].index('Overall_Score')] == global_scores_df['Overall_Score'].iloc[3]
+        assert get("/ticker/NOPE")[0] == 404
+
+        status, _, body = get("/filter?q=" + urllib.parse.quote("DCF Ratio < 1 and Sector = Technology") + "&limit=1000")
+        expected = df.loc[(df['DCF Ratio'] < 1) & (df['Sector'] == 'Technology')].index
+        assert status == 200 and sorted(row[0] for row in json.loads(body)['data']) == sorted(expected)
+        assert get("/filter?q=" + urllib.parse.quote("Nope > 1"))[0] == 400
+
+        # Concurrent filters evicting each other from a small mask cache
+        import filter_engine
+        from concurrent.futures import ThreadPoolExecutor
+        max_cached_masks, filter_engine.MAX_CACHED_MASKS = filter_engine.MAX_CACHED_MASKS, 4
+        with ThreadPoolExecutor(16) as pool:
+            statuses = list(pool.map(lambda i: get("/filter?q=" + urllib.parse.quote(f"ROE > {i % 20} or P/E < {i % 7}"))[0], range(400)))
+        filter_engine.MAX_CACHED_MASKS = max_cached_masks
+        assert statuses == [200] * 400
+
+        # Custom weights: the same scores as scoring_functions with these weights
+        custom = copy.deepcopy(metrics)
+        weights = {}
+        for i, metric in enumerate(snapshot['attribution']['metrics']):
+            weights[metric] = custom[metric]['weight'] = float(i % 4)
+        custom_global, custom_sector = load_scores(df, custom, return_merged=False)
+        start = time.perf_counter()
+        status, _, body = get("/score", data=json.dumps({'weights': weights, 'k': 100}).encode())
+        print(f"Custom scores of {len(df)} stocks in {(time.perf_counter() - start) * 1000:.1f} ms")
+        result = pd.DataFrame(**{k: v for k, v in json.loads(body).items() if k != 'version'}).set_index('Ticker')
+        assert status == 200
+        assert np.allclose(result['Custom_Overall_Score'], custom_global['Overall_Score'].reindex(result.index), atol=0.05)
+        assert np.allclose(result['Custom_Sector_Score'], custom_sector['Sector_Score'].reindex(result.index), atol=0.05)
+        assert get("/score", data=json.dumps({'weights': {'Nope': 1}}).encode())[0] == 400
+
+        # A new dataset version is picked up by the server
+        time.sleep(RELOAD_INTERVAL)
+        save_snapshot(build_snapshot("v2", df, global_scores_df, sector_scores_df, metrics), snapshot_file)
+        os.utime(snapshot_file, (time.time() + 1, time.time() + 1))
+        status, headers, _ = get("/version", {'If-None-Match': '"v1-json"'})
+        assert status == 200 and headers['ETag'] == '"v2-json"'
+        # The percentiles of v1 are removed, the snapshot next to them is not
+        assert sorted(os.listdir(directory)) == ['snapshot.pkl', 'v2-global.npy', 'v2-sector.npy']
+        server.shutdown()
+        server.server_close()
+    print("Screening API OK")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["serve", "self-check"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--snapshot", default=SNAPSHOT_FILE)
+    parser.add_argument("--percentiles-dir", default=PERCENTILES_DIR)
+    args = parser.parse_args()
+
+    if args.command == "self-check":
+        self_check()
+    else:
+        server = serve(args.port, args.host, args.snapshot, args.percentiles_dir)
+        print(f"Serving {args.snapshot} on http://{args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
@@ -0,0 +1,154 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+import numpy as np
+
+SEARCH_FIELDS = ['Ticker', 'Company', 'Industry', 'Sector']
+
+# Match quality multipliers, by field and by kind of match
+FIELD_WEIGHTS = {'Ticker': 8.0, 'Company': 4.0, 'Industry': 2.0, 'Sector': 1.0}
+EXACT_MATCH, PREFIX_MATCH = 1.0, 0.75
+MIN_FUZZY_SIMILARITY = 0.45
+MAX_PREFIX_TERMS = 200
+# Prefixes up to this length match many terms: their postings are merged when the index is built
+SHORT_PREFIX_LENGTH = 2
+
+
+def _normalize(text):
+    return re.sub(r"[^0-9a-z]+", " ", str(text).lower()).split()
+
+
+def _trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def build_search_index(df, fields=SEARCH_FIELDS):
+    """
+    Builds a search index over the text columns of a stocks DataFrame indexed by Ticker.
+
+    Every word of the indexed fields becomes a term. Terms are kept sorted for prefix lookups
+    (bisect on the sorted list, the array equivalent of a trie) and indexed by trigrams for
+    fuzzy lookups. The postings of very short prefixes are merged in advance.
+
+    Returns:
+    - A dictionary of plain python structures that can be pickled with the snapshot.
+    """
+    tickers = df.index.tolist() if 'Ticker' not in df.columns else df['Ticker'].tolist()
+    postings = defaultdict(dict)
+    for field in fields:
+        values = tickers if field == 'Ticker' and 'Ticker' not in df.columns else df[field].tolist()
+        weight = FIELD_WEIGHTS.get(field, 1.0)
+        for row, value in enumerate(values):
+            if not isinstance(value, str):
+                continue
+            words = _normalize(value)
+            if field == 'Ticker' and len(words) > 1:
+                words.append(''.join(words))
+            for word in words:
+                if postings[word].get(row, 0.0) < weight:
+                    postings[word][row] = weight
+
+    terms = sorted(postings)
+    trigram_terms = defaultdict(list)
+    short_prefixes = defaultdict(dict)
+    for term_id, term in enumerate(terms):
+        for trigram in _trigrams(term):
+            trigram_terms[trigram].append(term_id)
+        for length in range(1, SHORT_PREFIX_LENGTH + 1):
+            if len(term) > length:
+                prefix_postings = short_prefixes[term[:length]]
+                for row, weight in postings[term].items():
+                    if prefix_postings.get(row, 0.0) < weight * PREFIX_MATCH:
+                        prefix_postings[row] = weight * PREFIX_MATCH
+
+    return {
+        'tickers': np.array(tickers, dtype=object),
+        'ticker_rank': np.argsort(np.argsort(np.array(tickers, dtype=str), kind='stable')),
+        'terms': terms,
+        'postings': [_to_arrays(postings[t]) for t in terms],
+        'trigrams': dict(trigram_terms),
+        'short_prefixes': {p: _to_arrays(rows) for p, rows in short_prefixes.items()},
+    }
+
+
+def _to_arrays(postings):
+    return np.fromiter(postings.keys(), dtype=np.int32), np.fromiter(postings.values(), dtype=np.float32)
+
+
+def _add_matches(scores, rows, weights):
+    scores[rows] = np.maximum(scores[rows], weights)
+
+
+def _match_word(index, word, fuzzy):
+    """
+    Returns the score of every row for one query word: exact and prefix matches, then fuzzy matches
+    if there are none. Rows that do not match score 0.
+    """
+    terms, postings = index['terms'], index['postings']
+    scores = np.zeros(len(index['tickers']), dtype=np.float32)
+    found = False
+    if len(word) <= SHORT_PREFIX_LENGTH:
+        # Proper prefix matches are precomputed, only the exact term is left to add
+        if word in index['short_prefixes']:
+            _add_matches(scores, *index['short_prefixes'][word])
+            found = True
+        position = bisect_left(terms, word)
+        if position < len(terms) and terms[position] == word:
+            _add_matches(scores, postings[position][0], postings[position][1] * EXACT_MATCH)
+            found = True
+        return scores
+
+    position = bisect_left(terms, word)
+    end = min(position + MAX_PREFIX_TERMS, len(terms))
+    while position < end and terms[position].startswith(word):
+        rows, weights = postings[position]
+        _add_matches(scores, rows, weights * (EXACT_MATCH if terms[position] == word else PREFIX_MATCH))
+        found = True
+        position += 1
+    if found or not fuzzy:
+        return scores
+
+    query_trigrams = _trigrams(word)
+    shared = defaultdict(int)
+    for trigram in query_trigrams:
+        for term_id in index['trigrams'].get(trigram, ()):
+            shared[term_id] += 1
+    for term_id, count in shared.items():
+        # Dice coefficient between the trigram sets
+        similarity = 2 * count / (len(query_trigrams) + len(terms[term_id]) + 1)
+        if similarity >= MIN_FUZZY_SIMILARITY:
+            rows, weights = postings[term_id]
+            _add_matches(scores, rows, weights * similarity * PREFIX_MATCH)
+    return scores
+
+
+def search(index, query, limit=10, fuzzy=True):
+    """
+    Searches tickers by ticker, company, industry or sector. Every word of the query must match
+    (exactly, as a prefix, or approximately if fuzzy is True).
+
+    Returns:
+    - The list of matching tickers, best matches first (ties by ticker).
+    """
+    words = _normalize(query)
+    if not words:
+        return []
+    total = None
+    for word in words:
+        scores = _match_word(index, word, fuzzy)
+        total = scores if total is None else np.where((total > 0) & (scores > 0), total + scores, 0)
+    candidates = np.flatnonzero(total)
+
+    # Keep the best `limit` rows without sorting all the candidates
+    if len(candidates) > limit:
+        candidate_scores = total[candidates]
+        threshold = -np.partition(-candidate_scores, limit - 1)[limit - 1]
+        above = candidates[candidate_scores > threshold]
+        tied = candidates[candidate_scores == threshold]
+        needed = limit - len(above)
+        if len(tied) > needed:
+            tied = tied[np.argpartition(index['ticker_rank'][tied], needed - 1)[:needed]]
+        candidates = np.concatenate([above, tied])
+    order = np.lexsort((index['ticker_rank'][candidates], -total[candidates]))
+    return index['tickers'][candidates[order]].tolist()
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import pandas as pd
+from table_views import build_sorted_index
+from search_index import build_search_index
+from row_store import build_row_store
+from filter_engine import build_filter_index
+from score_attribution import build_attribution
+from result_cache import metrics_hash
+
+SNAPSHOT_FORMAT = 6
+
+
+def dataset_version(*file_names):
+    """
+    Returns a short content hash of the given dataset files. Everything derived from the
+    stocks/scores files (snapshot, views, indexes) is tagged with this version.
+    """
+    digest = hashlib.sha1()
+    for file_name in file_names:
+        with open(file_name, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def build_snapshot(version, stocks_df, global_scores_df, sector_scores_df, metrics):
+    """
+    Bundles the frames of a dataset version with the sorted indexes backing the paginated tables
+    (see table_views.build_sorted_index), the ticker search index, the filter index, the row
+    store used for comparisons (with the peer percentiles computed from metrics) and the score
+    attribution matrices, so that nothing needs to be sorted or indexed at startup. The scores
+    are tagged with the hash of metrics (see result_cache.metrics_hash).
+    """
+    return {
+        'format': SNAPSHOT_FORMAT,
+        'version': version,
+        'metrics_hash': metrics_hash(metrics),
+        'stocks_df': stocks_df,
+        'global_scores_df': global_scores_df,
+        'sector_scores_df': sector_scores_df,
+        'indexes': {
+            'stocks': (None, False, build_sorted_index(stocks_df)),
+            'global_scores': ('Overall_Score', False, build_sorted_index(global_scores_df, 'Overall_Score')),
+            'sector_scores': ('Sector_Score', False, build_sorted_index(sector_scores_df, 'Sector_Score')),
+        },
+        'search_index': build_search_index(stocks_df),
+        'filter_index': build_filter_index(stocks_df),
+        'row_store': build_row_store(stocks_df, global_scores_df, sector_scores_df, metrics),
+        'attribution': build_attribution(global_scores_df, sector_scores_df, metrics),
+    }
+
+
+def save_snapshot(snapshot, file_name):
+    os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+    tmp_file_name = file_name + ".tmp"
+    pd.to_pickle(snapshot, tmp_file_name)
+    os.replace(tmp_file_name, file_name)
+
+
+def load_snapshot(file_name, version=None):
+    """
+    Loads a snapshot from file. Returns None if there is no snapshot, if it was written with an
+    older format, or if its version differs from the requested one.
+    """
+    if not os.path.exists(file_name):
+        return None
+    try:
+        snapshot = pd.read_pickle(file_name)
+    except Exception as e:
+        print(f"Could not read snapshot {file_name}: {e}")
+        return None
+    if snapshot.get('format') != SNAPSHOT_FORMAT:
+        return None
+    if version is not None and snapshot.get('version') != version:
+        return None
+    return snapshot
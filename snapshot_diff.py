@@ -0,0 +1,343 @@
+"""
+Differences between two dataset versions (snapshots, see snapshot.py) and watchlist alerts.
+
+The tickers of both versions are aligned, the rank and score deltas are computed for all of them at
+once, and all the alert rules (filters, see filter_engine) are evaluated in one pass over the filter
+index of each snapshot, sharing its mask cache. Every diff is appended as one JSON line to the change
+log, which the Changes page and this CLI read.
+
+Usage:
+    python snapshot_diff.py show [--log ./data/change_log.jsonl] [--last 1]
+    python snapshot_diff.py diff OLD_SNAPSHOT NEW_SNAPSHOT [--top 20] [--threshold 5] [--append]
+    python snapshot_diff.py self-check
+"""
+import argparse
+import json
+import os
+from collections import deque
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from filter_engine import compile_filter, evaluate_filter, text_columns, _node_columns
+
+CHANGE_LOG_FILE = "./data/change_log.jsonl"
+ALERT_RULES_FILE = "./data/alert_rules.json"
+TOP_N = 20
+SCORE_MOVE_THRESHOLD = 5.0
+
+
+def load_alert_rules(file_name=ALERT_RULES_FILE):
+    """
+    Loads the alert rules of all the users: a dictionary mapping every user to a list of rules, each
+    with a 'name', a 'filter' (a filter expression over the stocks columns, e.g. "DCF Ratio < 1") and
+    optionally the 'tickers' of a watchlist the rule is restricted to.
+
+    Returns an empty dictionary if the file does not exist.
+    """
+    try:
+        with open(file_name, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_alert_rules(rules, file_name=ALERT_RULES_FILE):
+    os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+    with open(file_name, "w") as f:
+        json.dump(rules, f, indent=1)
+
+
+def _ranks(scores_df, score_column):
+    """
+    Ranks of the tickers (1 for the best score), overall and within their sector.
+    """
+    overall = scores_df[score_column].rank(ascending=False, method='min')
+    sector = scores_df.groupby('Sector')[score_column].rank(ascending=False, method='min')
+    return overall, sector
+
+
+def align_versions(old, new):
+    """
+    Aligns the scores of two snapshots by ticker (tickers of either version).
+
+    Returns:
+    - A DataFrame indexed by Ticker with the old and new scores, ranks, sector ranks and sectors.
+    """
+    tickers = new['global_scores_df'].index.union(old['global_scores_df'].index)
+    columns = {}
+    for prefix, snapshot in [('old', old), ('new', new)]:
+        global_scores_df = snapshot['global_scores_df']
+        rank, _ = _ranks(global_scores_df, 'Overall_Score')
+        _, sector_rank = _ranks(snapshot['sector_scores_df'], 'Sector_Score')
+        columns[f'{prefix}_score'] = global_scores_df['Overall_Score'].reindex(tickers)
+        columns[f'{prefix}_rank'] = rank.reindex(tickers)
+        columns[f'{prefix}_sector_score'] = snapshot['sector_scores_df']['Sector_Score'].reindex(tickers)
+        columns[f'{prefix}_sector_rank'] = sector_rank.reindex(tickers)
+        columns[f'{prefix}_sector'] = global_scores_df['Sector'].reindex(tickers)
+    df = pd.DataFrame(columns, index=tickers)
+    df['delta'] = df['new_score'] - df['old_score']
+    return df
+
+
+def _records(df, columns):
+    # Compact JSON rows: [ticker, values...], NaN written as null
+    values = df[columns].astype(object).where(df[columns].notna(), None).to_numpy().tolist()
+    return [[ticker] + [round(v, 2) if isinstance(v, float) else v for v in row] for ticker, row in zip(df.index, values)]
+
+
+def top_changes(aligned, top_n=TOP_N):
+    """
+    Returns the tickers that entered and left the top_n overall and the top_n of every sector.
+    """
+    in_old, in_new = aligned['old_rank'] <= top_n, aligned['new_rank'] <= top_n
+    changes = {
+        'entered': aligned.loc[in_new & ~in_old].sort_values('new_rank').index.tolist(),
+        'left': aligned.loc[in_old & ~in_new].sort_values('old_rank').index.tolist(),
+        'sector_entered': {},
+        'sector_left': {},
+    }
+    in_old, in_new = aligned['old_sector_rank'] <= top_n, aligned['new_sector_rank'] <= top_n
+    # A ticker that changed sector enters the top of its new sector and leaves the top of the old one
+    same_sector = aligned['old_sector'] == aligned['new_sector']
+    entered = aligned.loc[in_new & ~(in_old & same_sector)].sort_values('new_sector_rank')
+    left = aligned.loc[in_old & ~(in_new & same_sector)].sort_values('old_sector_rank')
+    for sector, group in entered.groupby('new_sector', sort=True):
+        changes['sector_entered'][sector] = group.index.tolist()
+    for sector, group in left.groupby('old_sector', sort=True):
+        changes['sector_left'][sector] = group.index.tolist()
+    return changes
+
+
+def check_alert_rule(expression, snapshot):
+    """
+    Compiles the filter of an alert rule against the stocks of a snapshot, with the types of its
+    columns. Raises ValueError if the filter is invalid: such rules must not be saved.
+    """
+    stocks_df = snapshot['stocks_df']
+    return compile_filter(expression, stocks_df.columns, text_columns(stocks_df))
+
+
+def _rule_masks(snapshot, compiled_rules):
+    """
+    Evaluates compiled rules over a snapshot, all against its filter index so that the conditions
+    shared by several rules are computed once. Rules using columns missing from the snapshot, or
+    that cannot be evaluated over it, never match.
+
+    Returns:
+    - A boolean array, rows of the stocks_df of the snapshot x rules.
+    """
+    stocks_df = snapshot['stocks_df']
+    masks = np.zeros((len(stocks_df), len(compiled_rules)), dtype=bool)
+    for j, (compiled, columns) in enumerate(compiled_rules):
+        if compiled is not None and set(columns) <= set(stocks_df.columns):
+            try:
+                masks[:, j] = evaluate_filter(compiled, stocks_df, snapshot['filter_index'])
+            except ValueError as e:
+                # e.g. a column that was text in this version: the rule never matches, the other rules still run
+                print(f"Could not evaluate an alert rule: {e}")
+    return masks
+
+
+def evaluate_alerts(old, new, rules):
+    """
+    Evaluates the alert rules of all the users in one batched pass over each snapshot.
+
+    Returns:
+    - The list of triggered alerts: user, rule name, filter and the tickers for which the filter
+      became true (it was false in the old version, or the ticker is new).
+    """
+    flat = [(user, rule) for user, user_rules in rules.items() for rule in user_rules]
+    compiled_rules = []
+    for user, rule in flat:
+        try:
+            compiled = check_alert_rule(rule['filter'], new)
+            compiled_rules.append((compiled, list(_node_columns(compiled))))
+        except ValueError as e:
+            print(f"Invalid alert rule '{rule.get('name')}' of {user}: {e}")
+            compiled_rules.append((None, []))
+
+    tickers = new['stocks_df'].index
+    new_masks = _rule_masks(new, compiled_rules)
+    old_masks = _rule_masks(old, compiled_rules)
+    # Rows of the new tickers in the old version; the tickers that are new were false before
+    positions = old['stocks_df'].index.get_indexer(tickers)
+    old_masks = np.where((positions >= 0)[:, None], old_masks[positions], False)
+    became_true = new_masks & ~old_masks
+
+    alerts = []
+    for j, (user, rule) in enumerate(flat):
+        triggered = tickers[became_true[:, j]]
+        if rule.get('tickers'):
+            triggered = triggered[triggered.isin(rule['tickers'])]
+        if len(triggered):
+            alerts.append({'user': user, 'rule': rule.get('name', rule['filter']), 'filter': rule['filter'], 'tickers': triggered.tolist()})
+    return alerts
+
+
+def diff_snapshots(old, new, rules=None, top_n=TOP_N, threshold=SCORE_MOVE_THRESHOLD):
+    """
+    Computes the changes between two snapshots.
+
+    Parameters:
+    - old, new: The snapshots of the two dataset versions.
+    - rules: The alert rules of all the users (see load_alert_rules).
+    - top_n: The size of the top lists, overall and per sector.
+    - threshold: The Overall_Score move (in points) above which a ticker is reported.
+
+    Returns:
+    - A change log entry (JSON serializable): the tickers that entered/left the top lists, the score
+      moves ([ticker, old score, new score, delta, old rank, new rank]), the added and removed tickers
+      and the triggered alerts.
+    """
+    aligned = align_versions(old, new)
+    moves = aligned.loc[aligned['delta'].abs() >= threshold]
+    moves = moves.loc[moves['delta'].abs().sort_values(ascending=False).index]
+    entry = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'from_version': old.get('version'),
+        'to_version': new.get('version'),
+        'top_n': top_n,
+        'threshold': threshold,
+        **top_changes(aligned, top_n),
+        'score_moves': _records(moves, ['old_score', 'new_score', 'delta', 'old_rank', 'new_rank']),
+        'added': aligned.index[aligned['old_score'].isna() & aligned['new_score'].notna()].tolist(),
+        'removed': aligned.index[aligned['new_score'].isna() & aligned['old_score'].notna()].tolist(),
+        'alerts': evaluate_alerts(old, new, rules or {}),
+    }
+    return entry
+
+
+def append_change_log(entry, file_name=CHANGE_LOG_FILE):
+    os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+    with open(file_name, "a") as f:
+        f.write(json.dumps(entry, separators=(',', ':')) + "\n")
+
+
+def read_change_log(file_name=CHANGE_LOG_FILE, last=10):
+    """
+    Returns the last entries of the change log, most recent first. Only the last lines are parsed.
+    """
+    if not os.path.exists(file_name):
+        return []
+    with open(file_name, "r") as f:
+        lines = deque(f, maxlen=last)
+    return [json.loads(line) for line in reversed(lines)]
+
+
+def format_entry(entry):
+    """
+    Formats a change log entry as text, for the CLI.
+    """
+    lines = [f"{entry['time']}: {entry['from_version']} -> {entry['to_version']}"]
+    lines.append(f"  Entered the top {entry['top_n']}: {', '.join(entry['entered']) or '-'}")
+    lines.append(f"  Left the top {entry['top_n']}: {', '.join(entry['left']) or '-'}")
+    for sector in sorted(set(entry['sector_entered']) | set(entry['sector_left'])):
+        lines.append(f"  {sector}: +{', '.join(entry['sector_entered'].get(sector, [])) or '-'} "
+                     f"/ -{', '.join(entry['sector_left'].get(sector, [])) or '-'}")
+    lines.append(f"  Overall_Score moves of {entry['threshold']} points or more: {len(entry['score_moves'])}")
+    for ticker, old_score, new_score, delta, old_rank, new_rank in entry['score_moves'][:10]:
+        lines.append(f"    {ticker}: {old_score} -> {new_score} ({delta:+}), rank {old_rank} -> {new_rank}")
+    if entry['added'] or entry['removed']:
+        lines.append(f"  Added: {len(entry['added'])}, removed: {len(entry['removed'])}")
+    for alert in entry['alerts']:
+        lines.append(f"  Alert '{alert['rule']}' of {alert['user']} ({alert['filter']}): {', '.join(alert['tickers'][:20])}")
+    return "\n".join(lines)
+
+
+def self_check():
+    """
+    Diffs two synthetic dataset versions (moved metrics, added and removed tickers, changed sectors)
+    and checks the entry against a ticker by ticker reference.
+    """
+    import time
+    from benchmarks.synthetic import make_universe
+    from scoring_functions import load_scores
+    from snapshot import build_snapshot
+
+    with open("./metrics_config/default_metrics.json", 'r') as f:
+        metrics = json.load(f)
+    rng = np.random.default_rng(4)
+    old_df = make_universe(5000, seed=4).set_index('Ticker')
+    new_df = old_df.copy()
+    # The metrics of 300 tickers are replaced by those of other stocks, the DCF Ratio of all of them moves
+    numeric = new_df.select_dtypes(include='number').columns
+    new_df.loc[new_df.index[100:400], numeric] = make_universe(300, seed=6).loc[:, numeric].to_numpy()
+    new_df['DCF Ratio'] = new_df['DCF Ratio'] * rng.lognormal(0.0, 0.3, size=len(new_df))
+    new_df.loc[new_df.index[:25], 'Sector'] = new_df['Sector'].iloc[25:50].to_numpy()
+    new_df = pd.concat([new_df.iloc[40:], make_universe(5030, seed=5).set_index('Ticker').iloc[5000:]])
+    old, new = (build_snapshot(version, df, *load_scores(df, metrics, return_merged=False), metrics)
+                for version, df in [('old', old_df), ('new', new_df)])
+    rules = {
+        'alice': [{'name': 'Cheap', 'filter': 'DCF Ratio < 1'}, {'name': 'Quality', 'filter': 'ROE > 2 and DCF Ratio < 1.5'}],
+        'bob': [{'name': 'Watch', 'filter': 'DCF Ratio < 1', 'tickers': new_df.index[:300].tolist()},
+                {'name': 'Broken', 'filter': 'Unknown Column > 1'}, {'name': 'Mistyped', 'filter': 'Sector < 5'}],
+    }
+
+    start = time.perf_counter()
+    entry = diff_snapshots(old, new, rules, top_n=20, threshold=5.0)
+    print(f"Diffed {len(old_df)} -> {len(new_df)} tickers with {sum(map(len, rules.values()))} rules in "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms, {len(json.dumps(entry))} bytes")
+
+    # Reference: rank by rank, ticker by ticker
+    def top(snapshot, column, sector=None):
+        df = snapshot['global_scores_df' if column == 'Overall_Score' else 'sector_scores_df']
+        df = df if sector is None else df.loc[df['Sector'] == sector]
+        return set(df.index[df[column].rank(ascending=False, method='min') <= 20])
+    assert set(entry['entered']) == top(new, 'Overall_Score') - top(old, 'Overall_Score')
+    assert set(entry['left']) == top(old, 'Overall_Score') - top(new, 'Overall_Score')
+    for sector in set(old_df['Sector']) | set(new_df['Sector']):
+        assert set(entry['sector_entered'].get(sector, [])) == top(new, 'Sector_Score', sector) - top(old, 'Sector_Score', sector)
+        assert set(entry['sector_left'].get(sector, [])) == top(old, 'Sector_Score', sector) - top(new, 'Sector_Score', sector)
+    old_scores, new_scores = old['global_scores_df']['Overall_Score'], new['global_scores_df']['Overall_Score']
+    moved = {t for t in old_scores.index.intersection(new_scores.index) if abs(new_scores[t] - old_scores[t]) >= 5.0}
+    assert {row[0] for row in entry['score_moves']} == moved
+    assert set(entry['added']) == set(new_df.index) - set(old_df.index)
+    assert set(entry['removed']) == set(old_df.index) - set(new_df.index)
+    for alert in entry['alerts']:
+        rule = next(r for r in rules[alert['user']] if r['name'] == alert['rule'])
+        now = set(new_df.query(rule['filter'].replace('DCF Ratio', '`DCF Ratio`')).index)
+        before = set(old_df.query(rule['filter'].replace('DCF Ratio', '`DCF Ratio`')).index)
+        expected = (now - before) & set(rule.get('tickers') or new_df.index)
+        assert set(alert['tickers']) == expected, alert['rule']
+    assert {(a['user'], a['rule']) for a in entry['alerts']} == {('alice', 'Cheap'), ('alice', 'Quality'), ('bob', 'Watch')}
+    # A rule failing over a snapshot never matches, without stopping the others
+    untyped = compile_filter('Sector < 5', new_df.columns)
+    masks = _rule_masks(new, [(untyped, ['Sector']), (check_alert_rule('DCF Ratio < 1', new), ['DCF Ratio'])])
+    assert not masks[:, 0].any() and masks[:, 1].sum() == (new_df['DCF Ratio'] < 1).sum()
+    print(f"{len(entry['entered'])} entered and {len(entry['left'])} left the top 20, {len(moved)} score moves, "
+          f"{sum(len(a['tickers']) for a in entry['alerts'])} alerts: the entry matches the reference")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["show", "diff", "self-check"])
+    parser.add_argument("snapshots", nargs="*", help="'diff': the old and the new snapshot files")
+    parser.add_argument("--log", default=CHANGE_LOG_FILE)
+    parser.add_argument("--last", type=int, default=1, help="'show': number of entries")
+    parser.add_argument("--rules", default=ALERT_RULES_FILE)
+    parser.add_argument("--top", type=int, default=TOP_N)
+    parser.add_argument("--threshold", type=float, default=SCORE_MOVE_THRESHOLD)
+    parser.add_argument("--append", action="store_true", help="'diff': append the entry to the change log")
+    args = parser.parse_args()
+
+    if args.command == "self-check":
+        self_check()
+
+    elif args.command == "show":
+        entries = read_change_log(args.log, args.last)
+        if not entries:
+            print(f"No changes logged in {args.log}")
+        for entry in entries:
+            print(format_entry(entry))
+    else:
+        from snapshot import load_snapshot
+
+        if len(args.snapshots) != 2:
+            parser.error("'diff' needs the old and the new snapshot files")
+        old, new = (load_snapshot(file_name) for file_name in args.snapshots)
+        if old is None or new is None:
+            parser.error("Could not load the snapshots (missing file or older format)")
+        entry = diff_snapshots(old, new, load_alert_rules(args.rules), args.top, args.threshold)
+        print(format_entry(entry))
+        if args.append:
+            append_change_log(entry, args.log)
@@ -0,0 +1,183 @@
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Red-to-green colormap used for the score tables, equivalent to
+# LinearSegmentedColormap.from_list('redgreen', ['red', 'green']) but without importing matplotlib.
+RED = (1.0, 0.0, 0.0)
+GREEN = (0.0, 128 / 255, 0.0)
+N_COLORS = 256
+TEXT_COLOR_THRESHOLD = 0.408
+
+
+def _relative_luminance(rgb):
+    channels = [c / 12.92 if c <= 0.03928 else ((c + 0.055) / 1.055) ** 2.4 for c in rgb]
+    return 0.2126 * channels[0] + 0.7152 * channels[1] + 0.0722 * channels[2]
+
+
+def _build_gradient_css():
+    css = []
+    for i in range(N_COLORS):
+        t = i / (N_COLORS - 1)
+        rgb = tuple(a + (b - a) * t for a, b in zip(RED, GREEN))
+        hex_color = '#' + ''.join(f"{int(round(c * 255)):02x}" for c in rgb)
+        text_color = '#f1f1f1' if _relative_luminance(rgb) < TEXT_COLOR_THRESHOLD else '#000000'
+        css.append(f"background-color: {hex_color};color: {text_color};")
+    return np.array(css + [''], dtype=object)
+
+
+GRADIENT_CSS = _build_gradient_css()
+
+
+def gradient_css(values, vmin=0, vmax=100):
+    """
+    Maps an array of values to red-to-green background css strings (NaNs are left unstyled).
+    """
+    values = np.asarray(values, dtype=float)
+    normalized = np.clip((values - vmin) / (vmax - vmin), 0.0, 1.0)
+    idx = np.minimum((np.nan_to_num(normalized) * N_COLORS).astype(int), N_COLORS - 1)
+    idx[np.isnan(values)] = N_COLORS
+    return GRADIENT_CSS[idx]
+
+
+def number_format(df):
+    return {col: "{:,.2f}" for col in df.select_dtypes(include='number').columns}
+
+
+def score_styles(df, vmin=0, vmax=100):
+    """
+    Returns the gradient css of the numeric columns of df. Only the rows of df are styled, so pass
+    the slice that is actually displayed.
+    """
+    numeric_columns = df.select_dtypes(include='number').columns
+    return df.loc[:, numeric_columns].apply(lambda col: gradient_css(col.to_numpy(), vmin, vmax))
+
+
+def style_table(df, styles=None):
+    styler = df.style.format(number_format(df))
+    if styles is not None:
+        styler = styler.apply(lambda _: styles, axis=None, subset=styles.columns)
+    return styler
+
+
+def style_scores(df, vmin=0, vmax=100):
+    """
+    Styles a scores table with the red-to-green gradient on its numeric columns and two decimals formatting.
+    """
+    return style_table(df, score_styles(df, vmin, vmax))
+
+
+### PAGINATION
+
+def build_sorted_index(df, sort_column=None, ascending=False, group_column='Sector'):
+    """
+    Precomputes the row positions of df sorted by sort_column (original order if None), for 'All'
+    and for each value of group_column, together with the columns that are not empty in each group.
+
+    Returns:
+    - A dictionary with 'order' (group -> sorted row positions) and 'columns' (group -> non empty columns).
+    """
+    if sort_column is None:
+        order = np.arange(len(df))
+    else:
+        order = df[sort_column].reset_index(drop=True).sort_values(
+            ascending=ascending, kind='stable', na_position='last'
+        ).index.to_numpy()
+
+    codes, groups = pd.factorize(df[group_column])
+    codes_in_order = codes[order]
+    index = {'order': {'All': order}, 'columns': {}}
+    for code, group in enumerate(groups):
+        index['order'][group] = order[codes_in_order == code]
+
+    not_empty = df.notna()
+    index['columns']['All'] = list(df.columns[not_empty.any().to_numpy()])
+    for group, row in not_empty.groupby(codes).any().iterrows():
+        if group >= 0:
+            index['columns'][groups[group]] = list(df.columns[row.to_numpy()])
+    return index
+
+
+def select_rows(index, selection):
+    """
+    Returns the sorted row positions and the non empty columns for a selection of groups (['All'] or a list of sectors).
+    """
+    if 'All' in selection:
+        return index['order']['All'], index['columns']['All']
+    selected = [g for g in selection if g in index['order']]
+    if len(selected) == 1:
+        return index['order'][selected[0]], index['columns'][selected[0]]
+
+    order = index['order']['All']
+    in_selection = np.zeros(len(order), dtype=bool)
+    for group in selected:
+        in_selection[index['order'][group]] = True
+    columns = set().union(*[index['columns'][g] for g in selected])
+    return order[in_selection[order]], [c for c in index['columns']['All'] if c in columns]
+
+
+def n_pages(n_rows, page_size):
+    return max(1, -(-n_rows // page_size))
+
+
+def get_cached(cache, key, compute, max_size=64):
+    """
+    Small LRU helper: returns cache[key], computing and storing it first if missing.
+    """
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    value = compute()
+    cache[key] = value
+    if len(cache) > max_size:
+        cache.popitem(last=False)
+    return value
+
+
+def new_table_cache(indexes=None):
+    """
+    Creates a table cache, optionally seeded with precomputed indexes ({table: (sort_column, ascending, index)}).
+    """
+    cache = OrderedDict()
+    for table, (sort_column, ascending, index) in (indexes or {}).items():
+        cache[(table, 'index', sort_column, ascending)] = index
+    return cache
+
+
+def paginated_table(df, table, cache, sort_column=None, ascending=False, selection=('All',), page_size=15, styles=None, row_mask=None, mask_key=None):
+    """
+    Renders one page of df with streamlit. Only the rows of the visible page are sliced, formatted and
+    styled; sorted indexes, selections and styled pages are cached in cache, keyed by
+    (page, sort, selection), so that reruns do not depend on the size of df.
+
+    Parameters:
+    - df: The DataFrame to display.
+    - table: A name for the table, used for the cache and the widget keys.
+    - cache: The cache returned by new_table_cache; reset it whenever df changes.
+    - sort_column, ascending: Ordering of the rows (original order if sort_column is None).
+    - selection: ['All'] or a list of sectors.
+    - page_size: Number of rows per page.
+    - styles: Optional function returning the css of a page (e.g. score_styles).
+    - row_mask, mask_key: Optional boolean array of the rows to keep, and a hashable key identifying it in the cache.
+    """
+    import streamlit as st
+
+    selection = tuple(selection)
+    index = get_cached(cache, (table, 'index', sort_column, ascending), lambda: build_sorted_index(df, sort_column, ascending))
+    positions, columns = get_cached(cache, (table, 'rows', sort_column, ascending, selection), lambda: select_rows(index, selection))
+    if row_mask is not None:
+        positions = get_cached(cache, (table, 'rows', sort_column, ascending, selection, mask_key), lambda: positions[row_mask[positions]])
+
+    pages = n_pages(len(positions), page_size)
+    col_1, col_2, _ = st.columns((2, 3, 9))
+    with col_1:
+        page = min(st.number_input("Page", min_value=1, value=1, step=1, key=f"{table}_page"), pages) - 1
+    with col_2:
+        st.caption(f"Page {page + 1} of {pages} ({len(positions)} rows)")
+
+    def compute_page():
+        page_df = df.iloc[positions[page * page_size:(page + 1) * page_size]].loc[:, columns]
+        return page_df, styles(page_df) if styles is not None else None
+
+    page_df, page_styles = get_cached(cache, (table, 'page', sort_column, ascending, selection, mask_key, page, page_size), compute_page)
+    st.dataframe(style_table(page_df, page_styles))